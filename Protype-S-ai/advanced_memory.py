@@ -1,24 +1,109 @@
 
 import os
+import re
 import time
 import json
-import pickle
+import queue
+import threading
 import numpy as np
 from datetime import datetime
 import torch
 from transformers import AutoTokenizer, AutoModel
 import faiss
+import memory_index
+from memory_index import EMBEDDING_DIM, INDEX_TYPE
+from embedding_cache import EmbeddingCache
+from memory_metadata import MemoryMetadataStore, MEMORY_METADATA_PATH
 
 # Configure FAISS and embeddings
 USE_GPU = torch.cuda.is_available()
-EMBEDDING_DIM = 384  # Using BERT embeddings dimension
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_MAX_LENGTH = 512
+
+# Background ingest: flush after this many items or this many seconds
+INGEST_MAX_BATCH = 64
+INGEST_MAX_DELAY = 0.5
+
+# Answers are indexed as overlapping passages of this many words
+PASSAGE_WORDS = int(os.environ.get('MEMORY_PASSAGE_WORDS', 120))
+PASSAGE_OVERLAP = int(os.environ.get('MEMORY_PASSAGE_OVERLAP', 30))
+
+# Passages indexed per answer, so long articles do not crowd the index; longer answers keep evenly spaced ones
+MAX_PASSAGES = int(os.environ.get('MEMORY_MAX_PASSAGES', 16))
+
+# Passage search reranks this many candidates per passage returned
+PASSAGE_FETCH_FACTOR = 4
+
+# Maximal marginal relevance trade-off: 1.0 ranks by relevance alone, lower values favour diversity
+MMR_LAMBDA = float(os.environ.get('MEMORY_MMR_LAMBDA', 0.7))
+
+# Words of answer text get_rag_context may quote
+RAG_TOKEN_BUDGET = int(os.environ.get('RAG_TOKEN_BUDGET', 400))
+
+def split_passages(text, words=PASSAGE_WORDS, overlap=PASSAGE_OVERLAP, max_passages=MAX_PASSAGES):
+    """(start, end) character spans of overlapping windows of words over text.
+    
+    Past max_passages windows, evenly spaced ones are kept (the first and
+    last included), so every part of a long answer stays searchable.
+    """
+    spans = [match.span() for match in re.finditer(r"\S+", text or "")]
+    if not spans:
+        return [(0, 0)]
+    passages = []
+    for first in range(0, len(spans), max(1, words - overlap)):
+        last = min(first + words, len(spans)) - 1
+        passages.append((spans[first][0], spans[last][1]))
+        if last == len(spans) - 1:
+            break
+    if len(passages) > max_passages:
+        passages = [passages[i] for i in np.linspace(0, len(passages) - 1, max(1, max_passages)).round().astype(int)]
+    return passages
+
+def merge_spans(spans):
+    """Sorted (start, end) spans with overlapping and touching ones joined"""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def mmr(query_vector, vectors, k, mmr_lambda=MMR_LAMBDA):
+    """Rows of vectors picked by maximal marginal relevance to query_vector.
+    
+    Each pick maximises mmr_lambda * similarity to the query minus
+    (1 - mmr_lambda) * the highest similarity to a row already picked,
+    using cosine similarity throughout.
+    """
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-9)
+    relevance = vectors @ (query_vector / max(np.linalg.norm(query_vector), 1e-9))
+    redundancy = np.zeros(len(vectors))
+    picked = []
+    while len(picked) < min(k, len(vectors)):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[picked] = -np.inf
+        best = int(np.argmax(scores))
+        similarity = vectors @ vectors[best]
+        redundancy = np.maximum(redundancy, similarity) if picked else similarity
+        picked.append(best)
+    return picked
 
 class AdvancedMemory:
-    def __init__(self):
+    def __init__(self, index_type=INDEX_TYPE, metadata_path=MEMORY_METADATA_PATH):
         self.index = None
-        self.metadata = {}
+        self.index_type = index_type
+        self.metadata = MemoryMetadataStore(metadata_path)  # entries and their passages; FAISS ids are passage ids
+        self.next_id = 0
+        self.next_passage_id = 0
+        self.on_gpu = False
         self.tokenizer = None
         self.model = None
+        self.embedding_cache = None
+        self._lock = threading.RLock()
+        self._ingest_queue = queue.Queue()
+        self._ingest_thread = None
         self.initialize_embeddings()
         self.initialize_index()
         
@@ -27,7 +112,7 @@ class AdvancedMemory:
         try:
             print("Loading embedding model...")
             # Using a smaller model for efficiency while maintaining quality
-            model_name = "sentence-transformers/all-MiniLM-L6-v2"
+            model_name = EMBEDDING_MODEL_NAME
             self.tokenizer = AutoTokenizer.from_pretrained(model_name)
             self.model = AutoModel.from_pretrained(model_name)
             
@@ -41,56 +126,159 @@ class AdvancedMemory:
             print(f"Error loading embedding model: {e}")
             self.tokenizer = None
             self.model = None
+            return
+            
+        try:
+            # Identical texts are embedded once, across restarts
+            self.embedding_cache = EmbeddingCache(model_name=EMBEDDING_MODEL_NAME)
+        except Exception as e:
+            print(f"Error opening embedding cache: {e}")
+            self.embedding_cache = None
     
     def initialize_index(self):
         """Initialize FAISS index or load existing one"""
-        if os.path.exists('memory_index.faiss') and os.path.exists('memory_metadata.pkl'):
+        self.metadata.import_pickle()
+        self.index = None
+        upgraded = False
+        checkpoint = self.metadata.get_state('checkpoint', {})
+        
+        if os.path.exists('memory_index.faiss'):
             try:
-                # Load existing index
-                self.index = faiss.read_index('memory_index.faiss')
-                
-                # Load metadata
-                with open('memory_metadata.pkl', 'rb') as f:
-                    self.metadata = pickle.load(f)
-                
+                # Load existing index (memory-mapped when possible)
+                self.index = memory_index.read_index('memory_index.faiss')
                 print(f"Loaded existing memory index with {self.index.ntotal} entries")
                 
-                # Move index to GPU if available
-                if USE_GPU and self.index.ntotal > 0:
-                    res = faiss.StandardGpuResources()
-                    self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
-                
-                return
+                # Switch to the configured index type if it differs
+                if memory_index.needs_upgrade(self.index, self.index_type):
+                    self.index = memory_index.rebuild_index(self.index, self.index_type)
+                    upgraded = True
             except Exception as e:
                 print(f"Error loading existing index: {e}")
+                self.index = None
+            
+            if self.index is not None and self.index.ntotal and 'next_passage_id' not in checkpoint:
+                # Saved when whole answers were indexed; embed the passages again
+                print("Memory index predates passage indexing; rebuilding it from metadata")
+                self.index = None
+        
+        if self.index is None:
+            # Create new index
+            try:
+                self.index = memory_index.create_index(self.index_type)
+                print(f"Created new FAISS index ({memory_index.index_kind(self.index)})")
+            except Exception as e:
+                print(f"Error creating FAISS index: {e}")
+                return
+        
+        self.next_id = max(self.metadata.max_id() + 1, checkpoint.get('next_id', 0))
+        self.next_passage_id = max(self.metadata.max_passage_id() + 1, checkpoint.get('next_passage_id', 0))
+        if not self.reconcile() and upgraded:
+            self.save_index()
+        self.move_to_gpu()
+    
+    def reconcile(self):
+        """Bring the index and metadata back in line after an interrupted save.
+        
+        Index entries without a passage are dropped; entries not yet split
+        (migrated ones) are split, and passages missing from the index (added
+        after the last checkpoint) are embedded again.
+        """
+        if not self.metadata.exists() and self.index.ntotal == 0:
+            return False
         
-        # Create new index
         try:
-            self.index = faiss.IndexFlatL2(EMBEDDING_DIM)
-            self.metadata = {}
-            print("Created new FAISS index")
+            self.split_entries(self.metadata.unsplit_ids())
+            index_ids = set(memory_index.get_ids(self.index).tolist())
+            passage_ids = set(self.metadata.passage_ids())
+            orphaned = index_ids - passage_ids
+            missing = sorted(passage_ids - index_ids)
+            if not orphaned and not missing:
+                return False
             
-            # Move index to GPU if available
-            if USE_GPU:
-                res = faiss.StandardGpuResources()
-                self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
+            if orphaned:
+                self.ensure_writable()
+                self.index = memory_index.remove_ids(self.index, orphaned)
+            if missing and self.model is not None:
+                passages = self.load_passages(missing)
+                ids = np.array(list(passages), dtype='int64')
+                self.ensure_writable()
+                self.index.add_with_ids(self.embed_entries(
+                    [{'question': passage['entry']['question'], 'answer': passage['text']}
+                     for passage in passages.values()]), ids)
+            elif missing:
+                print(f"{len(missing)} memory passages are not indexed; embedding model unavailable")
+                
+            print(f"Reconciled memory index: dropped {len(orphaned)}, re-indexed {len(missing) if self.model is not None else 0}")
+            return self.save_index()
         except Exception as e:
-            print(f"Error creating FAISS index: {e}")
+            print(f"Error reconciling memory index: {e}")
+            return False
+    
+    def split_entries(self, entry_ids):
+        """Record passages for stored entries that have none"""
+        entries = self.metadata.get_many(entry_ids)
+        passages = {}
+        with self._lock:
+            for entry_id, entry in entries.items():
+                for position, (start, end) in enumerate(split_passages(entry['answer'])):
+                    passages[self.next_passage_id] = (entry_id, position, start, end)
+                    self.next_passage_id += 1
+        if passages:
+            self.metadata.add_passages(passages)
+        return len(passages)
+    
+    def load_passages(self, passage_ids):
+        """{passage id: passage} with its entry and text, for the ids that exist"""
+        spans = self.metadata.get_passages(passage_ids)
+        entries = self.metadata.get_many({span[0] for span in spans.values()})
+        passages = {}
+        for passage_id, (entry_id, position, start, end) in spans.items():
+            entry = entries.get(entry_id)
+            if entry is not None:
+                passages[passage_id] = {'entry_id': entry_id, 'position': position, 'start': start, 'end': end,
+                                        'entry': entry, 'text': (entry['answer'] or '')[start:end]}
+        return passages
+    
+    def move_to_gpu(self):
+        """Move a flat index to GPU if available; graph and IVF-PQ indexes stay on CPU"""
+        if USE_GPU and not self.on_gpu and memory_index.index_kind(self.index) == 'flat':
+            res = faiss.StandardGpuResources()
+            self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
+            self.on_gpu = True
+    
+    def cpu_index(self):
+        """Return a CPU copy of the index for saving or rebuilding"""
+        if self.on_gpu:
+            return faiss.index_gpu_to_cpu(self.index)
+        return self.index
+    
+    def ensure_writable(self):
+        """Fully load a memory-mapped index before modifying it"""
+        if memory_index.is_read_only(self.index):
+            self.index = memory_index.read_index('memory_index.faiss', mmap=False)
+    
+    def rebuild_index(self, index_type=None):
+        """Rebuild the index as index_type, training on the stored vectors"""
+        index_type = index_type or self.index_type
+        self.index = memory_index.rebuild_index(self.cpu_index(), index_type)
+        self.on_gpu = False
+        self.move_to_gpu()
+        print(f"Rebuilt memory index as {memory_index.index_kind(self.index)} with {self.index.ntotal} entries")
+        return self.save_index()
     
     def save_index(self):
-        """Save the FAISS index and metadata to disk"""
+        """Checkpoint the FAISS index together with the metadata store"""
         try:
-            # Move index to CPU if it's on GPU
-            if USE_GPU:
-                index_cpu = faiss.index_gpu_to_cpu(self.index)
-            else:
-                index_cpu = self.index
-                
-            # Save index and metadata
-            faiss.write_index(index_cpu, 'memory_index.faiss')
-            
-            with open('memory_metadata.pkl', 'wb') as f:
-                pickle.dump(self.metadata, f)
+            with self._lock:
+                # Metadata rows are already committed as they are added
+                self.metadata.flush_access()
+                memory_index.write_index(self.cpu_index(), 'memory_index.faiss')
+                self.metadata.set_state('checkpoint', {
+                    'next_id': self.next_id,
+                    'next_passage_id': self.next_passage_id,
+                    'ntotal': self.index.ntotal,
+                    'time': time.time()
+                })
                 
             print(f"Saved memory index with {self.index.ntotal} entries")
             return True
@@ -100,110 +288,290 @@ class AdvancedMemory:
     
     def get_embedding(self, text):
         """Get embedding for text using the model"""
+        return self.get_embeddings([text])[0]
+    
+    def get_embeddings(self, texts, batch_size=EMBEDDING_BATCH_SIZE):
+        """Embed many texts at once.
+        
+        Cached texts are skipped; the rest are sorted by length so each padded
+        batch holds similar-sized inputs, and token vectors are mean-pooled
+        over the attention mask so padding does not dilute the embedding.
+        """
         if self.tokenizer is None or self.model is None:
             raise ValueError("Embedding model not initialized")
-            
-        # Tokenize and prepare for model
-        inputs = self.tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
         
-        # Move to GPU if available
-        if USE_GPU:
-            inputs = {k: v.cuda() for k, v in inputs.items()}
+        vectors = self.embedding_cache.get_many(texts) if self.embedding_cache else {}
+        pending = sorted({text for text in texts if text not in vectors}, key=len)
         
-        # Get embeddings
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        computed = {}
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            
+            # Tokenize and prepare for model
+            inputs = self.tokenizer(batch, return_tensors="pt", padding=True, truncation=True,
+                                    max_length=EMBEDDING_MAX_LENGTH)
+            
+            # Move to GPU if available
+            if USE_GPU:
+                inputs = {k: v.cuda() for k, v in inputs.items()}
             
-        # Use mean of last hidden state as embedding
-        embeddings = outputs.last_hidden_state.mean(dim=1)
+            # Get embeddings
+            with torch.no_grad():
+                outputs = self.model(**inputs)
+            
+            # Mean of last hidden state over real (non-padding) tokens
+            mask = inputs["attention_mask"].unsqueeze(-1).to(outputs.last_hidden_state.dtype)
+            summed = (outputs.last_hidden_state * mask).sum(dim=1)
+            embeddings = summed / mask.sum(dim=1).clamp(min=1e-9)
+            
+            for text, embedding in zip(batch, embeddings.cpu().numpy().astype('float32')):
+                computed[text] = embedding
+        
+        if computed and self.embedding_cache:
+            self.embedding_cache.put_many(computed)
+        vectors.update(computed)
         
-        # Convert to numpy array
-        return embeddings[0].cpu().numpy()
+        return np.vstack([vectors[text] for text in texts]).astype('float32')
     
     def add_knowledge(self, question, answer, source="system", metadata=None):
         """Add knowledge to the memory index"""
+        return self.add_knowledge_batch([{
+            'question': question,
+            'answer': answer,
+            'source': source,
+            'metadata': metadata
+        }]) == 1
+    
+    def add_knowledge_batch(self, items):
+        """Add many knowledge items with one batched embedding pass.
+        
+        items are dicts with 'question' and 'answer' and optional 'source'
+        and 'metadata'. Each answer is indexed as overlapping passages,
+        embedded with the question. Returns the number of items added.
+        """
+        if not items:
+            return 0
         if self.index is None:
             self.initialize_index()
             
         try:
-            # Get embeddings for question and answer
-            question_embedding = self.get_embedding(question)
-            answer_embedding = self.get_embedding(answer)
+            spans = [split_passages(item['answer']) for item in items]
+            combined = self.embed_entries([
+                {'question': item['question'], 'answer': (item['answer'] or '')[start:end]}
+                for item, item_spans in zip(items, spans) for start, end in item_spans
+            ])
             
-            # Combine embeddings (simple average)
-            combined_embedding = (question_embedding + answer_embedding) / 2
-            combined_embedding = np.array([combined_embedding.astype('float32')])
-            
-            # Add to index
-            self.index.add(combined_embedding)
-            
-            # Store metadata
-            index_id = self.index.ntotal - 1
-            self.metadata[index_id] = {
-                'question': question,
-                'answer': answer,
-                'source': source,
-                'timestamp': time.time(),
-                'access_count': 0,
-                'additional': metadata or {}
-            }
-            
-            # Periodically save index
-            if self.index.ntotal % 10 == 0:
-                self.save_index()
+            with self._lock:
+                ids = np.arange(self.next_id, self.next_id + len(items), dtype='int64')
+                self.next_id += len(items)
+                passage_ids = np.arange(self.next_passage_id, self.next_passage_id + len(combined), dtype='int64')
+                self.next_passage_id += len(combined)
+                positions = [(int(index_id), position, start, end)
+                             for index_id, item_spans in zip(ids, spans)
+                             for position, (start, end) in enumerate(item_spans)]
                 
-            return True
+                # Store metadata first so an unsaved index can be rebuilt from it
+                now = time.time()
+                self.metadata.add_many({
+                    int(index_id): {
+                        'question': item['question'],
+                        'answer': item['answer'],
+                        'source': item.get('source', 'system'),
+                        'timestamp': now,
+                        'access_count': 0,
+                        'additional': item.get('metadata') or {}
+                    }
+                    for index_id, item in zip(ids, items)
+                }, dict(zip(passage_ids.tolist(), positions)))
+                
+                # Add to index under stable ids
+                self.ensure_writable()
+                previous_total = self.index.ntotal
+                self.index.add_with_ids(combined, passage_ids)
+                
+                # Train the configured ANN index once there are enough vectors
+                if memory_index.needs_upgrade(self.index, self.index_type):
+                    self.rebuild_index()
+                # Periodically save index (every 10 entries)
+                elif previous_total // 10 != self.index.ntotal // 10:
+                    self.save_index()
+                
+            return len(items)
         except Exception as e:
             print(f"Error adding knowledge to memory: {e}")
-            return False
+            return 0
+    
+    def embed_entries(self, entries):
+        """Combined question/answer (or passage) vectors for entries, in one embedding pass"""
+        questions = [entry['question'] for entry in entries]
+        answers = [entry['answer'] for entry in entries]
+        embeddings = self.get_embeddings(questions + answers)
+        
+        # Combine embeddings (simple average)
+        combined = (embeddings[:len(entries)] + embeddings[len(entries):]) / 2
+        return np.ascontiguousarray(combined, dtype='float32')
+    
+    def add_knowledge_async(self, question, answer, source="system", metadata=None):
+        """Queue knowledge for the background micro-batching worker"""
+        if self._ingest_thread is None or not self._ingest_thread.is_alive():
+            self._ingest_thread = threading.Thread(target=self.ingest_loop, daemon=True)
+            self._ingest_thread.start()
+            
+        self._ingest_queue.put({
+            'question': question,
+            'answer': answer,
+            'source': source,
+            'metadata': metadata
+        })
+    
+    def ingest_loop(self):
+        """Collect queued items into micro-batches and add them together"""
+        while True:
+            batch = [self._ingest_queue.get()]
+            deadline = time.monotonic() + INGEST_MAX_DELAY
+            while len(batch) < INGEST_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._ingest_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            try:
+                self.add_knowledge_batch(batch)
+            finally:
+                for _ in batch:
+                    self._ingest_queue.task_done()
+    
+    def flush(self):
+        """Block until all queued knowledge has been added"""
+        self._ingest_queue.join()
+    
+    def nearest_passages(self, query, n):
+        """Query vector and the n nearest passages, nearest first"""
+        query_embedding = np.array([self.get_embedding(query).astype('float32')])
+        distances, indices = self.index.search(query_embedding, n)
+        
+        # -1 means no result
+        passages = self.load_passages(idx for idx in indices[0] if idx != -1)
+        nearest = []
+        for distance, idx in zip(distances[0], indices[0]):
+            passage = passages.get(int(idx))
+            if passage is not None:
+                nearest.append(dict(passage, id=int(idx), similarity=1.0 - distance / 10.0))  # Normalize distance to similarity
+        return query_embedding[0], nearest
     
     def search(self, query, k=5):
-        """Search for similar knowledge in the memory"""
+        """Search for similar knowledge in the memory, one result per entry"""
+        if self.index is None or self.index.ntotal == 0:
+            return []
+            
+        try:
+            # An entry ranks by its best passage
+            _, nearest = self.nearest_passages(query, k * PASSAGE_FETCH_FACTOR)
+            
+            results = {}
+            for passage in nearest:
+                entry = passage['entry']
+                if passage['entry_id'] in results:
+                    continue
+                results[passage['entry_id']] = {
+                    'question': entry['question'],
+                    'answer': entry['answer'],
+                    'passage': passage['text'],
+                    'source': entry['source'],
+                    'similarity': passage['similarity'],
+                    'timestamp': entry['timestamp'],
+                    'metadata': entry['additional']
+                }
+                if len(results) == k:
+                    break
+            
+            # Access counts are written in batches
+            self.metadata.record_access(results)
+            
+            return list(results.values())
+        except Exception as e:
+            print(f"Error searching memory: {e}")
+            return []
+    
+    def search_passages(self, query, k=5, fetch_k=None, mmr_lambda=MMR_LAMBDA):
+        """Passages relevant to query, diversified with maximal marginal relevance.
+        
+        The fetch_k nearest passages are reranked so that each one picked is
+        close to the query and unlike those already picked. Results carry the
+        entry they belong to (entry_id, question, answer) and their span of it.
+        """
         if self.index is None or self.index.ntotal == 0:
             return []
             
         try:
-            # Get query embedding
-            query_embedding = self.get_embedding(query)
-            query_embedding = np.array([query_embedding.astype('float32')])
+            query_embedding, nearest = self.nearest_passages(query, fetch_k or k * PASSAGE_FETCH_FACTOR)
+            if not nearest:
+                return []
             
-            # Search index
-            distances, indices = self.index.search(query_embedding, k)
+            # The candidates' vectors are read back from the index; IVF-PQ ones are embedded again (cached)
+            vectors = memory_index.reconstruct_ids(self.index, [passage['id'] for passage in nearest])
+            if vectors is None:
+                vectors = self.embed_entries([{'question': passage['entry']['question'], 'answer': passage['text']}
+                                              for passage in nearest])
             
             results = []
-            for i, idx in enumerate(indices[0]):
-                if idx != -1 and idx in self.metadata:  # -1 means no result
-                    # Update access count
-                    self.metadata[idx]['access_count'] += 1
-                    
-                    # Add to results
-                    results.append({
-                        'question': self.metadata[idx]['question'],
-                        'answer': self.metadata[idx]['answer'],
-                        'source': self.metadata[idx]['source'],
-                        'similarity': 1.0 - distances[0][i] / 10.0,  # Normalize distance to similarity
-                        'timestamp': self.metadata[idx]['timestamp'],
-                        'metadata': self.metadata[idx].get('additional', {})
-                    })
+            for i in mmr(query_embedding, vectors, k, mmr_lambda):
+                passage = nearest[i]
+                entry = passage['entry']
+                results.append({
+                    'question': entry['question'],
+                    'answer': entry['answer'],
+                    'passage': passage['text'],
+                    'entry_id': passage['entry_id'],
+                    'position': passage['position'],
+                    'start': passage['start'],
+                    'end': passage['end'],
+                    'source': entry['source'],
+                    'similarity': passage['similarity'],
+                    'timestamp': entry['timestamp'],
+                    'metadata': entry['additional']
+                })
+            
+            self.metadata.record_access({result['entry_id'] for result in results})
             
             return results
         except Exception as e:
-            print(f"Error searching memory: {e}")
+            print(f"Error searching memory passages: {e}")
             return []
     
-    def get_rag_context(self, query, max_results=3, min_similarity=0.6):
-        """Get RAG context for query"""
-        search_results = self.search(query, k=max_results*2)  # Get more to filter by similarity
+    def get_rag_context(self, query, max_results=3, min_similarity=0.6, token_budget=RAG_TOKEN_BUDGET):
+        """Get RAG context for query.
+        
+        Passages are taken in MMR order while they fit in token_budget words,
+        from at most max_results entries. Each entry gives one "Q: ...\nA: ..."
+        string of its chosen passages in answer order, overlaps joined.
+        """
+        passages = self.search_passages(query, k=max_results * 2)
+        
+        chosen = {}
+        used = 0
+        for passage in passages:
+            if passage['similarity'] < min_similarity:
+                continue
+            if passage['entry_id'] not in chosen and len(chosen) == max_results:
+                continue
+            words = len(passage['passage'].split())
+            if used + words > token_budget:
+                continue
+            used += words
+            chosen.setdefault(passage['entry_id'], []).append(passage)
         
-        # Filter by similarity
-        rag_context = [
-            f"Q: {result['question']}\nA: {result['answer']}"
-            for result in search_results
-            if result['similarity'] >= min_similarity
-        ]
+        rag_context = []
+        for group in chosen.values():
+            answer = group[0]['answer'] or ''
+            spans = merge_spans((passage['start'], passage['end']) for passage in group)
+            text = " ... ".join(answer[start:end] for start, end in spans)
+            rag_context.append(f"Q: {group[0]['question']}\nA: {text}")
         
-        # Limit context length
-        return rag_context[:max_results]
+        return rag_context
     
     def augment_with_rag(self, query, base_answer):
         """Augment an answer with RAG context"""
@@ -229,52 +597,27 @@ class AdvancedMemory:
             # Calculate cutoff timestamp
             cutoff_time = time.time() - (max_age_days * 24 * 60 * 60)
             
-            # Collect entries to keep
-            keep_indices = []
-            keep_embeddings = []
-            new_metadata = {}
+            # Entries that are neither recent nor frequently accessed, and their passages
+            stale_ids = self.metadata.stale_ids(cutoff_time, min_access_count)
+            remove_ids = self.metadata.passage_ids(stale_ids)
             
-            # Current index as numpy array
-            all_embeddings = np.zeros((self.index.ntotal, EMBEDDING_DIM), dtype='float32')
-            
-            # Iterate through all entries
-            for i in range(self.index.ntotal):
-                if i in self.metadata:
-                    entry = self.metadata[i]
-                    
-                    # Keep if recently accessed or frequently accessed
-                    if entry['timestamp'] > cutoff_time or entry['access_count'] >= min_access_count:
-                        # Get the embedding
-                        self.index.reconstruct(i, all_embeddings[len(keep_indices)])
-                        
-                        # Add to keep lists
-                        keep_indices.append(i)
-                        keep_embeddings.append(all_embeddings[len(keep_indices)-1])
-                        new_metadata[len(keep_indices)-1] = entry
-            
-            # Build new index with kept embeddings
-            if keep_embeddings:
-                keep_embeddings = np.array(keep_embeddings)
-                
-                # Create new index
-                new_index = faiss.IndexFlatL2(EMBEDDING_DIM)
-                new_index.add(keep_embeddings)
+            if stale_ids:
+                # Metadata goes first; index entries left without it are dropped on load
+                self.metadata.delete_many(stale_ids)
                 
-                # Replace old index and metadata
-                self.index = new_index
-                self.metadata = new_metadata
-                
-                # Move to GPU if available
-                if USE_GPU:
-                    res = faiss.StandardGpuResources()
-                    self.index = faiss.index_cpu_to_gpu(res, 0, self.index)
+                # Remove in place by id; remaining ids keep their keys
+                self.ensure_writable()
+                if self.on_gpu:
+                    self.index = memory_index.remove_ids(self.cpu_index(), remove_ids)
+                    self.on_gpu = False
+                    self.move_to_gpu()
+                else:
+                    self.index = memory_index.remove_ids(self.index, remove_ids)
                 
                 # Save updated index
                 self.save_index()
-                
-                return self.index.ntotal
             
-            return 0
+            return self.index.ntotal
         except Exception as e:
             print(f"Error cleaning up old entries: {e}")
             return -1
@@ -0,0 +1,179 @@
+"""Async serving mode for the web app.
+
+Same routes as web_app, served by aiohttp: a request waiting on the LLM is
+a suspended coroutine instead of a blocked thread, so one process can keep
+hundreds of chats in flight. Database and embedding calls run in the
+default thread pool.
+
+Single process:
+    python async_app.py --port 8080
+
+Multiple workers (one event loop per worker process):
+    gunicorn async_app:create_app --bind 0.0.0.0:8080 \\
+        --worker-class aiohttp.GunicornWebWorker --workers 4
+"""
+
+import os
+import json
+import asyncio
+import logging
+import argparse
+from contextlib import aclosing
+from aiohttp import web
+
+from database import full_text_search
+from startup import start_services
+from semantic_cache import semantic_cache
+from task_memo import task_memo
+from task_executor import task_executor
+from write_behind import write_behind
+from retrieval import retriever, RETRIEVE_BUDGET_MS, RETRIEVE_MAX_BUDGET_MS
+from chat_service import answer_events_async, answer_question_async, parse_limit, text_field, is_admin
+
+logger = logging.getLogger('protype_ai')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+
+routes = web.RouteTableDef()
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return {}
+
+async def sse_response(request, events):
+    """Stream (event, data) pairs from an async generator as server-sent events"""
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    await response.prepare(request)
+    # Closing the generator on disconnect releases its LLM slot
+    async with aclosing(events):
+        async for event, data in events:
+            await response.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+    await response.write_eof()
+    return response
+
+@routes.get('/')
+async def index(request):
+    return web.FileResponse(os.path.join(TEMPLATE_DIR, 'index.html'))
+
+@routes.get('/dashboard')
+async def dashboard(request):
+    return web.FileResponse(os.path.join(TEMPLATE_DIR, 'dashboard.html'))
+
+@routes.post('/chat')
+async def chat(request):
+    question = text_field(await read_json(request), 'question')
+    if question is None:
+        return web.json_response({"status": "error", "message": "The question must be a string"}, status=400)
+    if not question:
+        return web.json_response({"status": "error", "message": "No question provided"})
+    return web.json_response(await answer_question_async(question))
+
+@routes.post('/chat/stream')
+async def chat_stream(request):
+    question = text_field(await read_json(request), 'question')
+    if question is None:
+        return web.json_response({"status": "error", "message": "The question must be a string"}, status=400)
+    if not question:
+        return web.json_response({"status": "error", "message": "No question provided"})
+    return await sse_response(request, answer_events_async(question))
+
+@routes.post('/api/chat')
+async def chat_endpoint(request):
+    message = text_field(await read_json(request), 'message')
+    if message is None:
+        return web.json_response({"error": "The message must be a string"}, status=400)
+    if not message:
+        return web.json_response({"error": "No message provided"}, status=400)
+
+    result = await answer_question_async(message, user="api_user")
+    if result["status"] != "success":
+        return web.json_response({"error": result["message"]}, status=503)
+
+    return web.json_response({
+        "response": result["answer"],
+        "source": result["source"],
+        "cached": result["cached"]
+    })
+
+@routes.post('/api/chat/stream')
+async def chat_stream_endpoint(request):
+    message = text_field(await read_json(request), 'message')
+    if message is None:
+        return web.json_response({"error": "The message must be a string"}, status=400)
+    if not message:
+        return web.json_response({"error": "No message provided"}, status=400)
+    return await sse_response(request, answer_events_async(message, user="api_user"))
+
+@routes.get('/api/cache/stats')
+async def cache_stats_endpoint(request):
+    return web.json_response(semantic_cache.get_stats())
+
+@routes.get('/api/tasks/stats')
+async def task_stats_endpoint(request):
+    return web.json_response(dict(task_memo.get_stats(), executor=task_executor.get_stats(),
+                                  side_effects=write_behind.get_stats()))
+
+@routes.post('/api/cache/invalidate')
+async def cache_invalidate_endpoint(request):
+    if not is_admin(request.headers.get('X-Admin-Token'), request.remote):
+        return web.json_response({"error": "Admin token required"}, status=403)
+    data = await read_json(request)
+    question, source = text_field(data, 'question'), text_field(data, 'source')
+    if question is None or source is None:
+        return web.json_response({"error": "The question and source must be strings"}, status=400)
+    if not question and not source:
+        return web.json_response({"error": "Provide a question or a source to invalidate"}, status=400)
+    removed = await asyncio.to_thread(semantic_cache.invalidate, question=question or None,
+                                      source=source or None)
+    return web.json_response({"removed": removed})
+
+@routes.get('/api/search')
+async def search_endpoint(request):
+    query = request.query.get('q', '').strip()
+    if not query:
+        return web.json_response({"results": []})
+
+    results = await asyncio.to_thread(full_text_search, query, parse_limit(request.query.get('limit')))
+    return web.json_response({"results": results})
+
+@routes.get('/api/retrieve')
+async def retrieve_endpoint(request):
+    query = request.query.get('q', '').strip()
+    if not query:
+        return web.json_response({"results": []})
+
+    budget_ms = parse_limit(request.query.get('budget_ms'), int(RETRIEVE_BUDGET_MS), RETRIEVE_MAX_BUDGET_MS)
+    results = await asyncio.to_thread(retriever.retrieve, query, parse_limit(request.query.get('k')), budget_ms)
+    return web.json_response({"results": results})
+
+async def on_startup(app):
+    await asyncio.to_thread(start_services)
+
+async def create_app(argv=None):
+    """Application factory, also used by gunicorn's aiohttp worker"""
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.add_routes(routes)
+    app.router.add_static('/static', STATIC_DIR)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Protype.AI async web server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Starting Protype.AI async web server on http://{args.host}:{args.port}")
+    web.run_app(create_app(), host=args.host, port=args.port, access_log=None)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import statistics
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+# Benchmark: SQLite file size and query times with answers stored inline
+# (the previous layout) and after init_db moves long answers to the
+# compressed knowledge_content table. "table MB" is the size of the
+# knowledge table's pages, overflow pages included: what a metadata scan
+# such as GROUP BY source walks, and reads from disk when the cache is cold.
+#
+# Answers are synthetic Wikipedia-style articles of 1-200 paragraphs drawn
+# from a Zipf-distributed vocabulary, with the Wikipedia attribution prefix;
+# --duplicates of the questions share an article with another question
+# (as redirects do). Real English compresses better than this text.
+#
+#   python benchmarks/bench_answer_storage.py --rows 3000
+
+SOURCES = ["wikipedia", "gemini_flash_2", "user", "celery_worker"]
+
+def make_vocabulary(rng, size):
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    weights = [12, 9, 8, 8, 7, 7, 6, 6, 6, 4, 4, 3, 3, 2, 2, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1, 1]
+    return ["".join(rng.choices(letters, weights, k=rng.randint(2, 10))) for _ in range(size)]
+
+def make_article(rng, vocabulary, zipf):
+    paragraphs = []
+    for _ in range(min(200, max(1, int(rng.lognormvariate(3.2, 0.9))))):
+        sentences = []
+        for _ in range(rng.randint(3, 7)):
+            words = rng.choices(vocabulary, zipf, k=rng.randint(8, 25))
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(sentences))
+    return "According to Wikipedia under CC BY-SA 3.0:\n" + "\n\n".join(paragraphs)
+
+def build_legacy(path, rows, duplicates, seed):
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng, 8000)
+    zipf = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE knowledge (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT UNIQUE, answer TEXT,
+            weight REAL, source TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT DEFAULT 'system', modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            modified_by TEXT DEFAULT 'system')
+    """)
+    articles = []
+    for n in range(rows):
+        if articles and rng.random() < duplicates:
+            answer = rng.choice(articles)
+        else:
+            answer = make_article(rng, vocabulary, zipf) if rng.random() < 0.8 else f"A short answer {n}"
+            articles.append(answer)
+        conn.execute("INSERT INTO knowledge (question, answer, weight, source) VALUES (?, ?, ?, ?)",
+                     (f"What is topic {n}?", answer, rng.random(), rng.choice(SOURCES)))
+    conn.commit()
+    conn.close()
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000 * statistics.median(times)
+
+def measure(path, repeat, rows):
+    database.SQLITE_DB_PATH = path
+    database.close_connections()
+    conn, _ = database.get_connection()
+    questions = [f"What is topic {n}?" for n in random.Random(1).sample(range(rows), 50)]
+
+    def scan():
+        conn.execute("SELECT source, COUNT(*) FROM knowledge GROUP BY source").fetchall()
+
+    def metadata():
+        conn.execute("SELECT question, weight, source, modified_at FROM knowledge").fetchall()
+
+    def answers():
+        for question in questions:
+            database.get_knowledge_history(question)
+
+    def search():
+        database.full_text_search("topic history of the region")
+
+    results = {
+        "size_mb": os.path.getsize(path) / 1e6,
+        "table_mb": conn.execute("SELECT SUM(pgsize) FROM dbstat WHERE name = 'knowledge'").fetchone()[0] / 1e6,
+        "group_by_ms": timed(scan, repeat),
+        "metadata_ms": timed(metadata, repeat),
+        "50_answers_ms": timed(answers, repeat),
+        "search_ms": timed(search, repeat),
+    }
+    database.close_connections()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3000)
+    parser.add_argument("--duplicates", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        legacy = os.path.join(workdir, "legacy.db")
+        build_legacy(legacy, args.rows, args.duplicates, args.seed)
+        # The inline layout with the current full-text index, before the move
+        database.ANSWER_INLINE_LIMIT, inline_limit = sys.maxsize, database.ANSWER_INLINE_LIMIT
+        shutil.copy(legacy, os.path.join(workdir, "inline.db"))
+        database.SQLITE_DB_PATH = os.path.join(workdir, "inline.db")
+        database.init_db()
+        database.close_connections()
+        database.ANSWER_INLINE_LIMIT = inline_limit
+
+        shutil.copy(legacy, os.path.join(workdir, "compressed.db"))
+        database.SQLITE_DB_PATH = os.path.join(workdir, "compressed.db")
+        start = time.perf_counter()
+        database.init_db()
+        migration = time.perf_counter() - start
+        database.close_connections()
+
+        conn = sqlite3.connect(database.SQLITE_DB_PATH)
+        bodies, raw, stored, dictionaries = conn.execute("""
+            SELECT COUNT(*), SUM(size), SUM(length(body)),
+                   (SELECT COUNT(*) FROM answer_dictionaries)
+            FROM knowledge_content
+        """).fetchone()
+        moved = conn.execute("SELECT COUNT(*) FROM knowledge WHERE content_hash IS NOT NULL").fetchone()[0]
+        conn.close()
+
+        print(f"{args.rows} rows, {moved} answers moved out of line as {bodies} bodies, "
+              f"{dictionaries} dictionary, migration {migration:.1f}s")
+        print(f"bodies: {raw / 1e6:.1f} MB of text stored as {stored / 1e6:.1f} MB ({raw / stored:.1f}x)")
+        print(f"{'layout':>10} {'size MB':>8} {'table MB':>9} {'GROUP BY ms':>12} {'metadata ms':>12} "
+              f"{'50 answers ms':>14} {'search ms':>10}")
+        for layout in ("inline", "compressed"):
+            r = measure(os.path.join(workdir, f"{layout}.db"), args.repeat, args.rows)
+            print(f"{layout:>10} {r['size_mb']:>8.1f} {r['table_mb']:>9.1f} {r['group_by_ms']:>12.1f} {r['metadata_ms']:>12.1f} "
+                  f"{r['50_answers_ms']:>14.1f} {r['search_ms']:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+import aiohttp
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Benchmark: /api/chat under many concurrent clients while every request
+# waits on a slow LLM (the stub backend sleeping LLM_STUB_DELAY seconds).
+#
+#   flask    - web_app on Werkzeug with threaded=True, as main.py runs it:
+#              one OS thread per in-flight request, no upper bound
+#   wsgipool - web_app on a WSGI server with a fixed thread pool, the shape
+#              of a gunicorn gthread / waitress deployment
+#   async    - async_app on aiohttp: waiting requests are coroutines
+#
+# Each server runs in its own process in a scratch directory; peak thread
+# count and RSS are sampled from /proc.
+#
+#   python benchmarks/bench_async_serving.py --concurrency 50 200 500
+
+SERVERS = {
+    "flask": (
+        "import database; database.init_db()\n"
+        "from web_app import app\n"
+        "app.run(host='127.0.0.1', port={port}, threaded=True)\n"
+    ),
+    "wsgipool": (
+        "import database; database.init_db()\n"
+        "from concurrent.futures import ThreadPoolExecutor\n"
+        "from socketserver import ThreadingMixIn\n"
+        "from wsgiref.simple_server import make_server, WSGIServer, WSGIRequestHandler\n"
+        "from web_app import app\n"
+        "class Quiet(WSGIRequestHandler):\n"
+        "    def log_message(self, *args): pass\n"
+        "class Pooled(ThreadingMixIn, WSGIServer):\n"
+        "    request_queue_size = 1024\n"
+        "    pool = ThreadPoolExecutor({threads})\n"
+        "    def process_request(self, request, client_address):\n"
+        "        self.pool.submit(self.process_request_thread, request, client_address)\n"
+        "make_server('127.0.0.1', {port}, app, server_class=Pooled, handler_class=Quiet).serve_forever()\n"
+    ),
+    "async": (
+        "import sys; sys.argv = ['async_app', '--host', '127.0.0.1', '--port', '{port}']\n"
+        "import async_app; async_app.main()\n"
+    ),
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def proc_status(pid):
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                values[key] = value.strip()
+    except OSError:
+        return 0, 0
+    return int(values.get("Threads", 0)), int(values.get("VmRSS", "0 kB").split()[0]) // 1024
+
+class Sampler(threading.Thread):
+    """Peak thread count and RSS (MB) of a process"""
+
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            threads, rss = proc_status(self.pid)
+            self.peak_threads = max(self.peak_threads, threads)
+            self.peak_rss = max(self.peak_rss, rss)
+            time.sleep(0.05)
+
+def start_server(kind, port, workdir, args):
+    env = dict(os.environ,
+               PYTHONPATH=REPO_DIR,
+               LLM_BACKEND="stub",
+               LLM_STUB_DELAY=str(args.llm_delay),
+               # Measure the server, not the gateway's own limits
+               LLM_MAX_CONCURRENCY="100000",
+               LLM_MAX_ASYNC_CONCURRENCY="100000",
+               LLM_TIMEOUT="600",
+               # The Flask servers above do not start the agents either
+               BACKGROUND_AGENTS="0",
+               HF_HUB_OFFLINE="1",
+               TRANSFORMERS_OFFLINE="1")
+    code = SERVERS[kind].replace("{port}", str(port)).replace("{threads}", str(args.pool_threads))
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+async def run_load(port, concurrency, run_id):
+    url = f"http://127.0.0.1:{port}/api/chat"
+    timeout = aiohttp.ClientTimeout(total=600)
+    connector = aiohttp.TCPConnector(limit=0)
+    latencies = []
+    errors = 0
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        # Warm-up: the first request pays for lazy imports
+        async with session.post(url, json={"message": f"warm up {run_id}"}) as response:
+            await response.read()
+
+        async def one(n):
+            nonlocal errors
+            start = time.perf_counter()
+            try:
+                async with session.post(url, json={"message": f"question {run_id} {n}"}) as response:
+                    await response.read()
+                    if response.status != 200:
+                        errors += 1
+                        return
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[one(n) for n in range(concurrency)])
+        elapsed = time.perf_counter() - start
+    return elapsed, latencies, errors
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[50, 200, 500])
+    parser.add_argument("--llm-delay", type=float, default=1.0)
+    parser.add_argument("--pool-threads", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"LLM latency {args.llm_delay}s, wsgipool threads {args.pool_threads}")
+    print(f"{'server':>9} {'clients':>8} {'wall s':>8} {'req/s':>8} {'p50 s':>7} {'p95 s':>7} "
+          f"{'errors':>7} {'threads':>8} {'rss MB':>7}")
+    for kind in args.servers:
+        for concurrency in args.concurrency:
+            with tempfile.TemporaryDirectory() as workdir:
+                port = free_port()
+                process = start_server(kind, port, workdir, args)
+                sampler = Sampler(process.pid)
+                sampler.start()
+                try:
+                    elapsed, latencies, errors = asyncio.run(run_load(port, concurrency, f"{kind}{concurrency}"))
+                finally:
+                    sampler.running = False
+                    process.terminate()
+                    process.wait(timeout=30)
+                print(f"{kind:>9} {concurrency:>8} {elapsed:>8.2f} {len(latencies) / elapsed:>8.1f} "
+                      f"{statistics.median(latencies) if latencies else float('nan'):>7.2f} "
+                      f"{percentile(latencies, 0.95):>7.2f} {errors:>7} {sampler.peak_threads:>8} "
+                      f"{sampler.peak_rss:>7}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+import time
+import zlib
+import argparse
+import tempfile
+import threading
+import statistics
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import chat_service
+from knowledge_store import knowledge_store
+from semantic_cache import SemanticCache
+from llm_gateway import LLMGateway, StubBackend
+from write_behind import WriteBehindQueue
+
+# Benchmark: chat request latency (answer_question, from the request to the
+# "done" result) for questions the LLM answers, with the answer saved on
+# the request thread (sync) and through the write-behind queue.
+#
+# The LLM is the stub backend with no delay, so the numbers are the
+# service's own work. The semantic cache embeds with a bag-of-words
+# function that sleeps --embed-ms per call, standing in for MiniLM on a
+# CPU; the write-behind writer embeds a batch of questions in one call.
+# --clients requests run at once; the database is a fresh SQLite file.
+#
+#   python benchmarks/bench_chat_latency.py --requests 500 --clients 1 4
+
+class Embedder:
+    """Bag-of-words vectors after sleeping delay seconds per call"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def __call__(self, texts):
+        time.sleep(self.delay)
+        vectors = np.zeros((len(texts), 384), dtype='float32')
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode()) % 384] += 1.0
+        return vectors
+
+def run(mode, workdir, requests, clients, embed_ms):
+    database.SQLITE_DB_PATH = os.path.join(workdir, f"{mode}-{clients}.db")
+    database.close_connections()
+    knowledge_store.reset()
+    database.init_db()
+
+    chat_service.WRITE_BEHIND_ENABLED = mode == "write-behind"
+    # A warm cache, so every lookup embeds the question
+    embedder = Embedder()
+    chat_service.semantic_cache = SemanticCache(embed=embedder, threshold=0.95)
+    chat_service.semantic_cache.store_many([(f"Warm question {n}?", "An answer", "bench") for n in range(200)])
+    embedder.delay = embed_ms / 1000
+    chat_service.llm_gateway = LLMGateway(StubBackend(delay=0, persist=True))
+    chat_service.log_action = lambda *args: None
+    chat_service.write_behind = WriteBehindQueue(os.path.join(workdir, f"{mode}-{clients}-journal.db"))
+    chat_service.index_answers = lambda payloads: None
+    chat_service.register_side_effects(chat_service.write_behind)
+
+    latencies = []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client():
+        for n in counter:
+            start = time.perf_counter()
+            chat_service.answer_question(f"Benchmark question {n} {n * 7919} {n * 104729}?")
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    served = time.perf_counter() - start
+    chat_service.write_behind.flush()
+    drained = time.perf_counter() - start
+
+    saved = database.get_connection()[0].execute("SELECT COUNT(*) FROM knowledge").fetchone()[0]
+    stats = chat_service.write_behind.get_stats()
+    chat_service.write_behind.close()
+    database.close_connections()
+
+    latencies.sort()
+    return {
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+        "served_s": served,
+        "drained_s": drained,
+        "saved": saved,
+        "batches": stats["batches"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--embed-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'clients':>7} {'p50 ms':>7} {'p99 ms':>7} {'served s':>9} {'drained s':>10} "
+          f"{'saved':>6} {'batches':>8}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for clients in args.clients:
+            for mode in ("sync", "write-behind"):
+                r = run(mode, workdir, args.requests, clients, args.embed_ms)
+                print(f"{mode:>12} {clients:>7} {r['p50_ms']:>7.2f} {r['p99_ms']:>7.2f} {r['served_s']:>9.2f} "
+                      f"{r['drained_s']:>10.2f} {r['saved']:>6} {r['batches']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import networkx as nx
+import torch
+import torch.nn.functional as F
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import graph_neural_network
+from graph_neural_network import KnowledgeGNN
+
+# Benchmark: seconds per KnowledgeGNN training epoch against graph size, for
+# the previous per-edge Python loop, the vectorized full-batch loss and
+# mini-batched neighbour-sampled training (per epoch and per optimizer step).
+#
+#   python benchmarks/bench_gnn_training.py --questions 500 2000 10000 50000
+
+def make_graph(num_questions, rng, num_entities=None):
+    """Question -> answer / entity graph shaped like KnowledgeGraph's"""
+    num_entities = num_entities or max(10, num_questions // 5)
+    graph = nx.DiGraph()
+    for i in range(num_questions):
+        graph.add_node(f"q{i}", type='question')
+        graph.add_node(f"a{i}", type='answer')
+        graph.add_edge(f"q{i}", f"a{i}")
+        for e in rng.integers(0, num_entities, 3):
+            graph.add_node(f"e{e}", type='entity')
+            graph.add_edge(f"q{i}", f"e{e}")
+            graph.add_edge(f"a{i}", f"e{e}")
+    return graph
+
+def legacy_epoch(gnn, data, optimizer):
+    """One epoch of the per-edge loop KnowledgeGNN.train used to run"""
+    criterion = torch.nn.MSELoss()
+    optimizer.zero_grad()
+    out = gnn.model(data.x, data.edge_index)
+    loss = 0
+    for (u, v) in gnn.knowledge_graph.edges():
+        similarity = F.cosine_similarity(out[gnn.node_mapping[u]].unsqueeze(0), out[gnn.node_mapping[v]].unsqueeze(0))
+        loss += criterion(similarity, torch.tensor([1.0], device=gnn.device))
+    for _ in range(gnn.knowledge_graph.number_of_edges() // 2):
+        u_idx = np.random.randint(0, len(gnn.node_mapping))
+        v_idx = np.random.randint(0, len(gnn.node_mapping))
+        if not gnn.knowledge_graph.has_edge(gnn.reverse_mapping[u_idx], gnn.reverse_mapping[v_idx]):
+            similarity = F.cosine_similarity(out[u_idx].unsqueeze(0), out[v_idx].unsqueeze(0))
+            loss += criterion(similarity, torch.tensor([0.0], device=gnn.device))
+    loss.backward()
+    optimizer.step()
+
+def time_epochs(gnn, epochs, batch_size):
+    # Disable the automatic switch to mini-batches for the full-batch timing
+    graph_neural_network.MINI_BATCH_EDGES = float('inf')
+    start = time.perf_counter()
+    gnn.train(epochs=epochs, batch_size=batch_size)
+    return (time.perf_counter() - start) / epochs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, nargs="+", default=[500, 2000, 10000, 50000])
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=8192)
+    parser.add_argument("--legacy-max-edges", type=int, default=30000,
+                        help="skip the per-edge loop above this many edges")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    torch.manual_seed(42)
+    print(f"{'nodes':>8} {'edges':>8} {'loop (s)':>9} {'full (s)':>9} {'batched (s)':>12} "
+          f"{'s/batch':>8} {'speedup':>8}")
+    for num_questions in args.questions:
+        graph = make_graph(num_questions, rng)
+        gnn = KnowledgeGNN(graph)
+        gnn.build_model()
+
+        loop_s = None
+        if graph.number_of_edges() <= args.legacy_max_edges:
+            data = gnn.prepare_graph_data().to(gnn.device)
+            optimizer = torch.optim.Adam(gnn.model.parameters(), lr=0.01, weight_decay=5e-4)
+            start = time.perf_counter()
+            legacy_epoch(gnn, data, optimizer)
+            loop_s = time.perf_counter() - start
+
+        full_s = time_epochs(gnn, args.epochs, None)
+        batched_s = time_epochs(gnn, args.epochs, args.batch_size)
+        batches = -(-graph.number_of_edges() // args.batch_size)
+        speedup = f"{loop_s / full_s:.0f}x" if loop_s else "-"
+        loop_text = f"{loop_s:.3f}" if loop_s else "skipped"
+        print(f"{graph.number_of_nodes():>8} {graph.number_of_edges():>8} {loop_text:>9} "
+              f"{full_s:>9.4f} {batched_s:>12.4f} {batched_s / batches:>8.4f} {speedup:>8}")
+
+if __name__ == "__main__":
+    main()
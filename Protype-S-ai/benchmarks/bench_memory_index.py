@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import faiss
+import memory_index
+from memory_index import EMBEDDING_DIM
+
+# Benchmark: recall@k and per-query latency of the HNSW and IVF-PQ index
+# modes against the exact flat index, on clustered synthetic embeddings.
+#
+#   python benchmarks/bench_memory_index.py --sizes 20000 100000
+
+def make_vectors(count, rng, clusters=200):
+    """Clustered vectors roughly shaped like sentence embeddings"""
+    centers = rng.standard_normal((clusters, EMBEDDING_DIM)).astype('float32')
+    labels = rng.integers(0, clusters, count)
+    vectors = centers[labels] + 0.35 * rng.standard_normal((count, EMBEDDING_DIM)).astype('float32')
+    return np.ascontiguousarray(vectors, dtype='float32')
+
+def build(index_type, vectors):
+    start = time.perf_counter()
+    index = memory_index.create_index(index_type, training_vectors=vectors)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+    return index, time.perf_counter() - start
+
+def run_queries(index, queries, k):
+    # Single-query calls, as AdvancedMemory.search issues them
+    start = time.perf_counter()
+    labels = np.vstack([index.search(q.reshape(1, -1), k)[1] for q in queries])
+    return labels, (time.perf_counter() - start) * 1000 / len(queries)
+
+def recall(labels, truth):
+    hits = sum(len(set(row) & set(true_row)) for row, true_row in zip(labels, truth))
+    return hits / truth.size
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    rng = np.random.default_rng(42)
+    print(f"{'rows':>8} {'index':>6} {'build (s)':>10} {'ms/query':>9} {'recall@' + str(args.k):>10} {'size (MB)':>10}")
+    for count in args.sizes:
+        vectors = make_vectors(count, rng)
+        queries = vectors[rng.integers(0, count, args.queries)] + \
+            0.1 * rng.standard_normal((args.queries, EMBEDDING_DIM)).astype('float32')
+
+        flat, flat_build = build('flat', vectors)
+        truth, flat_ms = run_queries(flat, queries, args.k)
+        for index_type in ('flat', 'hnsw', 'ivfpq'):
+            if index_type == 'flat':
+                index, build_s, labels, ms = flat, flat_build, truth, flat_ms
+            else:
+                index, build_s = build(index_type, vectors)
+                labels, ms = run_queries(index, queries, args.k)
+            size_mb = faiss.serialize_index(index).nbytes / 1e6
+            print(f"{count:>8} {memory_index.index_kind(index):>6} {build_s:>10.2f} {ms:>9.3f} "
+                  f"{recall(labels, truth):>10.3f} {size_mb:>10.1f}")
+
+if __name__ == "__main__":
+    main()
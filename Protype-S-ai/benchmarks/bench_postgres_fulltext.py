@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import random
+import statistics
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2
+from database import SEARCH_VECTOR_EXPRESSION
+
+# Benchmark: PostgreSQL search latency vs. row count, comparing the old
+# per-query to_tsvector() expression with the stored, GIN-indexed search_vector.
+#
+#   DATABASE_URL=postgresql://... python benchmarks/bench_postgres_fulltext.py
+#
+# Everything runs in a scratch schema that is dropped afterwards.
+
+ROW_COUNTS = [1000, 10000, 50000]
+QUERIES = ["neural networks", "quantum computing history", "renewable energy", "football"]
+REPEATS = 5
+SCHEMA = "protype_bench"
+
+WORDS = ("science history energy network neural quantum football music art computer data "
+         "learning language planet ocean climate solar wind medicine vaccine theory model "
+         "system computing renewable robot vision engine market culture war empire").split()
+
+OLD_QUERY = """
+    SELECT question, answer, weight, source,
+           ts_rank(to_tsvector('english', question || ' ' || answer), plainto_tsquery('english', %s)) AS rank
+    FROM {table}
+    WHERE to_tsvector('english', question || ' ' || answer) @@ plainto_tsquery('english', %s)
+    ORDER BY rank DESC
+    LIMIT 10
+"""
+
+NEW_QUERY = """
+    SELECT question, answer, weight, source, ts_rank(search_vector, query) AS rank
+    FROM {table}, plainto_tsquery('english', %s) AS query
+    WHERE search_vector @@ query
+    ORDER BY rank DESC
+    LIMIT 10
+"""
+
+def make_answer(rng):
+    """A Wikipedia-sized answer of a few kilobytes"""
+    paragraphs = []
+    for _ in range(rng.randint(5, 15)):
+        paragraphs.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(40, 80))))
+    return "\n".join(paragraphs)
+
+def populate(cursor, count, rng):
+    cursor.execute(f"DROP TABLE IF EXISTS {SCHEMA}.old_knowledge, {SCHEMA}.new_knowledge")
+    cursor.execute(f"""
+        CREATE TABLE {SCHEMA}.old_knowledge (
+            id SERIAL PRIMARY KEY, question TEXT UNIQUE, answer TEXT, weight REAL, source TEXT)
+    """)
+    cursor.execute(f"""
+        CREATE TABLE {SCHEMA}.new_knowledge (
+            id SERIAL PRIMARY KEY, question TEXT UNIQUE, answer TEXT, weight REAL, source TEXT,
+            search_vector tsvector GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED)
+    """)
+    rows = [(f"What is {rng.choice(WORDS)} {rng.choice(WORDS)} #{i}?", make_answer(rng), 0.6, "wikipedia")
+            for i in range(count)]
+    for table in ("old_knowledge", "new_knowledge"):
+        cursor.executemany(
+            f"INSERT INTO {SCHEMA}.{table} (question, answer, weight, source) VALUES (%s, %s, %s, %s)",
+            rows
+        )
+    cursor.execute(f"CREATE INDEX ON {SCHEMA}.new_knowledge USING GIN (search_vector)")
+    cursor.execute(f"ANALYZE {SCHEMA}.old_knowledge")
+    cursor.execute(f"ANALYZE {SCHEMA}.new_knowledge")
+
+def time_query(cursor, sql, params):
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def main():
+    if 'DATABASE_URL' not in os.environ:
+        print("Set DATABASE_URL to a PostgreSQL database to run this benchmark")
+        return 1
+
+    rng = random.Random(42)
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+
+    print(f"{'rows':>8} {'to_tsvector (ms)':>18} {'stored+GIN (ms)':>17} {'speedup':>9}")
+    try:
+        for count in ROW_COUNTS:
+            populate(cursor, count, rng)
+            old_ms = statistics.mean(
+                time_query(cursor, OLD_QUERY.format(table=f"{SCHEMA}.old_knowledge"), (q, q)) for q in QUERIES
+            )
+            new_ms = statistics.mean(
+                time_query(cursor, NEW_QUERY.format(table=f"{SCHEMA}.new_knowledge"), (q,)) for q in QUERIES
+            )
+            print(f"{count:>8} {old_ms:>18.2f} {new_ms:>17.2f} {old_ms / new_ms:>8.1f}x")
+    finally:
+        cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import os
+import re
+import sys
+import time
+import zlib
+import random
+import argparse
+import tempfile
+import statistics
+from collections import Counter
+
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import advanced_memory
+from advanced_memory import AdvancedMemory, EMBEDDING_MAX_LENGTH
+
+# Benchmark: RAG context from AdvancedMemory with whole answers indexed (one
+# vector per entry, the answer truncated at EMBEDDING_MAX_LENGTH, whole Q/A
+# pairs quoted) against overlapping passages (MMR, context to a budget).
+#
+# The knowledge base mixes long "articles" (--min-words to --max-words of
+# Zipf-distributed filler) with short answers. Each article carries --facts
+# facts, three rare words placed twice together at a random offset. A query
+# asks for one fact by its words plus a filler word. Measured: whether the
+# article is among the entries quoted (entry recall), whether the fact's
+# words are in the context (fact recall), and the context size in words.
+#
+# MiniLM is not downloaded here, so a text is embedded as the sum of random
+# vectors of its words (log-scaled counts), truncated like the model's
+# tokenizer: a long text dilutes each word's share, as mean pooling does.
+#
+#   python benchmarks/bench_rag_context.py --articles 200 --queries 400
+
+class BenchMemory(AdvancedMemory):
+    """AdvancedMemory with pooled random word vectors instead of the transformer"""
+
+    def initialize_embeddings(self):
+        self.tokenizer = self.model = "word-vectors"
+        self.embedding_cache = None
+        self.word_vectors = {}
+
+    def word_vector(self, word):
+        vector = self.word_vectors.get(word)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(word.encode()))
+            vector = self.word_vectors[word] = rng.standard_normal(advanced_memory.EMBEDDING_DIM).astype('float32')
+        return vector
+
+    def get_embeddings(self, texts, batch_size=None):
+        vectors = np.zeros((len(texts), advanced_memory.EMBEDDING_DIM), dtype='float32')
+        for row, text in enumerate(texts):
+            counts = Counter(re.findall(r"\w+", text.lower())[:EMBEDDING_MAX_LENGTH])
+            for word, count in counts.items():
+                vectors[row] += np.log1p(count) * self.word_vector(word)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-9)
+        return vectors
+
+def make_words(rng, count, length):
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    return sorted({"".join(rng.choices(letters, k=rng.randint(*length))) for _ in range(count)})
+
+def build_kb(rng, articles, shorts, facts, min_words, max_words):
+    filler = make_words(rng, 3000, (3, 8))
+    zipf = [1 / (rank + 1) for rank in range(len(filler))]
+    rare = iter(make_words(rng, (articles * facts + shorts) * 4, (8, 12)))
+    kb, queries_for = [], []
+    for n in range(articles):
+        words = rng.choices(filler, zipf, k=rng.randint(min_words, max_words))
+        for _ in range(facts):
+            fact = [next(rare) for _ in range(3)]
+            offset = rng.randrange(len(words))
+            words[offset:offset] = fact + rng.sample(fact, 3)
+            queries_for.append((f"Tell me about article {n}", fact))
+        kb.append({"question": f"Tell me about article {n}", "answer": " ".join(words)})
+    for n in range(shorts):
+        fact = [next(rare) for _ in range(3)]
+        kb.append({"question": f"What is short {n}", "answer": " ".join(rng.choices(filler, zipf, k=24) + fact + fact)})
+        queries_for.append((f"What is short {n}", fact))
+    return kb, filler, queries_for
+
+def whole_answer_context(memory, query, max_results=3, min_similarity=0.6):
+    """get_rag_context as it was before passages: whole Q/A pairs of the top entries"""
+    return [f"Q: {result['question']}\nA: {result['answer']}"
+            for result in memory.search(query, k=max_results * 2)
+            if result['similarity'] >= min_similarity][:max_results]
+
+def run(mode, kb, queries, workdir):
+    os.chdir(workdir)
+    for name in ("memory_index.faiss", "memory_metadata.db"):
+        if os.path.exists(name):
+            os.remove(name)
+    split = advanced_memory.split_passages
+    if mode == "whole":
+        advanced_memory.split_passages = lambda text: [(0, len(text or ""))]
+    try:
+        memory = BenchMemory(index_type="flat")
+        start = time.perf_counter()
+        memory.add_knowledge_batch(kb)
+        ingest = time.perf_counter() - start
+    finally:
+        advanced_memory.split_passages = split
+
+    entry_hits, fact_hits, words, latencies = [], [], [], []
+    for question, fact, query in queries:
+        start = time.perf_counter()
+        if mode == "whole":
+            context = whole_answer_context(memory, query)
+        else:
+            context = memory.get_rag_context(query)
+        latencies.append(time.perf_counter() - start)
+        entry_hits.append(any(item.startswith(f"Q: {question}\n") for item in context))
+        text = "\n".join(context)
+        fact_hits.append(all(word in text for word in fact))
+        words.append(sum(len(item.split("\nA: ", 1)[1].split()) for item in context))
+    memory.metadata.close()
+
+    latencies.sort()
+    return {
+        "vectors": memory.index.ntotal,
+        "ingest_s": ingest,
+        "entry": statistics.mean(entry_hits),
+        "fact": statistics.mean(fact_hits),
+        "words": statistics.mean(words),
+        "max_words": max(words),
+        "p50_ms": 1000 * statistics.median(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--articles", type=int, default=200)
+    parser.add_argument("--shorts", type=int, default=400)
+    parser.add_argument("--facts", type=int, default=8)
+    parser.add_argument("--min-words", type=int, default=300)
+    parser.add_argument("--max-words", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    kb, filler, queries_for = build_kb(rng, args.articles, args.shorts, args.facts, args.min_words, args.max_words)
+    queries = []
+    for question, fact in rng.sample(queries_for, min(args.queries, len(queries_for))):
+        words = list(fact) + rng.sample(filler[:200], 1)
+        rng.shuffle(words)
+        queries.append((question, fact, " ".join(words)))
+
+    print(f"{args.articles} articles of {args.min_words}-{args.max_words} words, {args.shorts} short answers, "
+          f"{len(queries)} queries")
+    print(f"{'mode':>9} {'vectors':>8} {'ingest s':>9} {'entry':>6} {'fact':>6} {'words':>7} {'max':>6} {'p50 ms':>7}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            for mode in ("whole", "passages"):
+                r = run(mode, kb, queries, workdir)
+                print(f"{mode:>9} {r['vectors']:>8} {r['ingest_s']:>9.2f} {r['entry']:>6.3f} {r['fact']:>6.3f} "
+                      f"{r['words']:>7.0f} {r['max_words']:>6} {r['p50_ms']:>7.2f}")
+        finally:
+            os.chdir(cwd)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import re
+import sys
+import time
+import zlib
+import random
+import argparse
+import tempfile
+import statistics
+
+import faiss
+import numpy as np
+import networkx as nx
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from knowledge_store import knowledge_store
+from retrieval import Retriever, graph_search
+
+# Benchmark: relevance and latency of retrieval.Retriever over a synthetic
+# knowledge base, for each backend alone and fused.
+#
+# Each row is about a two-word entity and carries three rare "signature"
+# words among Zipf-distributed filler. Queries target one row and come in
+# three kinds, a third each:
+#   entity   - names the entity, in lower case, with filler words
+#   keywords - two signature words and filler, no entity
+#   typo     - two signature words with one letter changed each
+#
+# Backends: fulltext is database.full_text_search (SQLite FTS5, BM25);
+# graph is graph_search over question -> entity edges; memory stands in
+# for AdvancedMemory with hashed character-trigram vectors in a FAISS
+# inner-product index (MiniLM is not downloaded here). --slow-ms delays the
+# memory backend, to show what the budget does.
+#
+#   python benchmarks/bench_retrieval.py --rows 5000 --queries 600
+
+def make_words(rng, count, length):
+    letters = "etaoinshrdlcumwfgypbvkjxqz"
+    return sorted({"".join(rng.choices(letters, k=rng.randint(*length))) for _ in range(count)})
+
+def build_kb(rng, rows):
+    filler = make_words(rng, 3000, (3, 8))
+    zipf = [1 / (rank + 1) for rank in range(len(filler))]
+    rare = make_words(rng, rows * 4, (7, 11))
+    names = [word.capitalize() for word in make_words(rng, rows // 3, (4, 7))]
+    kb = []
+    for n in range(rows):
+        entity = f"{rng.choice(names)} {names[n % len(names)]}"
+        signature = rare[3 * n:3 * n + 3]
+        words = rng.choices(filler, zipf, k=40) + signature
+        rng.shuffle(words)
+        kb.append({"question": f"Tell me about {entity} ({n})", "answer": " ".join(words).capitalize() + ".",
+                   "entity": entity, "signature": signature})
+    return kb, filler
+
+def make_queries(rng, kb, filler, count):
+    queries = []
+    for n in range(count):
+        row = rng.choice(kb)
+        kind = ("entity", "keywords", "typo")[n % 3]
+        if kind == "entity":
+            words = [row["entity"].lower()] + rng.sample(filler[:200], 2)
+        else:
+            words = rng.sample(row["signature"], 2)
+            if kind == "typo":
+                words = [word[:i] + rng.choice("aeiou") + word[i + 1:]
+                         for word in words for i in [rng.randint(2, len(word) - 2)]]
+            words += rng.sample(filler[:200], 2)
+        rng.shuffle(words)
+        queries.append((kind, " ".join(words), row["question"]))
+    return queries
+
+def trigram_vectors(texts, dim=2048):
+    vectors = np.zeros((len(texts), dim), dtype='float32')
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            padded = f"#{word}#"
+            for i in range(len(padded) - 2):
+                vectors[row, zlib.crc32(padded[i:i + 3].encode()) % dim] += 1.0
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def memory_backend(kb, slow_ms):
+    index = faiss.IndexFlatIP(2048)
+    index.add(trigram_vectors([f"{row['question']} {row['answer']}" for row in kb]))
+
+    def search(query, limit):
+        if slow_ms:
+            time.sleep(slow_ms / 1000)
+        scores, ids = index.search(trigram_vectors([query]), limit)
+        return [{"question": kb[i]["question"], "answer": kb[i]["answer"], "score": float(score)}
+                for score, i in zip(scores[0], ids[0]) if i >= 0]
+    return search
+
+def build_graph(kb):
+    graph = nx.DiGraph()
+    for row in kb:
+        graph.add_node(row["question"], type="question")
+        graph.add_node(row["entity"], type="entity")
+        graph.add_edge(row["question"], row["entity"], relation="contains")
+    return graph
+
+def evaluate(retriever, queries, k, budget_ms):
+    latencies, reciprocal_ranks = [], []
+    hits = {}
+    for kind, query, relevant in queries:
+        start = time.perf_counter()
+        results = retriever.retrieve(query, k=10, budget_ms=budget_ms)
+        latencies.append(time.perf_counter() - start)
+        questions = [result["question"] for result in results]
+        rank = questions.index(relevant) + 1 if relevant in questions else None
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+        hits.setdefault(kind, []).append(rank is not None and rank <= k)
+    latencies.sort()
+    return {
+        "recall": sum(sum(kind_hits) for kind_hits in hits.values()) / len(queries),
+        "by_kind": {kind: sum(kind_hits) / len(kind_hits) for kind, kind_hits in hits.items()},
+        "mrr": statistics.mean(reciprocal_ranks),
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=600)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=300)
+    parser.add_argument("--slow-ms", type=float, default=500)
+    parser.add_argument("--seed", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    kb, filler = build_kb(rng, args.rows)
+    queries = make_queries(rng, kb, filler, args.queries)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database.SQLITE_DB_PATH = os.path.join(workdir, "retrieval.db")
+        knowledge_store.reset()
+        database.init_db()
+        database.save_many([(row["question"], row["answer"], 0.6, "bench") for row in kb])
+
+        backends = {
+            "fulltext": lambda query, limit: database.full_text_search(query, limit),
+            "memory": memory_backend(kb, 0),
+            "graph": graph_search(build_graph(kb)),
+        }
+        configs = [[name] for name in backends] + [list(backends)]
+
+        print(f"{args.rows} rows, {args.queries} queries, recall@{args.k} and MRR@10")
+        print(f"{'backends':>24} {'recall':>7} {'entity':>7} {'keywords':>9} {'typo':>6} {'MRR':>6} "
+              f"{'p50 ms':>7} {'p99 ms':>7}")
+        for names in configs + ["slow"]:
+            retriever = Retriever()
+            if names == "slow":
+                names = list(backends)
+                label = f"fused, memory +{args.slow_ms:.0f}ms"
+                for name in names:
+                    retriever.add_backend(name, memory_backend(kb, args.slow_ms) if name == "memory" else backends[name])
+            else:
+                label = "+".join(names)
+                for name in names:
+                    retriever.add_backend(name, backends[name])
+            r = evaluate(retriever, queries, args.k, args.budget_ms)
+            print(f"{label:>24} {r['recall']:>7.3f} {r['by_kind']['entity']:>7.3f} {r['by_kind']['keywords']:>9.3f} "
+                  f"{r['by_kind']['typo']:>6.3f} {r['mrr']:>6.3f} {r['p50_ms']:>7.2f} {r['p99_ms']:>7.2f}")
+        database.close_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from knowledge_store import knowledge_store
+
+# Benchmark: knowledge write throughput in rows/sec on SQLite, for a first
+# load into an empty table (insert) and for re-saving the same questions
+# with new answers (update).
+#
+#   legacy    - the previous save_data: DELETE + INSERT, commit per row
+#   save_data - one upsert statement, commit per row
+#   save_many - executemany upserts, one transaction per chunk
+#
+# The per-row modes commit (and fsync) every row, so they are timed on the
+# first --per-row-limit rows only.
+#
+#   python benchmarks/bench_save_many.py --sizes 10000 100000
+
+def legacy_save_data(question, answer, weight, source, user="system"):
+    conn, is_postgres = database.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM knowledge WHERE question = ?", (question,))
+        cursor.execute(
+            "INSERT INTO knowledge (question, answer, weight, source, created_by, modified_by) VALUES (?, ?, ?, ?, ?, ?)",
+            (question, answer, weight, source, user, user)
+        )
+        conn.commit()
+    finally:
+        database.release_connection(conn, is_postgres)
+
+def make_rows(count, version):
+    return [(f"Benchmark question {n}?", f"Answer {version} to benchmark question {n}, " * 8, 0.5, "bench")
+            for n in range(count)]
+
+def timed(mode, rows):
+    start = time.perf_counter()
+    if mode == "save_many":
+        database.save_many(rows, "bench")
+    else:
+        save = legacy_save_data if mode == "legacy" else database.save_data
+        for row in rows:
+            save(*row, "bench")
+    return len(rows) / (time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--modes", nargs="+", default=["legacy", "save_data", "save_many"])
+    parser.add_argument("--per-row-limit", type=int, default=10000)
+    args = parser.parse_args()
+
+    print(f"chunk size {database.SAVE_MANY_CHUNK_SIZE}")
+    print(f"{'rows':>8} {'mode':>10} {'insert rows/s':>14} {'update rows/s':>14}")
+    for count in args.sizes:
+        for mode in args.modes:
+            with tempfile.TemporaryDirectory() as workdir:
+                database.SQLITE_DB_PATH = os.path.join(workdir, "bench.db")
+                database.init_db()
+                knowledge_store.reset()
+                limit = count if mode == "save_many" else min(count, args.per_row_limit)
+                insert_rate = timed(mode, make_rows(limit, 1))
+                update_rate = timed(mode, make_rows(limit, 2))
+            print(f"{count:>8} {mode:>10} {insert_rate:>14.0f} {update_rate:>14.0f}")
+
+if __name__ == "__main__":
+    main()
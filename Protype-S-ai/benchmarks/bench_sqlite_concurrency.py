@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+import statistics
+import multiprocessing
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+# Benchmark: knowledge writes from several processes and threads at a fixed
+# target rate, with reader threads querying alongside, as the Flask threads,
+# learning threads and Celery workers do.
+#
+#   legacy  - a new connection per call, rollback journal, DELETE + INSERT
+#             with a commit per write (the previous save_data)
+#   managed - WAL, per-thread connections and the group-committing writer
+#
+# Reports the write rate reached, lock errors and write latency.
+#
+#   python benchmarks/bench_sqlite_concurrency.py --rate 500 --processes 4 --threads 8
+
+def legacy_connection(path):
+    conn = sqlite3.connect(path)
+    # The full-text triggers call it
+    database.register_sqlite_functions(conn)
+    return conn, False
+
+def legacy_write(row):
+    conn, is_postgres = database.get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM knowledge WHERE question = ?", (row[0],))
+        cursor.execute(
+            "INSERT INTO knowledge (question, answer, weight, source, created_by, modified_by) VALUES (?, ?, ?, ?, ?, ?)",
+            row + ("bench", "bench")
+        )
+        conn.commit()
+    finally:
+        database.release_connection(conn, is_postgres)
+
+def managed_write(row):
+    database.run_write(lambda cursor, is_postgres: database._upsert(cursor, is_postgres, [row], "bench"))
+
+def read(question):
+    conn, is_postgres = database.get_connection()
+    try:
+        conn.execute("SELECT answer FROM knowledge WHERE question = ?", (question,)).fetchall()
+        conn.execute("SELECT source, COUNT(*) FROM knowledge GROUP BY source").fetchall()
+    finally:
+        database.release_connection(conn, is_postgres)
+
+managed_connection = database.get_connection
+
+def configure(mode, path):
+    database.SQLITE_DB_PATH = path
+    if mode == "legacy":
+        database.get_connection = lambda: legacy_connection(path)
+    else:
+        database.get_connection = managed_connection
+
+def worker(mode, path, process_id, args, results):
+    configure(mode, path)
+    write = legacy_write if mode == "legacy" else managed_write
+    interval = args.processes * args.threads / args.rate
+    deadline = time.monotonic() + args.duration
+    latencies = []
+    counts = {"writes": 0, "reads": 0, "lock_errors": 0, "other_errors": 0}
+    lock = threading.Lock()
+
+    def record_error(e):
+        with lock:
+            counts["lock_errors" if "locked" in str(e) else "other_errors"] += 1
+
+    def writer(thread_id):
+        next_at = time.monotonic()
+        n = 0
+        while next_at < deadline:
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            # A quarter of the writes update an existing question
+            key = n // 4 if n % 4 == 0 else n
+            row = (f"Question {process_id}-{thread_id}-{key}?", f"Answer {n}", 0.5, "bench")
+            start = time.perf_counter()
+            try:
+                write(row)
+            except Exception as e:
+                record_error(e)
+            else:
+                with lock:
+                    counts["writes"] += 1
+                    latencies.append(time.perf_counter() - start)
+            n += 1
+            next_at += interval
+
+    def reader():
+        n = 0
+        while time.monotonic() < deadline:
+            try:
+                read(f"Question {process_id}-0-{n}?")
+            except Exception as e:
+                record_error(e)
+            else:
+                with lock:
+                    counts["reads"] += 1
+            n += 1
+            time.sleep(0.002)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.threads)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((counts, latencies, database.sqlite_writer.stats["commits"]))
+
+def run(mode, args):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "bench.db")
+        configure(mode, path)
+        database.init_db()
+        if mode == "legacy":
+            database.close_connections()
+
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        processes = [context.Process(target=worker, args=(mode, path, n, args, results))
+                     for n in range(args.processes)]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - start
+
+    totals = {key: sum(counts[key] for counts, _, _ in collected) for key in collected[0][0]}
+    latencies = sorted(latency for _, worker_latencies, _ in collected for latency in worker_latencies)
+    commits = sum(commits for _, _, commits in collected)
+    return totals, latencies, commits, elapsed
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["legacy", "managed"])
+    parser.add_argument("--rate", type=float, default=500, help="target writes/sec over all processes")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8, help="writer threads per process")
+    parser.add_argument("--readers", type=int, default=2, help="reader threads per process")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"target {args.rate:.0f} writes/s, {args.processes} processes x {args.threads} writers "
+          f"+ {args.readers} readers, {args.duration:.0f}s")
+    print(f"{'mode':>8} {'writes/s':>9} {'reads/s':>8} {'lock errors':>12} {'other errors':>13} "
+          f"{'p50 ms':>7} {'p99 ms':>8} {'commits':>8}")
+    for mode in args.modes:
+        totals, latencies, commits, elapsed = run(mode, args)
+        print(f"{mode:>8} {totals['writes'] / elapsed:>9.0f} {totals['reads'] / elapsed:>8.0f} "
+              f"{totals['lock_errors']:>12} {totals['other_errors']:>13} "
+              f"{1000 * statistics.median(latencies) if latencies else float('nan'):>7.1f} "
+              f"{1000 * percentile(latencies, 0.99):>8.1f} {commits if mode == 'managed' else totals['writes']:>8}")
+
+if __name__ == "__main__":
+    main()
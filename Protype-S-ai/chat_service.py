@@ -0,0 +1,229 @@
+import os
+import hmac
+import asyncio
+import logging
+import datetime
+from database import save_data, save_many
+from knowledge_store import knowledge_store
+from semantic_cache import semantic_cache
+from llm_gateway import llm_gateway, LLMError
+from event_log import event_log, log_action
+from write_behind import write_behind, WRITE_BEHIND_ENABLED
+
+logger = logging.getLogger('protype_ai')
+
+# Source recorded for answers generated by the LLM
+LLM_SOURCE = "gemini_flash_2"
+
+# Results a search request may ask for
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+
+# Token for admin endpoints such as cache invalidation, sent as X-Admin-Token;
+# when unset they only answer clients on the loopback interface
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+LOOPBACK_ADDRESSES = {"127.0.0.1", "::1"}
+
+# Re-taught questions must not be answered from the semantic cache
+knowledge_store.add_write_listener(semantic_cache.note_write)
+
+def parse_limit(value, default=SEARCH_DEFAULT_LIMIT, maximum=SEARCH_MAX_LIMIT):
+    """A result count from a query string, clamped to 1..maximum; default when not an integer"""
+    try:
+        return min(max(int(value), 1), maximum)
+    except (TypeError, ValueError):
+        return default
+
+def text_field(data, key):
+    """A stripped string field of a JSON body; None when the body or the field is not a string"""
+    value = data.get(key, '') if isinstance(data, dict) else None
+    return value.strip() if isinstance(value, str) else None
+
+def is_admin(token, remote_addr):
+    """Whether a request may use the admin endpoints"""
+    if ADMIN_TOKEN:
+        return bool(token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+    return remote_addr in LOOPBACK_ADDRESSES
+
+def save_answers(payloads):
+    """Write-behind handler: save queued LLM answers to knowledge.
+    
+    Raises when a save fails, so the batch is retried.
+    """
+    # One save_many per run of answers from the same user keeps enqueue order
+    runs = []
+    for payload in payloads:
+        if not runs or runs[-1][0] != payload["user"]:
+            runs.append((payload["user"], []))
+        runs[-1][1].append((payload["question"], payload["answer"], 0.6, LLM_SOURCE))
+    for user, rows in runs:
+        if save_many(rows, user) < len({row[0] for row in rows}):
+            raise RuntimeError(f"Saved only part of {len(rows)} answers")
+
+def embed_answers(payloads):
+    """Write-behind handler: embed answers into the semantic cache.
+    
+    Queued after the answer itself: the knowledge write listener would drop
+    a cache entry stored before it.
+    """
+    # The last answer queued for a question is the one kept
+    latest = {payload["question"]: payload["answer"] for payload in payloads}
+    semantic_cache.store_many([(question, answer, LLM_SOURCE) for question, answer in latest.items()])
+
+def index_answers(payloads):
+    """Write-behind handler: add answers to the vector memory used by retrieve()"""
+    # Import here to avoid circular imports
+    from advanced_memory import advanced_memory
+    if advanced_memory.model is None:
+        return
+    items = [{"question": payload["question"], "answer": payload["answer"], "source": LLM_SOURCE}
+             for payload in payloads]
+    if advanced_memory.add_knowledge_batch(items) < len(items):
+        raise RuntimeError(f"Indexed only part of {len(items)} answers")
+
+def save_logs(payloads):
+    """Write-behind handler: append queued user actions to the event log"""
+    for payload in payloads:
+        log_action(payload["user"], payload["action"], payload["description"], payload["timestamp"])
+    event_log.flush()
+
+def register_side_effects(queue):
+    """Register the chat side effects on a write-behind queue"""
+    queue.register("answer", save_answers)
+    queue.register("embed", embed_answers)
+    queue.register("index", index_answers)
+    queue.register("log", save_logs)
+
+register_side_effects(write_behind)
+
+def persist_answer(question, answer, user):
+    """Queue an LLM answer to be saved, embedded and indexed after the response is sent"""
+    payload = {"question": question, "answer": answer, "user": user}
+    if not WRITE_BEHIND_ENABLED:
+        save_answers([payload])
+        embed_answers([payload])
+        index_answers([payload])
+        return
+    write_behind.enqueue_many([(kind, question, payload) for kind in ("answer", "embed", "index")])
+
+def record_action(user, action, description):
+    """Queue a user action for the event log"""
+    payload = {"user": user, "action": action, "description": description,
+               "timestamp": datetime.datetime.now().isoformat()}
+    if not WRITE_BEHIND_ENABLED:
+        save_logs([payload])
+        return
+    write_behind.enqueue("log", user, payload)
+
+def stored_answer(question):
+    """The knowledge base answer, or one queued for saving and not written yet"""
+    queued = write_behind.pending("answer", question)
+    return queued["answer"] if queued else knowledge_store.get_answer(question)
+
+def answer_events(question, user="web_user"):
+    """Answer from the knowledge base, then the semantic cache, then the LLM.
+    
+    Yields (event, data) pairs: "status" as each stage starts, "chunk" with
+    answer text as it is produced, then "done" with the full answer or "error".
+    """
+    record_action(user, "chat", f"Asked: {question}")
+
+    yield "status", {"stage": "knowledge_base"}
+    answer = stored_answer(question)
+    if answer is not None:
+        yield "chunk", {"text": answer}
+        yield "done", {"answer": answer, "source": "knowledge_base", "cached": False}
+        return
+
+    # A paraphrase of an answered question skips the LLM round trip
+    yield "status", {"stage": "cache"}
+    cached = semantic_cache.lookup(question)
+    if cached:
+        yield "chunk", {"text": cached["answer"]}
+        yield "done", {
+            "answer": cached["answer"],
+            "source": cached["source"],
+            "cached": True,
+            "similarity": cached["similarity"]
+        }
+        return
+
+    yield "status", {"stage": "model"}
+    parts = []
+    try:
+        for chunk in llm_gateway.stream(question, caller="web_chat"):
+            parts.append(chunk)
+            yield "chunk", {"text": chunk}
+    except LLMError as e:
+        logger.error(f"Error querying LLM: {e}")
+        yield "error", {"message": "The language model is unavailable, please try again later"}
+        return
+
+    # Persist once, when the whole answer is in
+    answer = "".join(parts).strip()
+    if llm_gateway.persists_answers:
+        persist_answer(question, answer, user)
+    yield "done", {"answer": answer, "source": LLM_SOURCE, "cached": False}
+
+def answer_question(question, user="web_user"):
+    """Run answer_events to completion and return the final result"""
+    result = None
+    for event, data in answer_events(question, user):
+        if event == "done":
+            result = dict(data, status="success")
+        elif event == "error":
+            result = {"status": "error", "message": data["message"]}
+    return result
+
+
+async def answer_events_async(question, user="web_user"):
+    """answer_events for the async server.
+    
+    LLM calls are awaited on the event loop; database and embedding work
+    runs in the default thread pool so it does not block other requests.
+    """
+    await asyncio.to_thread(record_action, user, "chat", f"Asked: {question}")
+
+    yield "status", {"stage": "knowledge_base"}
+    answer = await asyncio.to_thread(stored_answer, question)
+    if answer is not None:
+        yield "chunk", {"text": answer}
+        yield "done", {"answer": answer, "source": "knowledge_base", "cached": False}
+        return
+
+    yield "status", {"stage": "cache"}
+    cached = await asyncio.to_thread(semantic_cache.lookup, question)
+    if cached:
+        yield "chunk", {"text": cached["answer"]}
+        yield "done", {
+            "answer": cached["answer"],
+            "source": cached["source"],
+            "cached": True,
+            "similarity": cached["similarity"]
+        }
+        return
+
+    yield "status", {"stage": "model"}
+    parts = []
+    try:
+        async for chunk in llm_gateway.astream(question, caller="web_chat"):
+            parts.append(chunk)
+            yield "chunk", {"text": chunk}
+    except LLMError as e:
+        logger.error(f"Error querying LLM: {e}")
+        yield "error", {"message": "The language model is unavailable, please try again later"}
+        return
+
+    answer = "".join(parts).strip()
+    if llm_gateway.persists_answers:
+        await asyncio.to_thread(persist_answer, question, answer, user)
+    yield "done", {"answer": answer, "source": LLM_SOURCE, "cached": False}
+
+async def answer_question_async(question, user="web_user"):
+    result = None
+    async for event, data in answer_events_async(question, user):
+        if event == "done":
+            result = dict(data, status="success")
+        elif event == "error":
+            result = {"status": "error", "message": data["message"]}
+    return result
@@ -8,6 +8,7 @@ from datetime import datetime
 
 import database
 import visualization
+from event_log import event_log
 from celery_tasks import batch_wikipedia_learning, generate_topic_suggestions
 
 class Dashboard:
@@ -35,11 +36,8 @@ class Dashboard:
             charts = {}
 
             try:
-                # Activity chart
-                with open('user_actions.json', 'r') as f:
-                    activity_log = json.load(f)
-
-                fig = visualization.create_activity_chart(activity_log)
+                # Activity chart, aggregated per day by the event log
+                fig = visualization.create_activity_chart(event_log.daily_counts("actions", "action"))
                 if fig:
                     charts["activity"] = visualization.get_image_from_fig(fig)
                     plt.close(fig)
@@ -82,11 +80,8 @@ class Dashboard:
     def get_recent_activities(self, limit=10):
         """Get recent activities from log"""
         try:
-            with open('user_actions.json', 'r') as f:
-                activity_log = json.load(f)
-
             # Get recent actions (last 10)
-            recent_actions = activity_log.get("actions", [])[-limit:]
+            recent_actions = event_log.recent("actions", limit)
 
             activities = []
             for action in reversed(recent_actions):
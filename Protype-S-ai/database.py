@@ -1,9 +1,21 @@
 
 import os
+import re
 import sqlite3
 import json
+import zlib
+import queue
+import hashlib
+import threading
+from concurrent.futures import Future
 from datetime import datetime
 
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
 # Check if we're running in Replit with PostgreSQL available
 USING_POSTGRES = 'DATABASE_URL' in os.environ
 
@@ -12,6 +24,7 @@ pg_pool = None
 if USING_POSTGRES:
     import psycopg2
     from psycopg2 import pool
+    from psycopg2.extras import execute_values
     database_url = os.environ['DATABASE_URL']
     # Use connection pooling for better performance
     pg_pool = pool.ThreadedConnectionPool(1, 20, database_url)
@@ -19,20 +32,342 @@ if USING_POSTGRES:
 # For backward compatibility with SQLite
 SQLITE_DB_PATH = 'protype_e0.db'
 
+# Column boosts for full-text ranking, same as the Elasticsearch multi_match
+FTS_QUESTION_BOOST = 3.0
+FTS_ANSWER_BOOST = 2.0
+
+# How strongly the stored knowledge weight scales the text relevance score
+FTS_WEIGHT_BLEND = 0.5
+
+# Rows per transaction in save_many
+SAVE_MANY_CHUNK_SIZE = 5000
+
+# SQLite connection settings. WAL lets readers run alongside a writer;
+# with WAL, synchronous=NORMAL only risks the last commits on power loss.
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Most queued writes the writer thread commits in one transaction
+SQLITE_WRITE_BATCH = 256
+
+# Answers longer than this (in characters) are stored compressed in
+# knowledge_content, keyed by content hash; the knowledge row keeps the
+# first ANSWER_PREVIEW_CHARS as a preview. SQLite only: PostgreSQL already
+# moves large values out of line (TOAST).
+ANSWER_INLINE_LIMIT = int(os.environ.get('ANSWER_INLINE_LIMIT', 1024))
+ANSWER_PREVIEW_CHARS = 280
+
+# zstd level and dictionary size for stored answer bodies. A dictionary is
+# trained once ANSWER_DICT_MIN_SAMPLES bodies are stored.
+ANSWER_ZSTD_LEVEL = int(os.environ.get('ANSWER_ZSTD_LEVEL', 9))
+ANSWER_DICT_SIZE = 64 * 1024
+ANSWER_DICT_MIN_SAMPLES = 64
+ANSWER_DICT_MAX_SAMPLES = 2000
+
+# Storage layout of the SQLite file, recorded in PRAGMA user_version
+SQLITE_STORAGE_VERSION = 1
+
+# Per-thread SQLite connections, keyed by database path
+_local = threading.local()
+
+def connect_sqlite(path=None):
+    """Open a SQLite connection in WAL mode with the tuned pragmas"""
+    conn = sqlite3.connect(path or SQLITE_DB_PATH, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+    except sqlite3.OperationalError as e:
+        print(f"Could not enable WAL journaling: {e}")
+    conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    register_sqlite_functions(conn)
+    return conn
+
+def _thread_connections():
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    return connections
+
 def get_connection():
     """Returns either a PostgreSQL or SQLite connection based on environment"""
     if USING_POSTGRES and pg_pool:
         return pg_pool.getconn(), True
     else:
-        return sqlite3.connect(SQLITE_DB_PATH), False
+        # One SQLite connection per thread, reused across calls
+        connections = _thread_connections()
+        conn = connections.get(SQLITE_DB_PATH)
+        if conn is None:
+            conn = connections[SQLITE_DB_PATH] = connect_sqlite()
+        return conn, False
 
 def release_connection(conn, is_postgres):
     """Properly releases/closes the connection based on type"""
     if is_postgres and pg_pool:
         pg_pool.putconn(conn)
+    elif any(conn is cached for cached in _thread_connections().values()):
+        # Kept for reuse; drop anything the caller left uncommitted
+        if conn.in_transaction:
+            conn.rollback()
     else:
         conn.close()
 
+def close_connections():
+    """Close the SQLite connections cached for the calling thread"""
+    connections = _thread_connections()
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+class SQLiteWriter:
+    """Runs SQLite writes on one dedicated thread.
+
+    Writes queued while a commit is in progress are applied together in
+    the next transaction and committed once (group commit), each inside
+    its own savepoint so a failing write does not undo the others. Threads
+    in this process never compete for the write lock; other processes wait
+    on busy_timeout.
+    """
+
+    def __init__(self, max_batch=SQLITE_WRITE_BATCH):
+        self.max_batch = max_batch
+        self.stats = {"writes": 0, "commits": 0, "errors": 0, "largest_batch": 0}
+        self.reset()
+
+    def reset(self):
+        """Forget the writer thread; a forked child starts its own on first write"""
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._cursor = None
+        self._lock = threading.Lock()
+
+    def submit(self, fn):
+        """Run fn(cursor, is_postgres) in a write transaction and return its result"""
+        if threading.current_thread() is self._thread:
+            # Issued from inside a write: it joins that write's transaction
+            return fn(self._cursor, False)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((fn, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        results = []
+        try:
+            conn, is_postgres = get_connection()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        try:
+            self._cursor = cursor = conn.cursor()
+            # Take the write lock up front instead of upgrading from a read lock
+            cursor.execute("BEGIN IMMEDIATE")
+            for fn, future in batch:
+                cursor.execute("SAVEPOINT write")
+                try:
+                    results.append((future, fn(cursor, is_postgres), None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT write")
+                    results.append((future, None, e))
+                cursor.execute("RELEASE SAVEPOINT write")
+            conn.commit()
+        except Exception as e:
+            print(f"Error committing SQLite writes: {e}")
+            if conn.in_transaction:
+                conn.rollback()
+            self.stats["errors"] += len(batch)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self._cursor = None
+            release_connection(conn, is_postgres)
+
+        self.stats["commits"] += 1
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], len(batch))
+        for future, result, error in results:
+            if error is None:
+                self.stats["writes"] += 1
+                future.set_result(result)
+            else:
+                self.stats["errors"] += 1
+                future.set_exception(error)
+
+# Create singleton instance
+sqlite_writer = SQLiteWriter()
+
+def _reset_after_fork():
+    # A forked child (e.g. a Celery prefork worker) has neither the writer
+    # thread nor a usable copy of the parent's SQLite connections
+    global _local
+    _local = threading.local()
+    sqlite_writer.reset()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def run_write(fn):
+    """Run fn(cursor, is_postgres) in a committed write transaction and return its result.
+
+    On SQLite the write is queued to the writer thread and may share a
+    commit with other writes; on PostgreSQL it runs on a pooled connection.
+    Errors raised by fn propagate to the caller.
+    """
+    if not (USING_POSTGRES and pg_pool):
+        return sqlite_writer.submit(fn)
+    conn, is_postgres = get_connection()
+    try:
+        result = fn(conn.cursor(), is_postgres)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        release_connection(conn, is_postgres)
+
+# Answer text as the full-text index sees it: the stored body for answers
+# moved to knowledge_content, otherwise the inline answer
+ANSWER_TEXT_SQL = """COALESCE(
+    (SELECT unpack_answer(codec, dict_id, body) FROM knowledge_content WHERE hash = {row}.content_hash),
+    {row}.answer)"""
+
+# zstd dictionaries by dictionary id, shared by every connection
+_dictionaries = {}
+# zstd compressors and decompressors are not thread-safe: one set per thread
+_codecs = threading.local()
+# Stored body count at which a failed dictionary training is retried, by database file
+_dictionary_retry_at = {}
+
+def _codec(kind, dict_id):
+    cache = _codecs.__dict__.setdefault(kind, {})
+    codec = cache.get(dict_id)
+    if codec is None:
+        dictionary = _dictionaries[dict_id] if dict_id is not None else None
+        if kind == 'compress':
+            codec = zstandard.ZstdCompressor(level=ANSWER_ZSTD_LEVEL, dict_data=dictionary)
+        else:
+            codec = zstandard.ZstdDecompressor(dict_data=dictionary)
+        cache[dict_id] = codec
+    return codec
+
+def pack_answer(answer, dict_id=None):
+    """Compress an answer body, returning (codec, dict_id, body)"""
+    data = answer.encode('utf-8')
+    if not HAS_ZSTD:
+        return 'zlib', None, zlib.compress(data, 6)
+    return 'zstd', dict_id, _codec('compress', dict_id).compress(data)
+
+def unpack_answer(codec, dict_id, body):
+    """Decompress an answer body stored by pack_answer"""
+    if body is None:
+        return None
+    if codec == 'zlib':
+        return zlib.decompress(body).decode('utf-8')
+    if not HAS_ZSTD:
+        raise RuntimeError("zstandard is required to read compressed answers")
+    return _codec('decompress', dict_id).decompress(body).decode('utf-8')
+
+def answer_hash(answer):
+    return hashlib.sha256(answer.encode('utf-8')).hexdigest()
+
+def register_sqlite_functions(conn):
+    """Register unpack_answer(), used by the full-text triggers, on a SQLite connection.
+
+    Any connection that writes to knowledge needs it; connect_sqlite
+    connections have it already.
+    """
+    try:
+        conn.execute("SELECT unpack_answer(NULL, NULL, NULL)")
+    except sqlite3.OperationalError:
+        conn.create_function("unpack_answer", 3, unpack_answer, deterministic=True)
+
+def _load_dictionaries(cursor):
+    """Cache this database's dictionaries; returns the newest dictionary id or None"""
+    cursor.execute("SELECT dict_id FROM answer_dictionaries ORDER BY seq")
+    dict_ids = [dict_id for (dict_id,) in cursor.fetchall()]
+    if not HAS_ZSTD or not dict_ids:
+        return None
+    missing = [dict_id for dict_id in dict_ids if dict_id not in _dictionaries]
+    for dict_id, data in _select_in(cursor, "SELECT dict_id, dictionary FROM answer_dictionaries WHERE dict_id IN ({})", missing):
+        _dictionaries[dict_id] = zstandard.ZstdCompressionDict(data)
+    return dict_ids[-1]
+
+def _select_in(cursor, query, values, size=500):
+    """Run a SQLite query whose {} takes a list of placeholders, over values in slices"""
+    rows = []
+    for offset in range(0, len(values), size):
+        part = list(values[offset:offset + size])
+        cursor.execute(query.format(", ".join("?" * len(part))), part)
+        rows.extend(cursor.fetchall())
+    return rows
+
+def _train_dictionary(cursor, samples):
+    """Train a zstd dictionary on answer bodies and store it as the newest"""
+    dictionary = zstandard.train_dictionary(ANSWER_DICT_SIZE, samples)
+    cursor.execute(
+        "INSERT OR IGNORE INTO answer_dictionaries (dict_id, dictionary) VALUES (?, ?)",
+        (dictionary.dict_id(), dictionary.as_bytes())
+    )
+    _dictionaries[dictionary.dict_id()] = dictionary
+    return dictionary.dict_id()
+
+def _maybe_train_dictionary(cursor):
+    """Train the first dictionary once enough bodies are stored, and recompress them with it"""
+    cursor.execute("SELECT COUNT(*) FROM knowledge_content")
+    count = cursor.fetchone()[0]
+    path = cursor.execute("PRAGMA database_list").fetchone()[2]
+    if count < max(ANSWER_DICT_MIN_SAMPLES, _dictionary_retry_at.get(path, 0)):
+        return None
+    cursor.execute("SELECT hash, codec, dict_id, body FROM knowledge_content ORDER BY rowid DESC LIMIT ?", (ANSWER_DICT_MAX_SAMPLES,))
+    answers = {row[0]: unpack_answer(*row[1:]) for row in cursor.fetchall()}
+    try:
+        dict_id = _train_dictionary(cursor, [answer.encode('utf-8') for answer in answers.values()])
+    except zstandard.ZstdError as e:
+        print(f"Error training answer dictionary: {e}")
+        _dictionary_retry_at[path] = count * 2
+        return None
+    cursor.executemany(
+        "UPDATE knowledge_content SET codec = ?, dict_id = ?, body = ? WHERE hash = ?",
+        [pack_answer(answer, dict_id) + (hash_,) for hash_, answer in answers.items()]
+    )
+    return dict_id
+
+def _store_answers(cursor, answers, dict_id):
+    """Compress and insert the {hash: answer} bodies that are not stored yet"""
+    stored = {hash_ for (hash_,) in _select_in(cursor, "SELECT hash FROM knowledge_content WHERE hash IN ({})", list(answers))}
+    cursor.executemany(
+        "INSERT INTO knowledge_content (hash, size, codec, dict_id, body) VALUES (?, ?, ?, ?, ?)",
+        [(hash_, len(answer)) + pack_answer(answer, dict_id) for hash_, answer in answers.items() if hash_ not in stored]
+    )
+
+def load_answer_bodies(conn, hashes):
+    """Decompressed answer bodies from knowledge_content, by content hash"""
+    cursor = conn.cursor()
+    _load_dictionaries(cursor)
+    rows = _select_in(cursor, "SELECT hash, codec, dict_id, body FROM knowledge_content WHERE hash IN ({})", list(hashes))
+    return {hash_: unpack_answer(codec, dict_id, body) for hash_, codec, dict_id, body in rows}
+
+def expand_answers(conn, rows):
+    """Full answers for (answer, content_hash) pairs read from the knowledge table"""
+    hashes = {hash_ for _, hash_ in rows if hash_}
+    bodies = load_answer_bodies(conn, hashes) if hashes else {}
+    return [bodies.get(hash_, answer) if hash_ else answer for answer, hash_ in rows]
+
 def init_db():
     """Initialize database with required tables"""
     conn, is_postgres = get_connection()
@@ -51,14 +386,23 @@ def init_db():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     created_by TEXT DEFAULT 'system',
                     modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    modified_by TEXT DEFAULT 'system'
+                    modified_by TEXT DEFAULT 'system',
+                    content_hash TEXT
                 )
             ''')
+
+            # Always NULL here: TOAST already keeps large answers out of line
+            cursor.execute("ALTER TABLE knowledge ADD COLUMN IF NOT EXISTS content_hash TEXT")
             
             # Create index for faster searches
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_knowledge_question ON knowledge (question);
             ''')
+
+            # Index for incremental sync by modification time
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_knowledge_modified_at ON knowledge (modified_at);
+            ''')
             
             # Add trigger to update modified_at automatically
             cursor.execute('''
@@ -86,6 +430,20 @@ def init_db():
                     FOR EACH ROW
                     EXECUTE FUNCTION update_modified_column();
                 ''')
+            
+            init_search_vector(cursor)
+
+            # Answers served by meaning to paraphrased questions (see semantic_cache)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS semantic_cache (
+                    id SERIAL PRIMARY KEY,
+                    question TEXT UNIQUE,
+                    answer TEXT,
+                    source TEXT,
+                    created_at DOUBLE PRECISION,
+                    embedding BYTEA
+                )
+            ''')
         else:
             # SQLite schema with version control fields
             cursor.execute('''
@@ -98,22 +456,249 @@ def init_db():
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     created_by TEXT DEFAULT 'system',
                     modified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    modified_by TEXT DEFAULT 'system'
+                    modified_by TEXT DEFAULT 'system',
+                    content_hash TEXT
                 )
             ''')
+            cursor.execute("PRAGMA table_info(knowledge)")
+            if "content_hash" not in [column[1] for column in cursor.fetchall()]:
+                cursor.execute("ALTER TABLE knowledge ADD COLUMN content_hash TEXT")
             
             # Create index for faster searches
             cursor.execute('''
                 CREATE INDEX IF NOT EXISTS idx_knowledge_question ON knowledge (question);
             ''')
+
+            # Index for incremental sync by modification time
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_knowledge_modified_at ON knowledge (modified_at);
+            ''')
+
+            # Compressed bodies of long answers, stored once per distinct text
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS knowledge_content (
+                    hash TEXT PRIMARY KEY,
+                    size INTEGER,
+                    codec TEXT,
+                    dict_id INTEGER,
+                    body BLOB
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_knowledge_content_hash ON knowledge (content_hash)
+                WHERE content_hash IS NOT NULL
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS answer_dictionaries (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    dict_id INTEGER UNIQUE,
+                    dictionary BLOB,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            register_sqlite_functions(conn)
+            moved = migrate_answer_storage(cursor)
+            
+            init_fts(cursor)
+
+            # Answers served by meaning to paraphrased questions (see semantic_cache)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS semantic_cache (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    question TEXT UNIQUE,
+                    answer TEXT,
+                    source TEXT,
+                    created_at REAL,
+                    embedding BLOB
+                )
+            ''')
             
         conn.commit()
+        if not is_postgres and moved:
+            # Give the pages the moved answers occupied back to the filesystem
+            conn.execute("VACUUM")
+            print(f"Moved {moved} long answers to compressed storage")
     except Exception as e:
         print(f"Database initialization error: {e}")
         conn.rollback()
     finally:
         release_connection(conn, is_postgres)
 
+# Stored full-text document: question terms weighted A, answer terms weighted B
+SEARCH_VECTOR_EXPRESSION = (
+    "setweight(to_tsvector('english', coalesce(question, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(answer, '')), 'B')"
+)
+
+def init_search_vector(cursor):
+    """Add the stored tsvector column and its GIN index on PostgreSQL.
+
+    The generated column is computed once per write instead of once per row
+    per query. On an existing table ADD COLUMN rewrites it once; for large
+    live tables prefer migrate_search_vector(), which builds the index
+    without blocking writes.
+    """
+    cursor.execute(f'''
+        ALTER TABLE knowledge ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_knowledge_search_vector ON knowledge USING GIN (search_vector)
+    ''')
+
+def migrate_search_vector():
+    """Migrate an existing PostgreSQL knowledge table to the stored tsvector"""
+    if not USING_POSTGRES or not pg_pool:
+        return False
+        
+    conn, is_postgres = get_connection()
+    previous_autocommit = conn.autocommit
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            ALTER TABLE knowledge ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS ({SEARCH_VECTOR_EXPRESSION}) STORED
+        ''')
+        conn.commit()
+        
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        conn.autocommit = True
+        cursor.execute('''
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_knowledge_search_vector
+            ON knowledge USING GIN (search_vector)
+        ''')
+        cursor.execute("ANALYZE knowledge")
+        print("Migrated knowledge table to stored search_vector with GIN index")
+        return True
+    except Exception as e:
+        print(f"Search vector migration error: {e}")
+        if not conn.autocommit:
+            conn.rollback()
+        return False
+    finally:
+        conn.autocommit = previous_autocommit
+        release_connection(conn, is_postgres)
+
+FTS_TRIGGERS = ("knowledge_fts_insert", "knowledge_fts_delete", "knowledge_fts_update")
+
+def _drop_fts(cursor):
+    for trigger in FTS_TRIGGERS:
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cursor.execute("DROP TABLE IF EXISTS knowledge_fts")
+
+def init_fts(cursor):
+    """Create the SQLite FTS5 index over knowledge, kept in sync by triggers.
+
+    The index reads answers through the knowledge_text view, so bodies moved
+    to knowledge_content are indexed in full. Existing databases are
+    backfilled once when the index is first created.
+    Returns False if this SQLite build has no FTS5 support.
+    """
+    register_sqlite_functions(cursor.connection)
+    cursor.execute(f'''
+        CREATE VIEW IF NOT EXISTS knowledge_text AS
+        SELECT id, question, {ANSWER_TEXT_SQL.format(row="knowledge")} AS answer FROM knowledge
+    ''')
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='knowledge_fts'")
+    row = cursor.fetchone()
+    if row and "knowledge_text" in row[0]:
+        return True
+    # Indexes created before answers moved out of line read knowledge.answer
+    _drop_fts(cursor)
+
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE knowledge_fts USING fts5(
+                question,
+                answer,
+                content='knowledge_text',
+                content_rowid='id',
+                tokenize='porter unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 not available, falling back to LIKE search: {e}")
+        return False
+
+    new_answer = ANSWER_TEXT_SQL.format(row="new")
+    old_answer = ANSWER_TEXT_SQL.format(row="old")
+    cursor.execute(f'''
+        CREATE TRIGGER knowledge_fts_insert AFTER INSERT ON knowledge BEGIN
+            INSERT INTO knowledge_fts (rowid, question, answer) VALUES (new.id, new.question, {new_answer});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER knowledge_fts_delete AFTER DELETE ON knowledge BEGIN
+            INSERT INTO knowledge_fts (knowledge_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, {old_answer});
+        END
+    ''')
+    # Bodies are garbage-collected after the update, so the old one is still readable here
+    cursor.execute(f'''
+        CREATE TRIGGER knowledge_fts_update AFTER UPDATE OF question, answer, content_hash ON knowledge BEGIN
+            INSERT INTO knowledge_fts (knowledge_fts, rowid, question, answer)
+            VALUES ('delete', old.id, old.question, {old_answer});
+            INSERT INTO knowledge_fts (rowid, question, answer) VALUES (new.id, new.question, {new_answer});
+        END
+    ''')
+
+    # One-shot backfill of rows that existed before the index
+    cursor.execute("INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild')")
+    return True
+
+def migrate_answer_storage(cursor):
+    """Move long inline answers of a SQLite database into knowledge_content.
+
+    Runs once per database file (tracked in PRAGMA user_version); a
+    dictionary is trained first when there are enough answers to train on.
+    Returns the number of answers moved.
+    """
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] >= SQLITE_STORAGE_VERSION:
+        return 0
+    cursor.execute("SELECT id FROM knowledge WHERE content_hash IS NULL AND length(answer) > ?", (ANSWER_INLINE_LIMIT,))
+    ids = [row_id for (row_id,) in cursor.fetchall()]
+    if ids:
+        # init_fts rebuilds the index once afterwards instead of per moved row
+        _drop_fts(cursor)
+        dict_id = _load_dictionaries(cursor)
+        if HAS_ZSTD and dict_id is None and len(ids) >= ANSWER_DICT_MIN_SAMPLES:
+            samples = _select_in(cursor, "SELECT answer FROM knowledge WHERE id IN ({})", ids[-ANSWER_DICT_MAX_SAMPLES:])
+            try:
+                dict_id = _train_dictionary(cursor, [answer.encode('utf-8') for (answer,) in samples])
+            except zstandard.ZstdError as e:
+                print(f"Error training answer dictionary: {e}")
+        for offset in range(0, len(ids), 500):
+            rows = [(row_id, answer, answer_hash(answer)) for row_id, answer in
+                    _select_in(cursor, "SELECT id, answer FROM knowledge WHERE id IN ({})", ids[offset:offset + 500])]
+            _store_answers(cursor, {hash_: answer for _, answer, hash_ in rows}, dict_id)
+            cursor.executemany(
+                "UPDATE knowledge SET answer = ?, content_hash = ? WHERE id = ?",
+                [(answer[:ANSWER_PREVIEW_CHARS], hash_, row_id) for row_id, answer, hash_ in rows]
+            )
+    cursor.execute(f"PRAGMA user_version = {SQLITE_STORAGE_VERSION}")
+    return len(ids)
+
+def rebuild_fts_index():
+    """Rebuild the SQLite full-text index from the knowledge table"""
+    conn, is_postgres = get_connection()
+    if is_postgres:
+        release_connection(conn, is_postgres)
+        return False
+    try:
+        cursor = conn.cursor()
+        if not init_fts(cursor):
+            return False
+        cursor.execute("INSERT INTO knowledge_fts (knowledge_fts) VALUES ('rebuild')")
+        conn.commit()
+        return True
+    except Exception as e:
+        print(f"Error rebuilding full-text index: {e}")
+        conn.rollback()
+        return False
+    finally:
+        release_connection(conn, is_postgres)
+
 def migrate_sqlite_to_postgres():
     """Migrate data from SQLite to PostgreSQL if needed"""
     if not USING_POSTGRES or not pg_pool:
@@ -129,9 +714,13 @@ def migrate_sqlite_to_postgres():
         sqlite_conn.close()
         return False
     
-    # Get data from SQLite
-    sqlite_cursor.execute("SELECT question, answer, weight, source FROM knowledge")
+    # Get data from SQLite, with answers moved out of line restored
+    sqlite_cursor.execute("PRAGMA table_info(knowledge)")
+    hash_column = "content_hash" if "content_hash" in [column[1] for column in sqlite_cursor.fetchall()] else "NULL"
+    sqlite_cursor.execute(f"SELECT question, answer, {hash_column}, weight, source FROM knowledge")
     rows = sqlite_cursor.fetchall()
+    answers = expand_answers(sqlite_conn, [(row[1], row[2]) for row in rows])
+    rows = [(question, answer, weight, source) for (question, _, _, weight, source), answer in zip(rows, answers)]
     
     if not rows:
         sqlite_conn.close()
@@ -143,13 +732,11 @@ def migrate_sqlite_to_postgres():
     
     # Insert data into PostgreSQL
     try:
-        for row in rows:
-            question, answer, weight, source = row
-            pg_cursor.execute('''
-                INSERT INTO knowledge (question, answer, weight, source)
-                VALUES (%s, %s, %s, %s)
-                ON CONFLICT (question) DO NOTHING
-            ''', (question, answer, weight, source))
+        execute_values(pg_cursor, '''
+            INSERT INTO knowledge (question, answer, weight, source)
+            VALUES %s
+            ON CONFLICT (question) DO NOTHING
+        ''', rows, page_size=SAVE_MANY_CHUNK_SIZE)
         
         pg_conn.commit()
         print(f"Successfully migrated {len(rows)} records from SQLite to PostgreSQL")
@@ -162,78 +749,149 @@ def migrate_sqlite_to_postgres():
         sqlite_conn.close()
         release_connection(pg_conn, True)
 
+# Insert or update by question in one statement. The row keeps its id and
+# created_at/created_by; modified_at is set by a trigger on PostgreSQL.
+UPSERT_SQLITE = """
+    INSERT INTO knowledge (question, answer, content_hash, weight, source, created_by, modified_by)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (question) DO UPDATE SET
+        answer = excluded.answer, content_hash = excluded.content_hash,
+        weight = excluded.weight, source = excluded.source,
+        modified_by = excluded.modified_by, modified_at = CURRENT_TIMESTAMP
+"""
+UPSERT_POSTGRES = """
+    INSERT INTO knowledge (question, answer, weight, source, created_by, modified_by)
+    VALUES %s
+    ON CONFLICT (question) DO UPDATE SET
+        answer = EXCLUDED.answer, weight = EXCLUDED.weight, source = EXCLUDED.source,
+        modified_by = EXCLUDED.modified_by
+"""
+
+def _upsert(cursor, is_postgres, rows, user):
+    if is_postgres:
+        values = [(question, answer, weight, source, user, user) for question, answer, weight, source in rows]
+        execute_values(cursor, UPSERT_POSTGRES, values, page_size=len(values))
+        return
+
+    # The full-text triggers decompress bodies
+    register_sqlite_functions(cursor.connection)
+
+    # Long answers go to knowledge_content; the row keeps a preview and the hash
+    values = []
+    bodies = {}
+    for question, answer, weight, source in rows:
+        hash_ = None
+        if isinstance(answer, str) and len(answer) > ANSWER_INLINE_LIMIT:
+            hash_ = answer_hash(answer)
+            bodies[hash_] = answer
+            answer = answer[:ANSWER_PREVIEW_CHARS]
+        values.append((question, answer, hash_, weight, source, user, user))
+
+    if bodies:
+        dict_id = _load_dictionaries(cursor)
+        _store_answers(cursor, bodies, dict_id)
+    replaced = {hash_ for (hash_,) in _select_in(
+        cursor,
+        "SELECT content_hash FROM knowledge WHERE content_hash IS NOT NULL AND question IN ({})",
+        [row[0] for row in rows]
+    )}
+    cursor.executemany(UPSERT_SQLITE, values)
+
+    # Drop bodies no row refers to any more
+    cursor.executemany(
+        "DELETE FROM knowledge_content WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM knowledge WHERE content_hash = ?)",
+        [(hash_, hash_) for hash_ in replaced - set(bodies)]
+    )
+    if bodies and HAS_ZSTD and dict_id is None:
+        _maybe_train_dictionary(cursor)
+
 def save_data(question, answer, weight, source, user="system"):
     """Save data to database with version control"""
-    conn, is_postgres = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        if is_postgres:
-            # Check if record exists
-            cursor.execute("SELECT id FROM knowledge WHERE question = %s", (question,))
-            record = cursor.fetchone()
-            
-            if record:
-                # Update existing record
-                cursor.execute(
-                    "UPDATE knowledge SET answer = %s, weight = %s, source = %s, modified_by = %s WHERE question = %s",
-                    (answer, weight, source, user, question)
-                )
-            else:
-                # Insert new record
-                cursor.execute(
-                    "INSERT INTO knowledge (question, answer, weight, source, created_by, modified_by) VALUES (%s, %s, %s, %s, %s, %s)",
-                    (question, answer, weight, source, user, user)
-                )
-        else:
-            # SQLite doesn't support the same level of constraint handling
-            # Delete existing record if it exists
-            cursor.execute("DELETE FROM knowledge WHERE question = ?", (question,))
-            
-            # Insert new record
-            cursor.execute(
-                "INSERT INTO knowledge (question, answer, weight, source, created_by, modified_by) VALUES (?, ?, ?, ?, ?, ?)",
-                (question, answer, weight, source, user, user)
-            )
-            
-        conn.commit()
-        return True
+        run_write(lambda cursor, is_postgres: _upsert(cursor, is_postgres, [(question, answer, weight, source)], user))
     except Exception as e:
         print(f"Error saving data: {e}")
-        conn.rollback()
         return False
-    finally:
-        release_connection(conn, is_postgres)
+
+    # Import here to avoid circular imports
+    from knowledge_store import knowledge_store
+    knowledge_store.note_write(question, answer, weight, source)
+    return True
+
+def save_many(rows, user="system", chunk_size=SAVE_MANY_CHUNK_SIZE):
+    """Upsert many (question, answer, weight, source) rows, one transaction per chunk.
+
+    Returns the number of rows saved; on error the failing chunk is rolled
+    back and the chunks committed before it are kept.
+    """
+    # The last row wins when a question repeats
+    rows = list({row[0]: row for row in rows}.values())
+
+    # Import here to avoid circular imports
+    from knowledge_store import knowledge_store
+
+    saved = 0
+    for offset in range(0, len(rows), chunk_size):
+        chunk = rows[offset:offset + chunk_size]
+        try:
+            run_write(lambda cursor, is_postgres: _upsert(cursor, is_postgres, chunk, user))
+        except Exception as e:
+            print(f"Error saving data: {e}")
+            break
+        saved += len(chunk)
+        for question, answer, weight, source in chunk:
+            knowledge_store.note_write(question, answer, weight, source)
+    return saved
 
 def load_data():
-    """Load all knowledge data from database"""
+    """Load all knowledge data, served from the process-wide knowledge store.
+
+    Returns a read-only mapping of question -> [{"answer", "weight", "source"}].
+    Only metadata is held in memory; answers are loaded on access.
+    """
+    # Import here to avoid circular imports
+    from knowledge_store import knowledge_store
+    return knowledge_store.load_data()
+
+KNOWLEDGE_FIELDS = ("id", "question", "answer", "weight", "source",
+                    "created_at", "created_by", "modified_at", "modified_by")
+
+def iter_knowledge(modified_since=None, chunk_size=1000):
+    """Yield knowledge rows as dicts without loading the whole table.
+
+    PostgreSQL reads through a server-side (named) cursor, SQLite steps its
+    cursor; either way at most chunk_size rows are held at once. With
+    modified_since only rows modified at or after it are returned.
+    """
     conn, is_postgres = get_connection()
     try:
-        cursor = conn.cursor()
-        
-        # For PostgreSQL, use parameterized placeholders with %s
+        if is_postgres:
+            cursor = conn.cursor(name="iter_knowledge")
+            cursor.itersize = chunk_size
+        else:
+            cursor = conn.cursor()
         placeholder = "%s" if is_postgres else "?"
-        
-        query = f"SELECT question, answer, weight, source FROM knowledge"
-        cursor.execute(query)
-        
-        rows = cursor.fetchall()
-        data = {}
-        
-        for question, answer, weight, source in rows:
-            if question not in data:
-                data[question] = []
-            data[question].append({
-                "answer": answer,
-                "weight": weight,
-                "source": source
-            })
-            
-        return data
-    except Exception as e:
-        print(f"Error loading data: {e}")
-        return {}
+        query = f"SELECT {', '.join(KNOWLEDGE_FIELDS)}, content_hash FROM knowledge"
+        params = ()
+        if modified_since is not None:
+            query += f" WHERE modified_at >= {placeholder}"
+            params = (modified_since,)
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            answer_index = KNOWLEDGE_FIELDS.index("answer")
+            answers = expand_answers(conn, [(row[answer_index], row[-1]) for row in rows])
+            for row, answer in zip(rows, answers):
+                item = dict(zip(KNOWLEDGE_FIELDS, row))
+                item["answer"] = answer
+                yield item
+        cursor.close()
     finally:
+        if is_postgres:
+            # End the read transaction the named cursor lived in
+            conn.rollback()
         release_connection(conn, is_postgres)
 
 def get_knowledge_history(question):
@@ -247,12 +905,13 @@ def get_knowledge_history(question):
         
         # The actual implementation would depend on how you track history
         # This is a simplified version that just returns the current state
-        query = f"SELECT answer, weight, source, created_at, created_by, modified_at, modified_by FROM knowledge WHERE question = {placeholder}"
+        query = f"SELECT answer, content_hash, weight, source, created_at, created_by, modified_at, modified_by FROM knowledge WHERE question = {placeholder}"
         cursor.execute(query, (question,))
         
         row = cursor.fetchone()
         if row:
-            answer, weight, source, created_at, created_by, modified_at, modified_by = row
+            answer, hash_, weight, source, created_at, created_by, modified_at, modified_by = row
+            answer = expand_answers(conn, [(answer, hash_)])[0]
             history.append({
                 "answer": answer,
                 "weight": weight,
@@ -270,38 +929,105 @@ def get_knowledge_history(question):
     finally:
         release_connection(conn, is_postgres)
 
-def search_knowledge(query, limit=10):
-    """Advanced search function with ranking"""
+def _fts_match_expression(query):
+    """Turn free text into an FTS5 OR-query of quoted terms"""
+    terms = re.findall(r"\w+", query.lower())
+    return " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+
+def _has_fts(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='knowledge_fts'")
+    return cursor.fetchone() is not None
+
+def full_text_search(query, limit=10):
+    """Ranked full-text search over questions and answers.
+
+    Returns dicts shaped like search_engine.search results for Elasticsearch:
+    question, answer, answer_snippet (matches wrapped in <em>), weight, source, score.
+    Relevance (BM25 on SQLite, ts_rank on PostgreSQL) is scaled by the stored weight.
+    """
     conn, is_postgres = get_connection()
     try:
         cursor = conn.cursor()
         
         if is_postgres:
-            # Full-text search with PostgreSQL
+            # Rank on the stored, GIN-indexed search_vector; ts_headline only
+            # re-parses the answers of the rows that survive the LIMIT
+            search_query = f"""
+                SELECT question, answer, NULL AS content_hash, weight, source,
+                       ts_headline('english', answer, query,
+                                   'StartSel=<em>, StopSel=</em>, MaxFragments=1, MaxWords=30, MinWords=10') AS snippet,
+                       score
+                FROM (
+                    SELECT question, answer, weight, source, query,
+                           ts_rank(search_vector, query) * (1 + {FTS_WEIGHT_BLEND} * COALESCE(weight, 0.5)) AS score
+                    FROM knowledge, plainto_tsquery('english', %s) AS query
+                    WHERE search_vector @@ query
+                    ORDER BY score DESC
+                    LIMIT %s
+                ) ranked
+                ORDER BY score DESC
+            """
+            cursor.execute(search_query, (query, limit))
+        elif _has_fts(cursor):
+            # snippet() reads answers through knowledge_text
+            register_sqlite_functions(conn)
+            match_expression = _fts_match_expression(query)
+            if not match_expression:
+                return []
+            # bm25() is lower-is-better, so negate it before blending
             search_query = f"""
-                SELECT question, answer, weight, source, 
-                       ts_rank(to_tsvector('english', question || ' ' || answer), plainto_tsquery('english', %s)) AS rank
-                FROM knowledge
-                WHERE to_tsvector('english', question || ' ' || answer) @@ plainto_tsquery('english', %s)
-                ORDER BY rank DESC
-                LIMIT %s
+                SELECT k.question, k.answer, k.content_hash, k.weight, k.source,
+                       snippet(knowledge_fts, 1, '<em>', '</em>', '...', 24) AS snippet,
+                       -bm25(knowledge_fts, {FTS_QUESTION_BOOST}, {FTS_ANSWER_BOOST})
+                           * (1 + {FTS_WEIGHT_BLEND} * COALESCE(k.weight, 0.5)) AS score
+                FROM knowledge_fts
+                JOIN knowledge k ON k.id = knowledge_fts.rowid
+                WHERE knowledge_fts MATCH ?
+                ORDER BY score DESC
+                LIMIT ?
             """
-            cursor.execute(search_query, (query, query, limit))
+            cursor.execute(search_query, (match_expression, limit))
         else:
-            # Basic search with SQLite
+            # SQLite without FTS5: unranked substring match over the full answers
+            register_sqlite_functions(conn)
             search_query = """
-                SELECT question, answer, weight, source
-                FROM knowledge
-                WHERE question LIKE ? OR answer LIKE ?
+                SELECT t.question, t.answer, NULL, k.weight, k.source, NULL AS snippet, COALESCE(k.weight, 0.5) AS score
+                FROM knowledge_text t
+                JOIN knowledge k ON k.id = t.id
+                WHERE t.question LIKE ? OR t.answer LIKE ?
+                ORDER BY score DESC
                 LIMIT ?
             """
             search_param = f"%{query}%"
             cursor.execute(search_query, (search_param, search_param, limit))
         
-        results = cursor.fetchall()
+        rows = cursor.fetchall()
+        answers = expand_answers(conn, [(row[1], row[2]) for row in rows])
+        results = []
+        for (question, _, _, weight, source, snippet, score), answer in zip(rows, answers):
+            if not snippet:
+                snippet = (answer or "")[:150] + "..."
+            results.append({
+                "question": question,
+                "answer": answer,
+                "answer_snippet": snippet,
+                "weight": weight,
+                "source": source,
+                "score": score
+            })
         return results
     except Exception as e:
         print(f"Search error: {e}")
         return []
     finally:
         release_connection(conn, is_postgres)
+
+def search_knowledge(query, limit=10):
+    """Advanced search function with ranking.
+
+    Returns (question, answer, weight, source) tuples, best match first.
+    """
+    return [
+        (result["question"], result["answer"], result["weight"], result["source"])
+        for result in full_text_search(query, limit)
+    ]
@@ -0,0 +1,65 @@
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+EMBEDDING_CACHE_PATH = 'embedding_cache.db'
+
+class EmbeddingCache:
+    """On-disk cache of text embeddings keyed by a hash of model name and text"""
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, model_name=""):
+        self.path = path
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                dim INTEGER,
+                vector BLOB
+            )
+        ''')
+        self._conn.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, texts):
+        """Return {text: vector} for the texts that are cached"""
+        keys = {self.key(text): text for text in texts}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, dim, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, dim, blob in rows:
+                    found[keys[key]] = np.frombuffer(blob, dtype=np.float32, count=dim).copy()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, vectors):
+        """Store {text: vector} pairs"""
+        rows = [
+            (self.key(text), int(vector.shape[0]), np.asarray(vector, dtype=np.float32).tobytes())
+            for text, vector in vectors.items()
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)", rows
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
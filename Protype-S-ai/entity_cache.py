@@ -0,0 +1,81 @@
+import json
+import hashlib
+import sqlite3
+import threading
+
+ENTITY_CACHE_PATH = 'entity_cache.db'
+
+class EntityCache:
+    """On-disk cache of spaCy named entities keyed by a hash of model name and text.
+
+    Lets the knowledge graph be rebuilt after a restart, or after an
+    unrelated field of a row changed, without running NER again.
+    """
+
+    def __init__(self, path=ENTITY_CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS entities (
+                key TEXT PRIMARY KEY,
+                entities TEXT
+            )
+        ''')
+        self._conn.commit()
+
+    @staticmethod
+    def model_name(nlp):
+        meta = getattr(nlp, "meta", {}) or {}
+        return f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}"
+
+    def key(self, model_name, text):
+        return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model_name, texts):
+        """Return {text: [(entity_text, label), ...]} for the texts that are cached"""
+        keys = {self.key(model_name, text): text for text in texts}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(key_list), 500):
+                chunk = key_list[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, entities FROM entities WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+                for key, entities in rows:
+                    found[keys[key]] = [tuple(entity) for entity in json.loads(entities)]
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model_name, entities):
+        """Store {text: [(entity_text, label), ...]} pairs"""
+        rows = [(self.key(model_name, text), json.dumps(ents)) for text, ents in entities.items()]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO entities (key, entities) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def extract(self, nlp, texts, batch_size=64):
+        """Entities for each text, running nlp.pipe only on uncached texts"""
+        model_name = self.model_name(nlp)
+        found = self.get_many(model_name, texts)
+        pending = [text for text in dict.fromkeys(texts) if text not in found]
+
+        computed = {}
+        for text, doc in zip(pending, nlp.pipe(pending, batch_size=batch_size)):
+            computed[text] = [(ent.text, ent.label_) for ent in doc.ents]
+        self.put_many(model_name, computed)
+        found.update(computed)
+
+        return [found[text] for text in texts]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
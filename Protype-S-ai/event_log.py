@@ -0,0 +1,179 @@
+import os
+import json
+import atexit
+import sqlite3
+import datetime
+import threading
+
+EVENT_LOG_PATH = os.environ.get('EVENT_LOG_PATH', 'events.db')
+
+# Buffered events are written at least this often (seconds) or once this many are queued
+FLUSH_INTERVAL = 1.0
+FLUSH_BATCH_SIZE = 200
+
+# Legacy JSON files imported once on first use: (path, log name, list key)
+LEGACY_LOGS = [
+    ("learning_logs.json", "learning", "logs"),
+    ("user_actions.json", "actions", "actions"),
+]
+
+class EventLog:
+    """Append-only activity log in an SQLite ``events`` table.
+
+    Replaces rewriting whole JSON files on every entry: appends are queued
+    and written in batches by a background thread, and readers query by
+    log name and time through an index instead of loading the full history.
+    Entries keep the shape of the old JSON records.
+    """
+
+    def __init__(self, path=EVENT_LOG_PATH, flush_interval=FLUSH_INTERVAL, legacy_logs=LEGACY_LOGS):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.legacy_logs = legacy_logs
+        self._conn = None
+        self._lock = threading.RLock()
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    def connection(self):
+        """Open the database on first use and import legacy JSON logs"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+                # WAL lets the web app, the learning loop and Celery workers append concurrently
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS events (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        log TEXT NOT NULL,
+                        timestamp TEXT NOT NULL,
+                        data TEXT NOT NULL
+                    )
+                ''')
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_events_log_timestamp ON events (log, timestamp)")
+                self._conn.commit()
+                for legacy_path, log, key in self.legacy_logs:
+                    self.import_json(legacy_path, log, key)
+            return self._conn
+
+    def append(self, log, entry):
+        """Queue an entry (a dict with an ISO 'timestamp') for the background flusher"""
+        entry = dict(entry)
+        entry.setdefault("timestamp", datetime.datetime.now().isoformat())
+        with self._lock:
+            self._pending.append((log, entry["timestamp"], json.dumps(entry)))
+            if self._flusher is None or not self._flusher.is_alive():
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+                # The flusher is a daemon thread; write what is left at exit
+                atexit.register(self.flush)
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._wakeup.set()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write all queued entries in one transaction"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            rows, self._pending = self._pending, []
+            try:
+                conn = self.connection()
+                conn.executemany("INSERT INTO events (log, timestamp, data) VALUES (?, ?, ?)", rows)
+                conn.commit()
+            except Exception as e:
+                print(f"Error writing event log: {e}")
+                # Keep the entries for the next attempt
+                self._pending = rows + self._pending
+                return 0
+            return len(rows)
+
+    def _query(self, sql, params):
+        # Readers see this process's queued entries too
+        self.flush()
+        with self._lock:
+            return self.connection().execute(sql, params).fetchall()
+
+    def recent(self, log, limit=10):
+        """Last `limit` entries of a log, oldest first"""
+        rows = self._query("SELECT data FROM events WHERE log = ? ORDER BY id DESC LIMIT ?", (log, limit))
+        return [json.loads(data) for (data,) in reversed(rows)]
+
+    def between(self, log, start=None, end=None, limit=None):
+        """Entries with start <= timestamp < end (ISO strings or datetimes), oldest first"""
+        sql = "SELECT data FROM events WHERE log = ?"
+        params = [log]
+        if start is not None:
+            sql += " AND timestamp >= ?"
+            params.append(start.isoformat() if hasattr(start, "isoformat") else start)
+        if end is not None:
+            sql += " AND timestamp < ?"
+            params.append(end.isoformat() if hasattr(end, "isoformat") else end)
+        sql += " ORDER BY timestamp, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [json.loads(data) for (data,) in self._query(sql, params)]
+
+    def daily_counts(self, log, field, start=None):
+        """{date: {value of field: count}} aggregated in SQL"""
+        if not field.isidentifier():
+            raise ValueError(f"Invalid field name: {field}")
+        sql = f'''
+            SELECT substr(timestamp, 1, 10), json_extract(data, '$.{field}'), COUNT(*)
+            FROM events WHERE log = ?{" AND timestamp >= ?" if start is not None else ""}
+            GROUP BY 1, 2
+        '''
+        params = [log]
+        if start is not None:
+            params.append(start.isoformat() if hasattr(start, "isoformat") else start)
+
+        counts = {}
+        for date, value, count in self._query(sql, params):
+            counts.setdefault(date, {})[value if value is not None else "unknown"] = count
+        return counts
+
+    def count(self, log):
+        return self._query("SELECT COUNT(*) FROM events WHERE log = ?", (log,))[0][0]
+
+    def import_json(self, path, log, key):
+        """One-time migration of a legacy {key: [entries]} JSON log"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r') as f:
+                entries = json.load(f).get(key, [])
+            rows = [(log, entry.get("timestamp", ""), json.dumps(entry)) for entry in entries]
+            self._conn.executemany("INSERT INTO events (log, timestamp, data) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            os.replace(path, path + ".migrated")
+            print(f"Migrated {len(rows)} entries from {path}")
+            return len(rows)
+        except Exception as e:
+            print(f"Error migrating {path}: {e}")
+            return 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def log_action(user, action, description, timestamp=None):
+    """Record a user action (the entries behind the dashboard activity feed)"""
+    event_log.append("actions", {
+        "timestamp": timestamp or datetime.datetime.now().isoformat(),
+        "user": user,
+        "action": action,
+        "description": description
+    })
+
+# Create singleton instance
+event_log = EventLog()
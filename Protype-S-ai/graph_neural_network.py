@@ -7,6 +7,28 @@ import numpy as np
 from torch_geometric.nn import GCNConv
 from torch_geometric.data import Data
 
+try:
+    import faiss
+    HAS_FAISS = True
+except ImportError:
+    HAS_FAISS = False
+
+# Graphs with more edges than this are trained in mini-batches of edges,
+# each over a neighbour-sampled 2-hop subgraph (one hop per GCN layer).
+# Full-batch is faster per epoch; mini-batches bound memory on huge graphs.
+MINI_BATCH_EDGES = 1000000
+EDGE_BATCH_SIZE = 8192
+NUM_NEIGHBORS = [15, 10]
+
+# Inference: candidates per node, rows per similarity block, and the group
+# size above which an approximate FAISS HNSW index replaces exact blocks
+INFER_TOP_K = 10
+SIMILARITY_BLOCK_SIZE = 2048
+FAISS_MIN_NODES = 50000
+
+# Node type pairs that inference may connect
+INFERABLE_TYPES = ['entity', 'question']
+
 class KnowledgeGNN:
     def __init__(self, knowledge_graph=None):
         """Initialize Knowledge Graph Neural Network"""
@@ -16,6 +38,7 @@ class KnowledgeGNN:
         self.reverse_mapping = {}  # Maps indices to node names
         self.model = None
         self.embeddings = None
+        self.normalized_embeddings = None  # unit rows as float32 numpy, for similarity search
         
     def prepare_graph_data(self):
         """Convert NetworkX graph to PyTorch Geometric data format"""
@@ -23,29 +46,27 @@ class KnowledgeGNN:
             return None
             
         # Create node mappings
-        for i, node in enumerate(self.knowledge_graph.nodes()):
-            self.node_mapping[node] = i
-            self.reverse_mapping[i] = node
+        self.node_mapping = {node: i for i, node in enumerate(self.knowledge_graph.nodes())}
+        self.reverse_mapping = {i: node for node, i in self.node_mapping.items()}
             
         # Prepare edge index
-        edge_index = []
-        for source, target in self.knowledge_graph.edges():
-            edge_index.append([self.node_mapping[source], self.node_mapping[target]])
+        edge_index = [
+            (self.node_mapping[source], self.node_mapping[target])
+            for source, target in self.knowledge_graph.edges()
+        ]
             
         # Convert to tensor
-        edge_index = torch.tensor(edge_index, dtype=torch.long).t().contiguous()
+        edge_index = torch.tensor(edge_index, dtype=torch.long).reshape(-1, 2).t().contiguous()
         
         # Create node features (one-hot encoding of node type)
         node_types = ['question', 'answer', 'entity', 'source', 'unknown']
         type_to_idx = {t: i for i, t in enumerate(node_types)}
         
-        # Default features
-        x = torch.zeros((len(self.knowledge_graph.nodes()), len(node_types)), dtype=torch.float)
-        
-        for node, idx in self.node_mapping.items():
-            node_type = self.knowledge_graph.nodes[node].get('type', 'unknown')
-            type_idx = type_to_idx.get(node_type, type_to_idx['unknown'])
-            x[idx, type_idx] = 1.0
+        type_index = torch.tensor([
+            type_to_idx.get(self.knowledge_graph.nodes[node].get('type', 'unknown'), type_to_idx['unknown'])
+            for node in self.node_mapping
+        ], dtype=torch.long)
+        x = F.one_hot(type_index, len(node_types)).float()
             
         return Data(x=x, edge_index=edge_index)
         
@@ -68,8 +89,79 @@ class KnowledgeGNN:
                 
         self.model = GCN(num_features, hidden_channels).to(self.device)
         
-    def train(self, epochs=100, lr=0.01):
-        """Train the GNN model"""
+    def sample_negative_edges(self, edge_index, num_nodes, num_samples):
+        """Random node pairs that are not edges of the graph, as a [2, n] tensor"""
+        device = edge_index.device
+        if num_samples <= 0 or num_nodes == 0:
+            return torch.empty((2, 0), dtype=torch.long, device=device)
+        
+        candidates = torch.randint(0, num_nodes, (2, num_samples), device=device)
+        
+        # Encode (u, v) pairs as u * n + v to test membership in one op
+        edge_keys = edge_index[0] * num_nodes + edge_index[1]
+        candidate_keys = candidates[0] * num_nodes + candidates[1]
+        return candidates[:, ~torch.isin(candidate_keys, edge_keys)]
+    
+    def sample_subgraph(self, seeds, edge_index, num_nodes, num_neighbors=NUM_NEIGHBORS):
+        """Sample up to num_neighbors[i] incoming edges per node at hop i.
+        
+        Returns (subset, sub_edge_index, position): the sampled nodes, their
+        edges relabelled to rows of subset, and a global id -> row lookup
+        (-1 for nodes not sampled). Capping the fan-out keeps batches small even around hub nodes
+        such as sources, where a full 2-hop neighbourhood is most of the graph.
+        """
+        device = edge_index.device
+        source, target = edge_index
+        frontier = seeds
+        visited = torch.zeros(num_nodes, dtype=torch.bool, device=device)
+        visited[seeds] = True
+        sampled = []
+        
+        for fanout in num_neighbors:
+            # Incoming edges of the frontier, in random order within each target
+            candidates = torch.isin(target, frontier).nonzero().flatten()
+            if candidates.numel() == 0:
+                break
+            candidates = candidates[torch.randperm(candidates.numel(), device=device)]
+            candidates = candidates[torch.argsort(target[candidates], stable=True)]
+            
+            # Rank of each edge within its target's group; keep the first fanout
+            group_target = target[candidates]
+            is_start = torch.ones_like(group_target, dtype=torch.bool)
+            is_start[1:] = group_target[1:] != group_target[:-1]
+            group_start = torch.cummax(torch.where(
+                is_start, torch.arange(group_target.numel(), device=device), torch.zeros_like(group_target)), 0).values
+            rank = torch.arange(group_target.numel(), device=device) - group_start
+            edges = candidates[rank < fanout]
+            sampled.append(edges)
+            
+            # Next hop expands from sources not seen yet
+            new_nodes = source[edges].unique()
+            frontier = new_nodes[~visited[new_nodes]]
+            visited[frontier] = True
+            
+        subset = visited.nonzero().flatten()
+        position = torch.full((num_nodes,), -1, dtype=torch.long, device=device)
+        position[subset] = torch.arange(subset.numel(), device=device)
+        edges = torch.cat(sampled) if sampled else torch.empty(0, dtype=torch.long, device=device)
+        return subset, position[edge_index[:, edges]], position
+    
+    def link_loss(self, out, pos_edge_index, neg_edge_index):
+        """Pull embeddings of linked nodes together and push sampled non-links apart"""
+        pos_similarity = F.cosine_similarity(out[pos_edge_index[0]], out[pos_edge_index[1]])
+        neg_similarity = F.cosine_similarity(out[neg_edge_index[0]], out[neg_edge_index[1]])
+        
+        # Summed per-pair squared error, as in the original per-edge loop
+        return F.mse_loss(pos_similarity, torch.ones_like(pos_similarity), reduction='sum') + \
+            F.mse_loss(neg_similarity, torch.zeros_like(neg_similarity), reduction='sum')
+        
+    def train(self, epochs=100, lr=0.01, batch_size=None):
+        """Train the GNN model.
+        
+        Small graphs are trained full-batch. Larger ones (or any graph when
+        batch_size is given) are trained on batches of edges, running the
+        model only on a neighbour-sampled subgraph around each batch.
+        """
         if not self.model:
             self.build_model()
             
@@ -79,97 +171,152 @@ class KnowledgeGNN:
             
         # Move data to device
         data = data.to(self.device)
+        num_nodes = data.num_nodes
+        num_edges = data.edge_index.size(1)
+        if batch_size is None and num_edges > MINI_BATCH_EDGES:
+            batch_size = EDGE_BATCH_SIZE
         
         # Set up training
         optimizer = torch.optim.Adam(self.model.parameters(), lr=lr, weight_decay=5e-4)
-        criterion = nn.MSELoss()
         
         # Train model
         self.model.train()
         for epoch in range(epochs):
-            optimizer.zero_grad()
-            out = self.model(data.x, data.edge_index)
-            
-            # Self-supervised loss: similar nodes should have similar embeddings
-            loss = 0
-            for (u, v) in self.knowledge_graph.edges():
-                u_idx = self.node_mapping[u]
-                v_idx = self.node_mapping[v]
-                
-                # Edge prediction loss
-                similarity = F.cosine_similarity(out[u_idx].unsqueeze(0), out[v_idx].unsqueeze(0))
-                loss += criterion(similarity, torch.tensor([1.0], device=self.device))
+            if batch_size is None:
+                optimizer.zero_grad()
+                out = self.model(data.x, data.edge_index)
                 
-            # Add random negative samples
-            for _ in range(len(self.knowledge_graph.edges()) // 2):
-                u_idx = np.random.randint(0, len(self.node_mapping))
-                v_idx = np.random.randint(0, len(self.node_mapping))
+                # Self-supervised loss: similar nodes should have similar embeddings
+                neg_edge_index = self.sample_negative_edges(data.edge_index, num_nodes, num_edges // 2)
+                loss = self.link_loss(out, data.edge_index, neg_edge_index)
                 
-                if not self.knowledge_graph.has_edge(self.reverse_mapping[u_idx], self.reverse_mapping[v_idx]):
-                    similarity = F.cosine_similarity(out[u_idx].unsqueeze(0), out[v_idx].unsqueeze(0))
-                    loss += criterion(similarity, torch.tensor([0.0], device=self.device))
-            
-            loss.backward()
-            optimizer.step()
+                loss.backward()
+                optimizer.step()
+                epoch_loss = loss.item()
+            else:
+                epoch_loss = 0.0
+                permutation = torch.randperm(num_edges, device=self.device)
+                for start in range(0, num_edges, batch_size):
+                    optimizer.zero_grad()
+                    pos_edge_index = data.edge_index[:, permutation[start:start + batch_size]]
+                    neg_edge_index = self.sample_negative_edges(
+                        data.edge_index, num_nodes, pos_edge_index.size(1) // 2)
+                    
+                    # Embed the batch's nodes from a sampled 2-hop neighbourhood
+                    seeds = torch.cat([pos_edge_index.flatten(), neg_edge_index.flatten()]).unique()
+                    subset, sub_edge_index, position = self.sample_subgraph(seeds, data.edge_index, num_nodes)
+                    out = self.model(data.x[subset], sub_edge_index)
+                    
+                    loss = self.link_loss(out, position[pos_edge_index], position[neg_edge_index])
+                    
+                    loss.backward()
+                    optimizer.step()
+                    epoch_loss += loss.item()
             
             if (epoch + 1) % 20 == 0:
-                print(f'Epoch {epoch+1}/{epochs}, Loss: {loss.item():.4f}')
+                print(f'Epoch {epoch+1}/{epochs}, Loss: {epoch_loss:.4f}')
                 
         # Generate and store node embeddings
         self.model.eval()
         with torch.no_grad():
             self.embeddings = self.model(data.x, data.edge_index)
+        self.normalized_embeddings = F.normalize(self.embeddings, dim=1).cpu().numpy().astype('float32')
             
         return True
     
     def find_related_concepts(self, concept, top_k=5):
         """Find concepts related to the given concept using GNN embeddings"""
-        if concept not in self.node_mapping or self.embeddings is None:
+        if concept not in self.node_mapping or self.normalized_embeddings is None:
             return []
             
         concept_idx = self.node_mapping[concept]
-        concept_embedding = self.embeddings[concept_idx]
-        
-        # Calculate similarities
-        similarities = []
-        for node, idx in self.node_mapping.items():
-            if node != concept:
-                node_embedding = self.embeddings[idx]
-                similarity = F.cosine_similarity(concept_embedding.unsqueeze(0), node_embedding.unsqueeze(0))
-                similarities.append((node, similarity.item()))
-                
-        # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        similarities = self.normalized_embeddings @ self.normalized_embeddings[concept_idx]
+        similarities[concept_idx] = -np.inf
+        
+        top = self.top_k_indices(similarities[np.newaxis, :], top_k)[0]
+        return [(self.reverse_mapping[int(idx)], float(similarities[idx])) for idx in top]
+    
+    @staticmethod
+    def top_k_indices(scores, k):
+        """Column indices of the k highest scores in each row, best first"""
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return np.zeros((scores.shape[0], 0), dtype=np.int64)
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+    
+    def similar_pairs(self, vectors, k, use_faiss=None):
+        """Top-k most similar other rows for every row of unit vectors.
         
-        return similarities[:top_k]
+        Returns (neighbors, scores), each of shape [n, k]. Exact blocked
+        matrix products by default; a FAISS HNSW inner-product index for
+        very large groups.
+        """
+        n = vectors.shape[0]
+        k = min(k, n - 1)
+        if use_faiss is None:
+            use_faiss = HAS_FAISS and n >= FAISS_MIN_NODES
+            
+        if use_faiss:
+            index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            index.add(vectors)
+            scores, neighbors = index.search(vectors, k + 1)
+            # Drop each row's match with itself (or the weakest extra match)
+            keep = neighbors != np.arange(n)[:, np.newaxis]
+            keep[keep.sum(axis=1) > k, -1] = False
+            return neighbors[keep].reshape(n, k), scores[keep].reshape(n, k)
+            
+        neighbors = np.zeros((n, k), dtype=np.int64)
+        scores = np.zeros((n, k), dtype=np.float32)
+        for start in range(0, n, SIMILARITY_BLOCK_SIZE):
+            block = vectors[start:start + SIMILARITY_BLOCK_SIZE] @ vectors.T
+            rows = np.arange(block.shape[0])
+            block[rows, rows + start] = -np.inf
+            top = self.top_k_indices(block, k)
+            neighbors[start:start + block.shape[0]] = top
+            scores[start:start + block.shape[0]] = np.take_along_axis(block, top, axis=1)
+        return neighbors, scores
     
-    def infer_new_knowledge(self, threshold=0.7):
-        """Infer new knowledge edges that are not explicitly in the graph"""
-        if self.embeddings is None:
+    def infer_new_knowledge(self, threshold=0.7, top_k=INFER_TOP_K, use_faiss=None):
+        """Infer new knowledge edges that are not explicitly in the graph.
+        
+        Each entity (or question) is compared with the other nodes of its
+        type, and up to top_k of its most similar unconnected ones above
+        threshold are suggested.
+        """
+        if self.normalized_embeddings is None:
             return []
             
         inferred_edges = []
         
-        # Check pairs of nodes that aren't directly connected
-        for node1, idx1 in self.node_mapping.items():
-            for node2, idx2 in self.node_mapping.items():
-                if node1 != node2 and not self.knowledge_graph.has_edge(node1, node2):
-                    # If they're both entities, check similarity
-                    node1_type = self.knowledge_graph.nodes[node1].get('type', 'unknown')
-                    node2_type = self.knowledge_graph.nodes[node2].get('type', 'unknown')
-                    
-                    # Only infer certain types of connections
-                    if (node1_type == 'entity' and node2_type == 'entity') or \
-                       (node1_type == 'question' and node2_type == 'question'):
-                        
-                        # Calculate similarity
-                        node1_embedding = self.embeddings[idx1]
-                        node2_embedding = self.embeddings[idx2]
-                        similarity = F.cosine_similarity(node1_embedding.unsqueeze(0), node2_embedding.unsqueeze(0))
-                        
-                        # If similarity is high enough, suggest a new edge
-                        if similarity.item() > threshold:
-                            inferred_edges.append((node1, node2, similarity.item()))
+        # Only infer certain types of connections
+        node_types = {node: data.get('type', 'unknown') for node, data in self.knowledge_graph.nodes(data=True)}
+        for node_type in INFERABLE_TYPES:
+            group = np.array([idx for node, idx in self.node_mapping.items() if node_types.get(node) == node_type],
+                             dtype=np.int64)
+            if len(group) < 2:
+                continue
+                
+            # Over-fetch so candidates that are already edges can be dropped
+            neighbors, scores = self.similar_pairs(
+                np.ascontiguousarray(self.normalized_embeddings[group]), top_k + 1, use_faiss)
+            
+            above = scores > threshold
+            for row in np.nonzero(above.any(axis=1))[0]:
+                node1 = self.reverse_mapping[int(group[row])]
+                added = 0
+                for col in np.nonzero(above[row])[0]:
+                    node2 = self.reverse_mapping[int(group[neighbors[row, col]])]
+                    if self.knowledge_graph.has_edge(node1, node2):
+                        continue
+                    inferred_edges.append((node1, node2, float(scores[row, col])))
+                    added += 1
+                    if added >= top_k:
+                        break
                             
         # Sort by similarity score
         inferred_edges.sort(key=lambda x: x[2], reverse=True)
@@ -4,7 +4,9 @@ import networkx as nx
 import spacy
 import json
 import numpy as np
-from database import get_connection, release_connection
+from database import load_data
+from knowledge_store import knowledge_store
+from entity_cache import EntityCache
 
 # Load spaCy model
 try:
@@ -35,48 +37,20 @@ class KnowledgeGraph:
             'concept': 'purple',
             'inferred': 'orange'
         }
+        self.sync_cursor = None  # knowledge_store position the graph reflects
+        self.entity_cache = None
     
     def build_from_database(self):
         """Build knowledge graph from database"""
         self.graph = nx.DiGraph()
         
         try:
-            # Get connection
-            conn, is_postgres = get_connection()
-            cursor = conn.cursor()
+            # Rows written after this point are picked up by update_from_database
+            self.sync_cursor = knowledge_store.cursor()
             
-            # Get all questions and answers
-            cursor.execute("SELECT question, answer, source FROM knowledge")
-            data = cursor.fetchall()
-            
-            # Release connection
-            release_connection(conn, is_postgres)
-            
-            # Process data and build graph
-            for question, answer, source in data:
-                # Add question node
-                self.graph.add_node(question, type="question")
-                
-                # Process with spaCy to extract entities
-                doc = nlp(answer)
-                
-                # Add entities as nodes
-                for ent in doc.ents:
-                    entity_text = ent.text
-                    entity_type = ent.label_
-                    
-                    if not self.graph.has_node(entity_text):
-                        self.graph.add_node(entity_text, type="entity", entity_type=entity_type)
-                    
-                    # Connect question to entity
-                    self.graph.add_edge(question, entity_text, relation="contains")
-                    
-                # Add source as node
-                if not self.graph.has_node(source):
-                    self.graph.add_node(source, type="source")
-                
-                # Connect question to source
-                self.graph.add_edge(question, source, relation="from")
+            # Get all questions and answers from the knowledge store
+            data = load_data()
+            self.add_rows(list(data.items()))
                 
             print(f"Built knowledge graph with {self.graph.number_of_nodes()} nodes and {self.graph.number_of_edges()} edges")
             return True
@@ -84,6 +58,81 @@ class KnowledgeGraph:
             print(f"Error building knowledge graph: {e}")
             return False
     
+    def update_from_database(self):
+        """Apply only rows added, changed or deleted since the last build or update"""
+        if self.sync_cursor is None:
+            return self.build_from_database()
+            
+        try:
+            cursor, changed = knowledge_store.changes_since(self.sync_cursor)
+            if changed is None:
+                return self.build_from_database()
+            if changed:
+                data = load_data()
+                for question in changed:
+                    self.remove_question(question, keep_node=question in data)
+                self.add_rows([(question, data[question]) for question in changed if question in data])
+            self.sync_cursor = cursor
+            return True
+        except Exception as e:
+            print(f"Error updating knowledge graph: {e}")
+            return False
+    
+    def extract_entities(self, texts):
+        """Named entities for each text, cached on disk across restarts"""
+        if self.entity_cache is None:
+            self.entity_cache = EntityCache()
+        return self.entity_cache.extract(nlp, texts)
+    
+    def add_rows(self, rows):
+        """Add (question, answers) rows, running NER only on answers not seen before"""
+        answers = [row_answers[0]["answer"] or "" for _, row_answers in rows]
+        
+        # Process with spaCy to extract entities
+        for (question, row_answers), entities in zip(rows, self.extract_entities(answers)):
+            source = row_answers[0]["source"]
+            # Add question node
+            self.graph.add_node(question, type="question")
+            
+            # Add entities as nodes
+            for entity_text, entity_type in entities:
+                if not self.graph.has_node(entity_text):
+                    self.graph.add_node(entity_text, type="entity", entity_type=entity_type)
+                
+                # Connect question to entity
+                self.graph.add_edge(question, entity_text, relation="contains")
+                
+            # Add source as node
+            if not self.graph.has_node(source):
+                self.graph.add_node(source, type="source")
+            
+            # Connect question to source
+            self.graph.add_edge(question, source, relation="from")
+    
+    def remove_question(self, question, keep_node=False):
+        """Remove a question's entity and source edges, pruning nodes left unconnected.
+        
+        With keep_node the question node and its inferred edges stay, for
+        rows that are about to be re-added with a new answer.
+        """
+        if question not in self.graph:
+            return
+            
+        targets = [
+            target for target, edge_data in self.graph[question].items()
+            if edge_data.get('relation') in ('contains', 'from')
+        ]
+        if keep_node:
+            self.graph.remove_edges_from((question, target) for target in targets)
+        else:
+            targets = list(self.graph.successors(question)) + list(self.graph.predecessors(question))
+            self.graph.remove_node(question)
+            
+        for target in targets:
+            if target in self.graph and self.graph.degree(target) == 0 and \
+               self.graph.nodes[target].get('type') in ('entity', 'source'):
+                self.graph.remove_node(target)
+    
     def add_inferred_edge(self, source, target, confidence, max_inferred=30):
         """Add inferred edge to the graph with limits to avoid noise"""
         # Count existing inferred edges
@@ -0,0 +1,310 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import database
+
+# Upper bound for answer text kept in memory (bytes); metadata is always resident
+MAX_CACHED_ANSWER_BYTES = int(os.environ.get('KNOWLEDGE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+# Minimum seconds between checks for rows written by other processes (e.g. Celery workers)
+SYNC_INTERVAL = float(os.environ.get('KNOWLEDGE_SYNC_INTERVAL', 2.0))
+
+# Full metadata reload interval, catches rows deleted by other processes
+FULL_RESYNC_INTERVAL = float(os.environ.get('KNOWLEDGE_FULL_RESYNC_INTERVAL', 300.0))
+
+# Number of answers fetched per query when iterating over the whole store
+FETCH_CHUNK_SIZE = 500
+
+class KnowledgeView(Mapping):
+    """Read-only mapping with the same shape as database.load_data() results.
+
+    Keys come from an in-memory snapshot; answer bodies are fetched lazily
+    through the store's bounded answer cache.
+    """
+
+    def __init__(self, store, entries):
+        self._store = store
+        self._entries = entries
+
+    def __getitem__(self, question):
+        weight, source, _ = self._entries[question]
+        answer = self._store.get_answer(question)
+        return [{"answer": answer, "weight": weight, "source": source}]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, question):
+        return question in self._entries
+
+    def items(self):
+        """Iterate over (question, answers) fetching answer bodies in chunks"""
+        questions = list(self._entries)
+        for start in range(0, len(questions), FETCH_CHUNK_SIZE):
+            chunk = questions[start:start + FETCH_CHUNK_SIZE]
+            answers = self._store.get_answers(chunk)
+            for question in chunk:
+                weight, source, _ = self._entries[question]
+                yield question, [{"answer": answers.get(question), "weight": weight, "source": source}]
+
+    def values(self):
+        for _, answers in self.items():
+            yield answers
+
+class KnowledgeStore:
+    def __init__(self, max_answer_bytes=MAX_CACHED_ANSWER_BYTES, sync_interval=SYNC_INTERVAL):
+        self.max_answer_bytes = max_answer_bytes
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._write_listeners = []
+        self._epoch = 0
+        self.reset()
+
+    def reset(self):
+        """Drop all cached state; the next read reloads from the database"""
+        with self._lock:
+            self._entries = {}  # question -> (weight, source, modified_at)
+            self._answers = OrderedDict()  # LRU of question -> answer
+            self._answer_bytes = 0
+            self._snapshot = None
+            self._high_water_mark = None
+            self._loaded = False
+            self._last_sync = 0.0
+            self._last_full_sync = 0.0
+            self._change_log = OrderedDict()  # question -> sequence number, oldest change first
+            self._sequence = 0
+            self._epoch += 1
+            self.stats = {"full_loads": 0, "incremental_syncs": 0, "synced_rows": 0,
+                          "answer_hits": 0, "answer_misses": 0}
+
+    def invalidate(self):
+        """Force a full metadata reload on the next read"""
+        with self._lock:
+            self._loaded = False
+
+    def refresh(self, force=False):
+        """Bring the store up to date with rows changed since the last sync"""
+        now = time.monotonic()
+        if not force and self._loaded and now - self._last_sync < self.sync_interval:
+            return
+
+        with self._lock:
+            if not self._loaded or now - self._last_full_sync >= FULL_RESYNC_INTERVAL:
+                self._full_load()
+            elif self._high_water_mark is not None:
+                self._incremental_sync()
+            else:
+                self._full_load()
+            self._last_sync = now
+
+    def _full_load(self):
+        conn, is_postgres = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT question, weight, source, modified_at FROM knowledge")
+            rows = cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading knowledge store: {e}")
+            return
+        finally:
+            database.release_connection(conn, is_postgres)
+
+        entries = {}
+        high_water_mark = None
+        for question, weight, source, modified_at in rows:
+            entries[question] = (weight, source, modified_at)
+            if modified_at is not None and (high_water_mark is None or modified_at > high_water_mark):
+                high_water_mark = modified_at
+
+        # Answers may have changed while we were not looking
+        for question in list(self._answers):
+            previous = self._entries.get(question)
+            current = entries.get(question)
+            if current is None or previous is None or current[2] != previous[2]:
+                self._evict_answer(question)
+        
+        for question, entry in entries.items():
+            if self._entries.get(question) != entry:
+                self._record_change(question)
+        for question in self._entries:
+            if question not in entries:
+                self._record_change(question)
+
+        self._entries = entries
+        self._snapshot = None
+        self._high_water_mark = high_water_mark
+        self._loaded = True
+        self._last_full_sync = time.monotonic()
+        self.stats["full_loads"] += 1
+
+    def _incremental_sync(self):
+        conn, is_postgres = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholder = "%s" if is_postgres else "?"
+            # >= because modified_at has one-second resolution on SQLite
+            cursor.execute(
+                f"SELECT question, weight, source, modified_at FROM knowledge WHERE modified_at >= {placeholder}",
+                (self._high_water_mark,)
+            )
+            rows = cursor.fetchall()
+        except Exception as e:
+            print(f"Error syncing knowledge store: {e}")
+            return
+        finally:
+            database.release_connection(conn, is_postgres)
+
+        for question, weight, source, modified_at in rows:
+            previous = self._entries.get(question)
+            if previous == (weight, source, modified_at):
+                continue
+            self._entries[question] = (weight, source, modified_at)
+            self._evict_answer(question)
+            self._record_change(question)
+            self._snapshot = None
+            if modified_at is not None and modified_at > self._high_water_mark:
+                self._high_water_mark = modified_at
+            self.stats["synced_rows"] += 1
+
+        self.stats["incremental_syncs"] += 1
+
+    def _record_change(self, question):
+        self._sequence += 1
+        self._change_log[question] = self._sequence
+        self._change_log.move_to_end(question)
+
+    def cursor(self):
+        """Opaque position in the change log, for use with changes_since"""
+        self.refresh()
+        with self._lock:
+            return (self._epoch, self._sequence)
+
+    def changes_since(self, cursor):
+        """Return (new_cursor, questions) for rows added, changed or deleted after cursor.
+
+        questions is None when the store was reset since cursor was taken;
+        the caller should then rebuild from load_data().
+        """
+        self.refresh()
+        with self._lock:
+            current = (self._epoch, self._sequence)
+            if cursor is None or cursor[0] != self._epoch:
+                return current, None
+            changed = []
+            for question, sequence in reversed(self._change_log.items()):
+                if sequence <= cursor[1]:
+                    break
+                changed.append(question)
+            changed.reverse()
+            return current, changed
+
+    def add_write_listener(self, callback):
+        """Register callback(question, answer, weight, source) to run after each save_data"""
+        if callback not in self._write_listeners:
+            self._write_listeners.append(callback)
+
+    def remove_write_listener(self, callback):
+        if callback in self._write_listeners:
+            self._write_listeners.remove(callback)
+
+    def note_write(self, question, answer, weight, source):
+        """Write-through hook called by database.save_data after a commit"""
+        with self._lock:
+            if self._loaded:
+                previous = self._entries.get(question)
+                # Keep the previous modified_at so the next sync re-checks the row
+                self._entries[question] = (weight, source, previous[2] if previous else None)
+                self._snapshot = None
+                self._evict_answer(question)
+                self._cache_answer(question, answer)
+                self._record_change(question)
+
+        for callback in list(self._write_listeners):
+            try:
+                callback(question, answer, weight, source)
+            except Exception as e:
+                print(f"Error in knowledge write listener: {e}")
+
+    def load_data(self):
+        """Return a KnowledgeView over the current knowledge base"""
+        self.refresh()
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = KnowledgeView(self, dict(self._entries))
+            return self._snapshot
+
+    def get_answer(self, question):
+        """Return the answer for a question, using the bounded LRU cache"""
+        with self._lock:
+            if question in self._answers:
+                self._answers.move_to_end(question)
+                self.stats["answer_hits"] += 1
+                return self._answers[question]
+            self.stats["answer_misses"] += 1
+
+        answers = self._fetch_answers([question])
+        answer = answers.get(question)
+        if answer is not None:
+            with self._lock:
+                self._cache_answer(question, answer)
+        return answer
+
+    def get_answers(self, questions):
+        """Return answers for many questions; misses are fetched in one query but not cached"""
+        found = {}
+        missing = []
+        with self._lock:
+            for question in questions:
+                if question in self._answers:
+                    found[question] = self._answers[question]
+                else:
+                    missing.append(question)
+        if missing:
+            found.update(self._fetch_answers(missing))
+        return found
+
+    def _fetch_answers(self, questions):
+        conn, is_postgres = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholder = "%s" if is_postgres else "?"
+            placeholders = ", ".join([placeholder] * len(questions))
+            cursor.execute(
+                f"SELECT question, answer, content_hash FROM knowledge WHERE question IN ({placeholders})",
+                tuple(questions)
+            )
+            rows = cursor.fetchall()
+            answers = database.expand_answers(conn, [(answer, hash_) for _, answer, hash_ in rows])
+            return {row[0]: answer for row, answer in zip(rows, answers)}
+        except Exception as e:
+            print(f"Error fetching answers: {e}")
+            return {}
+        finally:
+            database.release_connection(conn, is_postgres)
+
+    def _cache_answer(self, question, answer):
+        if answer is None:
+            return
+        # Character count is close enough to bytes for a memory bound
+        size = len(answer)
+        if size > self.max_answer_bytes:
+            return
+        self._answers[question] = answer
+        self._answer_bytes += size
+        while self._answer_bytes > self.max_answer_bytes and self._answers:
+            _, evicted = self._answers.popitem(last=False)
+            self._answer_bytes -= len(evicted)
+
+    def _evict_answer(self, question):
+        answer = self._answers.pop(question, None)
+        if answer is not None:
+            self._answer_bytes -= len(answer)
+
+# Create singleton instance
+knowledge_store = KnowledgeStore()
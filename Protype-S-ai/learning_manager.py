@@ -5,15 +5,7 @@ import random
 import os
 import json
 import datetime
-from celery import Celery
-
-# Configure Celery with Redis (if available) or use local memory broker
-if 'REDIS_URL' in os.environ:
-    broker_url = os.environ['REDIS_URL']
-else:
-    broker_url = 'memory://'
-
-celery_app = Celery('protype_tasks', broker=broker_url)
+from event_log import event_log
 
 # Learning topics
 LEARNING_TOPICS = [
@@ -38,21 +30,11 @@ class LearningManager:
         self.learning_active = False
         self.learning_thread = None
         self.learning_interval = 5  # seconds between learning tasks
-        self.log_file = "learning_logs.json"
         self.reinforcement_file = "reinforcement_data.json"
         self.unanswered_questions_file = "unanswered_questions.json"
-        self.load_logs()
         self.load_reinforcement_data()
         self.load_unanswered_questions()
         
-    def load_logs(self):
-        """Load existing learning logs"""
-        try:
-            with open(self.log_file, 'r') as f:
-                self.logs = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.logs = {"logs": []}
-            
     def load_reinforcement_data(self):
         """Load reinforcement learning data"""
         try:
@@ -94,14 +76,6 @@ class LearningManager:
         except Exception as e:
             print(f"Error saving unanswered questions: {e}")
             
-    def save_logs(self):
-        """Save learning logs to file"""
-        try:
-            with open(self.log_file, 'w') as f:
-                json.dump(self.logs, f, indent=2)
-        except Exception as e:
-            print(f"Error saving learning logs: {e}")
-            
     def log_activity(self, source, action, description):
         """Log learning activity"""
         log_entry = {
@@ -111,8 +85,12 @@ class LearningManager:
             "description": description
         }
         
-        self.logs["logs"].append(log_entry)
-        self.save_logs()
+        # Appended to the event log in batches (replaces learning_logs.json)
+        event_log.append("learning", log_entry)
+        
+    def get_recent_logs(self, limit=50):
+        """Return the most recent learning log entries"""
+        return event_log.recent("learning", limit)
         
     def start_learning(self):
         """Start continuous learning process"""
@@ -182,11 +160,12 @@ class LearningManager:
             # Import here to avoid circular imports
             from celery_tasks import learn_from_wikipedia
             
-            # Schedule the task
-            learn_from_wikipedia.delay(topic)
+            # Schedule the task; a topic learned recently or in flight is not fetched again
+            result = learn_from_wikipedia.delay(topic)
             
             # Log the action
-            self.log_activity("wikipedia", "learning", f"Learning about: {topic}")
+            if not result.deduplicated:
+                self.log_activity("wikipedia", "learning", f"Learning about: {topic}")
             
         except Exception as e:
             print(f"Error learning from Wikipedia: {e}")
@@ -197,11 +176,12 @@ class LearningManager:
             # Import here to avoid circular imports
             from celery_tasks import learn_from_gemini_flash
             
-            # Schedule the task
-            learn_from_gemini_flash.delay(question)
+            # Schedule the task; a question answered recently or in flight is not asked again
+            result = learn_from_gemini_flash.delay(question)
             
             # Log the action
-            self.log_activity("gemini", "learning", f"Learning from question: {question}")
+            if not result.deduplicated:
+                self.log_activity("gemini", "learning", f"Learning from question: {question}")
             
         except Exception as e:
             print(f"Error learning from Gemini: {e}")
@@ -295,8 +275,8 @@ class LearningManager:
                 # Call more advanced AI model or external API to get answer
                 from celery_tasks import learn_from_gemini_flash
                 
-                # Schedule task and mark attempt
-                learn_from_gemini_flash.delay(question)
+                # Schedule task and mark attempt; a user is waiting on this answer
+                learn_from_gemini_flash.apply_async((question,), interactive=True)
                 
                 # Update attempt count
                 question_data["attempts"] += 1
@@ -343,10 +323,10 @@ class LearningManager:
                 if topics:
                     selected_topics = random.sample(list(topics), min(3, len(topics)))
                     for topic in selected_topics:
-                        self.log_activity("reinforcement", "expansion", f"Expanding knowledge on topic: {topic}")
-                        # Schedule learning task for this topic
+                        # Schedule learning task for this topic; repeats within the freshness window are collapsed
                         from celery_tasks import learn_from_wikipedia
-                        learn_from_wikipedia.delay(topic)
+                        if not learn_from_wikipedia.delay(topic).deduplicated:
+                            self.log_activity("reinforcement", "expansion", f"Expanding knowledge on topic: {topic}")
         
         except Exception as e:
             print(f"Error applying reinforcement learning: {e}")
@@ -0,0 +1,508 @@
+import os
+import re
+import time
+import random
+import asyncio
+import weakref
+import threading
+from collections import deque
+
+# Configure Gemini API; the key must come from the environment
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', "gemini-1.5-pro")
+
+# 'gemini' for the real API, 'stub' for an offline echo backend (tests and
+# load runs only: its answers are never saved). Without an API key, Gemini
+# calls fail with LLMError.
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+
+# Concurrent calls per process, per-call deadline (seconds) and retry policy
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 4))
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 3))
+
+# Concurrent calls per event loop for async callers, which do not hold a thread while waiting
+LLM_MAX_ASYNC_CONCURRENCY = int(os.environ.get('LLM_MAX_ASYNC_CONCURRENCY', 64))
+
+# Simulated latency of the stub backend (seconds), for load tests
+LLM_STUB_DELAY = float(os.environ.get('LLM_STUB_DELAY', 0))
+LLM_RETRY_BASE_DELAY = 0.5
+LLM_RETRY_MAX_DELAY = 8.0
+
+# Default generation settings, overridden per caller
+DEFAULT_GENERATION_CONFIG = {
+    "temperature": 1,
+    "top_p": 0.95,
+    "top_k": 64,
+    "max_output_tokens": 8192,
+    "response_mime_type": "text/plain",
+}
+
+class LLMError(Exception):
+    """Raised when a call fails after retries or misses its deadline"""
+
+class LLMResponse:
+    """Result of one call; .text matches the attribute callers used on Gemini responses"""
+
+    def __init__(self, text, prompt_tokens=0, output_tokens=0, latency=0.0, attempts=1):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.output_tokens = output_tokens
+        self.latency = latency
+        self.attempts = attempts
+
+class GeminiBackend:
+    """google-generativeai backend, imported on first use"""
+
+    def __init__(self, api_key=GEMINI_API_KEY, model_name=GEMINI_MODEL):
+        self.api_key = api_key
+        self.model_name = model_name
+        self._genai = None
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _model(self, generation_config, model_name=None):
+        model_name = model_name or self.model_name
+        key = (model_name, tuple(sorted(generation_config.items())))
+        with self._lock:
+            if self._genai is None:
+                if not self.api_key:
+                    raise LLMError("GEMINI_API_KEY is not set")
+                try:
+                    import google.generativeai as genai
+                except ImportError:
+                    raise LLMError("google-generativeai is not installed")
+                genai.configure(api_key=self.api_key)
+                self._genai = genai
+            if key not in self._models:
+                self._models[key] = self._genai.GenerativeModel(
+                    model_name=model_name,
+                    generation_config=generation_config,
+                )
+            return self._models[key]
+
+    def generate(self, contents, generation_config, timeout, model=None):
+        model = self._model(generation_config, model)
+        response = model.generate_content(contents, request_options={"timeout": timeout})
+        usage = getattr(response, "usage_metadata", None)
+        return (
+            response.text,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+    def stream(self, contents, generation_config, timeout, model=None):
+        """Yield text chunks as they arrive; returns (prompt_tokens, output_tokens)"""
+        model = self._model(generation_config, model)
+        response = model.generate_content(contents, stream=True, request_options={"timeout": timeout})
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+        usage = getattr(response, "usage_metadata", None)
+        return (
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+    async def agenerate(self, contents, generation_config, timeout, model=None):
+        model = self._model(generation_config, model)
+        response = await model.generate_content_async(contents, request_options={"timeout": timeout})
+        usage = getattr(response, "usage_metadata", None)
+        return (
+            response.text,
+            getattr(usage, "prompt_token_count", 0) or 0,
+            getattr(usage, "candidates_token_count", 0) or 0,
+        )
+
+    async def astream(self, contents, generation_config, timeout, model=None):
+        """Async text chunks; token usage is not reported for async streams"""
+        model = self._model(generation_config, model)
+        response = await model.generate_content_async(contents, stream=True, request_options={"timeout": timeout})
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+class StubBackend:
+    """Offline backend for tests and local runs.
+
+    Returns queued responses (or an echo of the last message) after an
+    optional delay; queued exceptions are raised instead, to exercise retries.
+    Streamed responses are split into words, chunk_delay seconds apart.
+    Its answers are not saved unless persist=True (tests standing in for Gemini).
+    """
+
+    def __init__(self, responses=None, delay=LLM_STUB_DELAY, chunk_delay=0.0, persist=False):
+        self.responses = deque(responses or [])
+        self.persist = persist
+        self.delay = delay
+        self.chunk_delay = chunk_delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def generate(self, contents, generation_config, timeout, model=None):
+        with self._lock:
+            self.calls.append(contents)
+            response = self.responses.popleft() if self.responses else None
+        if self.delay:
+            time.sleep(min(self.delay, timeout))
+            if self.delay > timeout:
+                raise TimeoutError("stub backend timed out")
+        if isinstance(response, Exception):
+            raise response
+
+        prompt = contents[-1]["parts"][0]
+        text = response if response is not None else f"Stub response to: {prompt}"
+        prompt_tokens = sum(len(turn["parts"][0].split()) for turn in contents)
+        return text, prompt_tokens, len(text.split())
+
+    def stream(self, contents, generation_config, timeout, model=None):
+        text, prompt_tokens, output_tokens = self.generate(contents, generation_config, timeout, model)
+        for chunk in re.findall(r"\S+\s*", text):
+            if self.chunk_delay:
+                time.sleep(self.chunk_delay)
+            yield chunk
+        return prompt_tokens, output_tokens
+
+    async def agenerate(self, contents, generation_config, timeout, model=None):
+        with self._lock:
+            self.calls.append(contents)
+            response = self.responses.popleft() if self.responses else None
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if isinstance(response, Exception):
+            raise response
+
+        prompt = contents[-1]["parts"][0]
+        text = response if response is not None else f"Stub response to: {prompt}"
+        prompt_tokens = sum(len(turn["parts"][0].split()) for turn in contents)
+        return text, prompt_tokens, len(text.split())
+
+    async def astream(self, contents, generation_config, timeout, model=None):
+        text, _, _ = await self.agenerate(contents, generation_config, timeout, model)
+        for chunk in re.findall(r"\S+\s*", text):
+            if self.chunk_delay:
+                await asyncio.sleep(self.chunk_delay)
+            yield chunk
+
+class ChatSession:
+    """Opt-in multi-turn conversation with bounded history.
+
+    Keeps at most max_turns exchanges; older ones are dropped, or folded
+    into a running summary when summarize=True.
+    """
+
+    def __init__(self, gateway, generation_config=None, caller="session", max_turns=10, summarize=False,
+                 model=None):
+        self.gateway = gateway
+        self.generation_config = generation_config
+        self.model = model
+        self.caller = caller
+        self.max_turns = max_turns
+        self.summarize = summarize
+        self.summary = ""
+        self.history = []  # [(user text, model text)]
+        self._lock = threading.Lock()
+
+    def _contents(self, message):
+        contents = []
+        if self.summary:
+            contents.append({"role": "user", "parts": [f"Summary of our conversation so far: {self.summary}"]})
+            contents.append({"role": "model", "parts": ["Understood."]})
+        for user_text, model_text in self.history:
+            contents.append({"role": "user", "parts": [user_text]})
+            contents.append({"role": "model", "parts": [model_text]})
+        contents.append({"role": "user", "parts": [message]})
+        return contents
+
+    def send_message(self, message, timeout=None):
+        """Send a message with the bounded history; one message at a time per session"""
+        with self._lock:
+            response = self.gateway.call(self._contents(message), self.generation_config, timeout, self.caller,
+                                         self.model)
+            self.history.append((message, response.text))
+            if len(self.history) > self.max_turns:
+                dropped = self.history[:-self.max_turns]
+                self.history = self.history[-self.max_turns:]
+                if self.summarize:
+                    self._fold_into_summary(dropped)
+            return response
+
+    def _fold_into_summary(self, turns):
+        transcript = "\n".join(f"User: {u}\nAssistant: {m}" for u, m in turns)
+        prompt = f"""
+        Update this conversation summary with the new exchanges. Keep it under 150 words.
+        Current summary: {self.summary or "(none)"}
+        New exchanges:
+        {transcript}
+        """
+        try:
+            self.summary = self.gateway.generate(prompt, caller=f"{self.caller}:summary", model=self.model).text.strip()
+        except LLMError as e:
+            print(f"Error summarizing conversation: {e}")
+
+    def reset(self):
+        with self._lock:
+            self.history = []
+            self.summary = ""
+
+class LLMGateway:
+    """Single entry point for LLM calls.
+
+    Calls are stateless by default, limited to LLM_MAX_CONCURRENCY at a time,
+    bounded by a deadline that covers queueing and retries, and retried with
+    jittered exponential backoff. Latency and token use are accounted per caller.
+    """
+
+    def __init__(self, backend=None, max_concurrency=LLM_MAX_CONCURRENCY, timeout=LLM_TIMEOUT,
+                 max_retries=LLM_MAX_RETRIES, max_async_concurrency=LLM_MAX_ASYNC_CONCURRENCY):
+        if backend is None:
+            if LLM_BACKEND == 'stub':
+                print("Using the offline stub LLM backend; its answers are not saved")
+                backend = StubBackend()
+            else:
+                if not GEMINI_API_KEY:
+                    print("GEMINI_API_KEY is not set; LLM calls will fail")
+                backend = GeminiBackend()
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_async_concurrency = max_async_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self._stats_lock = threading.Lock()
+        self.stats = {}
+        self.recent_calls = deque(maxlen=200)
+
+    def set_backend(self, backend):
+        self.backend = backend
+
+    @property
+    def persists_answers(self):
+        """False for backends whose output must not be saved as knowledge (the stub)"""
+        return getattr(self.backend, "persist", True)
+
+    def generate(self, prompt, generation_config=None, timeout=None, caller="default", model=None):
+        """Single-shot call with no conversation history"""
+        return self.call([{"role": "user", "parts": [prompt]}], generation_config, timeout, caller, model)
+
+    def session(self, generation_config=None, caller="session", max_turns=10, summarize=False, model=None):
+        """Start a conversation that keeps a bounded history"""
+        return ChatSession(self, generation_config, caller, max_turns, summarize, model)
+
+    def stream(self, prompt, generation_config=None, timeout=None, caller="default", model=None):
+        """Single-shot call that yields the response text in chunks as the model produces them.
+        
+        Failures are retried only until the first chunk is out; after that
+        they raise LLMError. The concurrency slot is held until the stream
+        is exhausted or closed.
+        """
+        contents = [{"role": "user", "parts": [prompt]}]
+        config = dict(DEFAULT_GENERATION_CONFIG)
+        config.update(generation_config or {})
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        attempts = 0
+
+        if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._record(caller, start, attempts, None, "timed out waiting for a slot")
+            raise LLMError(f"{caller}: timed out waiting for a free LLM slot")
+        try:
+            while True:
+                attempts += 1
+                chunks = self.backend.stream(contents, config, deadline - time.monotonic(), model)
+                parts = []
+                try:
+                    while True:
+                        try:
+                            chunk = next(chunks)
+                        except StopIteration as stop:
+                            prompt_tokens, output_tokens = stop.value or (0, 0)
+                            break
+                        parts.append(chunk)
+                        yield chunk
+                except GeneratorExit:
+                    # The consumer stopped reading (e.g. the client disconnected)
+                    chunks.close()
+                    self._record(caller, start, attempts, None, "cancelled")
+                    raise
+                except LLMError as e:
+                    self._record(caller, start, attempts, None, str(e))
+                    raise
+                except Exception as e:
+                    delay = self._retry_delay(attempts)
+                    if parts or attempts > self.max_retries or time.monotonic() + delay >= deadline:
+                        self._record(caller, start, attempts, None, str(e))
+                        raise LLMError(f"{caller}: {e}") from e
+                    time.sleep(delay)
+                    continue
+
+                text = "".join(parts)
+                self._record(caller, start, attempts,
+                             LLMResponse(text, prompt_tokens, output_tokens, time.monotonic() - start, attempts))
+                return
+        finally:
+            self._semaphore.release()
+
+    def call(self, contents, generation_config=None, timeout=None, caller="default", model=None):
+        config = dict(DEFAULT_GENERATION_CONFIG)
+        config.update(generation_config or {})
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        attempts = 0
+
+        if not self._semaphore.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._record(caller, start, attempts, None, "timed out waiting for a slot")
+            raise LLMError(f"{caller}: timed out waiting for a free LLM slot")
+        try:
+            while True:
+                attempts += 1
+                remaining = deadline - time.monotonic()
+                try:
+                    text, prompt_tokens, output_tokens = self.backend.generate(contents, config, remaining, model)
+                    response = LLMResponse(text, prompt_tokens, output_tokens, time.monotonic() - start, attempts)
+                    self._record(caller, start, attempts, response)
+                    return response
+                except LLMError as e:
+                    self._record(caller, start, attempts, None, str(e))
+                    raise
+                except Exception as e:
+                    delay = self._retry_delay(attempts)
+                    if attempts > self.max_retries or time.monotonic() + delay >= deadline:
+                        self._record(caller, start, attempts, None, str(e))
+                        raise LLMError(f"{caller}: {e}") from e
+                    time.sleep(delay)
+        finally:
+            self._semaphore.release()
+
+    def _async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._stats_lock:
+            if loop not in self._async_semaphores:
+                self._async_semaphores[loop] = asyncio.Semaphore(self.max_async_concurrency)
+            return self._async_semaphores[loop]
+
+    def _retry_delay(self, attempts):
+        # Full jitter keeps concurrent callers from retrying in lockstep
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** (attempts - 1)))
+
+    async def agenerate(self, prompt, generation_config=None, timeout=None, caller="default", model=None):
+        """Async generate(): waits on the event loop instead of holding a thread"""
+        contents = [{"role": "user", "parts": [prompt]}]
+        config = dict(DEFAULT_GENERATION_CONFIG)
+        config.update(generation_config or {})
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        semaphore = self._async_semaphore()
+        attempts = 0
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._record(caller, start, attempts, None, "timed out waiting for a slot")
+            raise LLMError(f"{caller}: timed out waiting for a free LLM slot")
+        try:
+            while True:
+                attempts += 1
+                remaining = deadline - time.monotonic()
+                try:
+                    text, prompt_tokens, output_tokens = await asyncio.wait_for(
+                        self.backend.agenerate(contents, config, remaining, model), remaining)
+                    response = LLMResponse(text, prompt_tokens, output_tokens, time.monotonic() - start, attempts)
+                    self._record(caller, start, attempts, response)
+                    return response
+                except LLMError as e:
+                    self._record(caller, start, attempts, None, str(e))
+                    raise
+                except Exception as e:
+                    delay = self._retry_delay(attempts)
+                    if attempts > self.max_retries or time.monotonic() + delay >= deadline:
+                        self._record(caller, start, attempts, None, str(e) or type(e).__name__)
+                        raise LLMError(f"{caller}: {e or type(e).__name__}") from e
+                    await asyncio.sleep(delay)
+        finally:
+            semaphore.release()
+
+    async def astream(self, prompt, generation_config=None, timeout=None, caller="default", model=None):
+        """Async stream(): same retry rules, chunks are awaited on the event loop"""
+        contents = [{"role": "user", "parts": [prompt]}]
+        config = dict(DEFAULT_GENERATION_CONFIG)
+        config.update(generation_config or {})
+        start = time.monotonic()
+        deadline = start + (timeout or self.timeout)
+        semaphore = self._async_semaphore()
+        attempts = 0
+
+        try:
+            await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._record(caller, start, attempts, None, "timed out waiting for a slot")
+            raise LLMError(f"{caller}: timed out waiting for a free LLM slot")
+        try:
+            while True:
+                attempts += 1
+                chunks = self.backend.astream(contents, config, deadline - time.monotonic(), model)
+                parts = []
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+                        except StopAsyncIteration:
+                            break
+                        parts.append(chunk)
+                        yield chunk
+                except GeneratorExit:
+                    await chunks.aclose()
+                    self._record(caller, start, attempts, None, "cancelled")
+                    raise
+                except LLMError as e:
+                    self._record(caller, start, attempts, None, str(e))
+                    raise
+                except Exception as e:
+                    delay = self._retry_delay(attempts)
+                    if parts or attempts > self.max_retries or time.monotonic() + delay >= deadline:
+                        self._record(caller, start, attempts, None, str(e) or type(e).__name__)
+                        raise LLMError(f"{caller}: {e or type(e).__name__}") from e
+                    await asyncio.sleep(delay)
+                    continue
+
+                text = "".join(parts)
+                self._record(caller, start, attempts,
+                             LLMResponse(text, 0, len(text.split()), time.monotonic() - start, attempts))
+                return
+        finally:
+            semaphore.release()
+
+    def _record(self, caller, start, attempts, response, error=None):
+        latency = time.monotonic() - start
+        with self._stats_lock:
+            stats = self.stats.setdefault(caller, {
+                "calls": 0, "failures": 0, "retries": 0, "total_latency": 0.0,
+                "prompt_tokens": 0, "output_tokens": 0
+            })
+            stats["calls"] += 1
+            stats["retries"] += max(0, attempts - 1)
+            stats["total_latency"] += latency
+            if response is None:
+                stats["failures"] += 1
+            else:
+                stats["prompt_tokens"] += response.prompt_tokens
+                stats["output_tokens"] += response.output_tokens
+            self.recent_calls.append({
+                "caller": caller,
+                "latency": latency,
+                "attempts": attempts,
+                "prompt_tokens": response.prompt_tokens if response else 0,
+                "output_tokens": response.output_tokens if response else 0,
+                "error": error
+            })
+
+    def get_stats(self):
+        """Per-caller totals plus average latency"""
+        with self._stats_lock:
+            return {
+                caller: dict(stats, avg_latency=stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0)
+                for caller, stats in self.stats.items()
+            }
+
+# Create singleton instance
+llm_gateway = LLMGateway()
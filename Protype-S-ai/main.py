@@ -1,56 +1,15 @@
 
 import os
 from web_app import app
-from database import init_db
-import threading
+from startup import start_services
 import logging
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('protype_ai')
 
-# Initialize database
-try:
-    init_db()
-    logger.info("Database initialized successfully")
-except Exception as e:
-    logger.error(f"Error initializing database: {e}")
-
-try:
-    # Initialize enhanced AI components
-    from symbolic_reasoning import symbolic_reasoning
-    from temporal_awareness import temporal_awareness
-    from self_reflection import self_reflection
-    from advanced_memory import advanced_memory
-    from autonomous_agent import autonomous_agent
-    from learning_manager import learning_manager
-
-    # Start the continuous learning process in a separate thread
-    def start_learning_thread():
-        logger.info("Starting continuous learning processes...")
-        try:
-            learning_manager.start_learning()
-        except Exception as e:
-            logger.error(f"Error starting learning: {e}")
-
-    learning_thread = threading.Thread(target=start_learning_thread)
-    learning_thread.daemon = True
-    learning_thread.start()
-
-    # Start autonomous agent with limited autonomy
-    def start_agent_thread():
-        logger.info("Starting autonomous agent in background...")
-        try:
-            autonomous_agent.start_agent(autonomous_mode=False)
-        except Exception as e:
-            logger.error(f"Error starting agent: {e}")
-
-    agent_thread = threading.Thread(target=start_agent_thread)
-    agent_thread.daemon = True
-    agent_thread.start()
-
-except Exception as e:
-    logger.error(f"Error initializing AI components: {e}")
+# Initialize the database, replay queued side effects and start the AI components
+start_services()
 
 # Initialize web application
 if __name__ == "__main__":
@@ -60,6 +19,12 @@ if __name__ == "__main__":
     
     # Run the application
     try:
-        app.run(host='0.0.0.0', port=8080, threaded=True)
+        if os.environ.get('PROTYPE_ASYNC_SERVER') == '1':
+            # Event-loop server: requests waiting on the LLM do not hold threads (see async_app.py)
+            from aiohttp import web
+            from async_app import create_app
+            web.run_app(create_app(), host='0.0.0.0', port=8080, access_log=None)
+        else:
+            app.run(host='0.0.0.0', port=8080, threaded=True)
     except Exception as e:
         logger.error(f"Error starting web server: {e}")
@@ -0,0 +1,162 @@
+import os
+import math
+import numpy as np
+import faiss
+
+# Configure the vector index used by AdvancedMemory
+EMBEDDING_DIM = 384
+INDEX_TYPE = os.environ.get('MEMORY_INDEX_TYPE', 'flat')  # flat, hnsw or ivfpq
+USE_MMAP = os.environ.get('MEMORY_INDEX_MMAP', '1') == '1'
+
+# HNSW graph parameters
+HNSW_M = int(os.environ.get('MEMORY_HNSW_M', 32))
+HNSW_EF_CONSTRUCTION = int(os.environ.get('MEMORY_HNSW_EF_CONSTRUCTION', 80))
+HNSW_EF_SEARCH = int(os.environ.get('MEMORY_HNSW_EF_SEARCH', 64))
+
+# IVF-PQ parameters; PQ_M sub-quantizers must divide EMBEDDING_DIM
+IVF_NPROBE = int(os.environ.get('MEMORY_IVF_NPROBE', 16))
+PQ_M = int(os.environ.get('MEMORY_PQ_M', 48))
+PQ_NBITS = 8
+
+# IVF-PQ needs enough vectors to train its quantizers; until then a flat index is used
+MIN_TRAINING_VECTORS = int(os.environ.get('MEMORY_MIN_TRAINING_VECTORS', 10000))
+
+def ivf_nlist(count):
+    """Number of IVF partitions for a collection of the given size"""
+    return int(min(65536, max(16, 4 * math.sqrt(max(count, 1)))))
+
+def create_index(index_type=INDEX_TYPE, dim=EMBEDDING_DIM, training_vectors=None):
+    """Create an empty ID-mapped index of the requested type.
+
+    ivfpq falls back to flat when fewer than MIN_TRAINING_VECTORS training
+    vectors are supplied; the caller can upgrade later with rebuild_index.
+    """
+    if index_type == 'hnsw':
+        base = faiss.IndexHNSWFlat(dim, HNSW_M)
+        base.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == 'ivfpq' and training_vectors is not None and len(training_vectors) >= MIN_TRAINING_VECTORS:
+        nlist = min(ivf_nlist(len(training_vectors)), len(training_vectors) // 39)
+        quantizer = faiss.IndexFlatL2(dim)
+        base = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS)
+        base.train(np.ascontiguousarray(training_vectors, dtype='float32'))
+    else:
+        base = faiss.IndexFlatL2(dim)
+
+    index = faiss.IndexIDMap2(base)
+    apply_search_params(index)
+    return index
+
+def index_kind(index):
+    """Return 'flat', 'hnsw' or 'ivfpq' for an index created by create_index"""
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return 'hnsw'
+    if isinstance(base, faiss.IndexIVF):
+        return 'ivfpq'
+    return 'flat'
+
+def apply_search_params(index):
+    """Set query-time parameters, which are not all persisted with the index"""
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else faiss.downcast_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        base.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(base, faiss.IndexIVF):
+        base.nprobe = IVF_NPROBE
+
+def needs_upgrade(index, index_type=INDEX_TYPE):
+    """True when the configured index type differs from the live one and can be built"""
+    kind = index_kind(index)
+    if kind == index_type:
+        return False
+    if index_type == 'ivfpq':
+        return index.ntotal >= MIN_TRAINING_VECTORS
+    return index_type in ('flat', 'hnsw')
+
+def get_vectors(index):
+    """Return (ids, vectors) for every entry; IVF-PQ vectors are approximate"""
+    if index.ntotal == 0:
+        return np.zeros(0, dtype='int64'), np.zeros((0, index.d), dtype='float32')
+    if not isinstance(index, faiss.IndexIDMap2):
+        return np.arange(index.ntotal, dtype='int64'), index.reconstruct_n(0, index.ntotal)
+
+    base = faiss.downcast_index(index.index)
+    if isinstance(base, faiss.IndexIVF):
+        base.make_direct_map()
+    return get_ids(index), base.reconstruct_n(0, base.ntotal)
+
+def get_ids(index):
+    """Return the ids of every entry without reconstructing vectors"""
+    if not isinstance(index, faiss.IndexIDMap2):
+        return np.arange(index.ntotal, dtype='int64')
+    return faiss.vector_to_array(index.id_map).astype('int64')
+
+def reconstruct_ids(index, ids):
+    """Stored vectors for ids, or None when the index cannot return them.
+
+    IVF-PQ keeps no id to vector lookup (and its vectors are approximate);
+    some GPU indexes cannot reconstruct at all.
+    """
+    if not isinstance(index, faiss.IndexIDMap2) or index_kind(index) == 'ivfpq':
+        return None
+    try:
+        return index.reconstruct_batch(np.asarray(ids, dtype='int64'))
+    except RuntimeError:
+        return None
+
+def rebuild_index(index, index_type=INDEX_TYPE, keep=None):
+    """Build a fresh index of index_type from the entries of an existing one.
+
+    keep, if given, is a boolean mask over get_vectors() order.  Used to
+    upgrade flat -> hnsw/ivfpq, to wrap legacy un-mapped indexes and for
+    removals on HNSW, which does not support removing entries in place.
+    """
+    ids, vectors = get_vectors(index)
+    if keep is not None:
+        ids, vectors = ids[keep], vectors[keep]
+    new_index = create_index(index_type, index.d, training_vectors=vectors)
+    if len(ids):
+        new_index.add_with_ids(np.ascontiguousarray(vectors, dtype='float32'), ids)
+    return new_index
+
+def remove_ids(index, ids):
+    """Remove entries by id, returning the (possibly rebuilt) index"""
+    ids = np.asarray(list(ids), dtype='int64')
+    if len(ids) == 0:
+        return index
+    if index_kind(index) == 'hnsw':
+        all_ids, _ = get_vectors(index)
+        return rebuild_index(index, 'hnsw', keep=~np.isin(all_ids, ids))
+    index.remove_ids(faiss.IDSelectorBatch(ids))
+    return index
+
+def is_read_only(index):
+    """Memory-mapped IVF indexes have read-only inverted lists"""
+    if not isinstance(index, faiss.IndexIDMap2):
+        return False
+    base = faiss.downcast_index(index.index)
+    if isinstance(base, faiss.IndexIVF):
+        invlists = faiss.downcast_InvertedLists(base.invlists)
+        return isinstance(invlists, faiss.OnDiskInvertedLists) and invlists.read_only
+    return False
+
+def read_index(path, mmap=USE_MMAP):
+    """Load an index, memory-mapping it when possible for fast startup"""
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+        except Exception:
+            index = None
+    if index is None:
+        index = faiss.read_index(path)
+    if not isinstance(index, faiss.IndexIDMap2):
+        # Legacy IndexFlatL2 without ids: entry i keeps id i
+        index = rebuild_index(index, index_kind(index))
+    apply_search_params(index)
+    return index
+
+def write_index(index, path):
+    """Write an index atomically"""
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,276 @@
+import os
+import json
+import pickle
+import sqlite3
+import threading
+from collections import Counter
+
+MEMORY_METADATA_PATH = 'memory_metadata.db'
+LEGACY_METADATA_PATH = 'memory_metadata.pkl'
+
+# Pending access_count increments are written after this many search hits
+ACCESS_FLUSH_EVERY = 100
+
+class MemoryMetadataStore:
+    """SQLite tables of AdvancedMemory entries and their indexed passages.
+
+    Each entry is split into passages, character spans of its answer keyed
+    by FAISS id. Rows are appended as they are added, so nothing is
+    rewritten on save. The ids covered by a saved index are recorded as a
+    checkpoint, which lets AdvancedMemory reconcile the two after a crash.
+    """
+
+    def __init__(self, path=MEMORY_METADATA_PATH):
+        self.path = path
+        self._conn = None
+        self._lock = threading.RLock()
+        self._pending_access = Counter()
+
+    def exists(self):
+        return self._conn is not None or os.path.exists(self.path)
+
+    def connection(self):
+        """Open the database on first use"""
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS memory_entries (
+                    id INTEGER PRIMARY KEY,
+                    question TEXT,
+                    answer TEXT,
+                    source TEXT,
+                    timestamp REAL,
+                    access_count INTEGER DEFAULT 0,
+                    additional TEXT
+                )
+            ''')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS memory_passages (
+                    id INTEGER PRIMARY KEY,
+                    entry_id INTEGER,
+                    position INTEGER,
+                    start_char INTEGER,
+                    end_char INTEGER
+                )
+            ''')
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_memory_passages_entry ON memory_passages (entry_id)")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS memory_state (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    def _row_to_entry(self, row):
+        return {
+            'question': row[1],
+            'answer': row[2],
+            'source': row[3],
+            'timestamp': row[4],
+            'access_count': row[5] + self._pending_access.get(row[0], 0),
+            'additional': json.loads(row[6]) if row[6] else {}
+        }
+
+    def add_many(self, entries, passages=None):
+        """Append {id: entry} pairs, and their {passage id: (entry id, position, start, end)}, in one transaction"""
+        rows = [
+            (int(index_id), entry['question'], entry['answer'], entry.get('source', 'system'),
+             entry.get('timestamp'), entry.get('access_count', 0), json.dumps(entry.get('additional') or {}))
+            for index_id, entry in entries.items()
+        ]
+        with self._lock:
+            conn = self.connection()
+            conn.executemany('''
+                INSERT OR REPLACE INTO memory_entries
+                (id, question, answer, source, timestamp, access_count, additional)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            if passages:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO memory_passages (id, entry_id, position, start_char, end_char) VALUES (?, ?, ?, ?, ?)",
+                    [(int(passage_id), *span) for passage_id, span in passages.items()]
+                )
+            conn.commit()
+
+    def add_passages(self, passages):
+        """Append {passage id: (entry id, position, start, end)} for entries already stored"""
+        self.add_many({}, passages)
+
+    def get_passages(self, ids):
+        """Return {passage id: (entry id, position, start, end)} for the ids that exist"""
+        ids = [int(passage_id) for passage_id in ids]
+        if not ids or not self.exists():
+            return {}
+        passages = {}
+        with self._lock:
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.connection().execute(
+                    f"SELECT id, entry_id, position, start_char, end_char FROM memory_passages WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                for row in rows:
+                    passages[row[0]] = tuple(row[1:])
+        return passages
+
+    def get_many(self, ids):
+        """Return {id: entry} for the ids that exist"""
+        ids = [int(index_id) for index_id in ids]
+        if not ids or not self.exists():
+            return {}
+        entries = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.connection().execute(
+                    f"SELECT id, question, answer, source, timestamp, access_count, additional "
+                    f"FROM memory_entries WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                for row in rows:
+                    entries[row[0]] = self._row_to_entry(row)
+        return entries
+
+    def __getitem__(self, index_id):
+        entry = self.get_many([index_id]).get(int(index_id))
+        if entry is None:
+            raise KeyError(index_id)
+        return entry
+
+    def __contains__(self, index_id):
+        return int(index_id) in self.get_many([index_id])
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        with self._lock:
+            return self.connection().execute("SELECT COUNT(*) FROM memory_entries").fetchone()[0]
+
+    def ids(self):
+        if not self.exists():
+            return []
+        with self._lock:
+            return [row[0] for row in self.connection().execute("SELECT id FROM memory_entries")]
+
+    def passage_ids(self, entry_ids=None):
+        """FAISS ids of the passages of entry_ids, or of every passage"""
+        if not self.exists():
+            return []
+        with self._lock:
+            conn = self.connection()
+            if entry_ids is None:
+                return [row[0] for row in conn.execute("SELECT id FROM memory_passages")]
+            ids = []
+            entry_ids = [int(entry_id) for entry_id in entry_ids]
+            for start in range(0, len(entry_ids), 500):
+                chunk = entry_ids[start:start + 500]
+                placeholders = ", ".join("?" * len(chunk))
+                ids.extend(row[0] for row in conn.execute(
+                    f"SELECT id FROM memory_passages WHERE entry_id IN ({placeholders})", chunk))
+            return ids
+
+    def unsplit_ids(self):
+        """Entries without passages, e.g. migrated from before answers were split"""
+        if not self.exists():
+            return []
+        with self._lock:
+            return [row[0] for row in self.connection().execute(
+                "SELECT id FROM memory_entries WHERE id NOT IN (SELECT entry_id FROM memory_passages) ORDER BY id")]
+
+    def max_id(self, table='memory_entries'):
+        if not self.exists():
+            return -1
+        with self._lock:
+            value = self.connection().execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        return -1 if value is None else value
+
+    def max_passage_id(self):
+        return self.max_id('memory_passages')
+
+    def delete_many(self, ids):
+        """Delete entries together with their passages"""
+        ids = [(int(index_id),) for index_id in ids]
+        with self._lock:
+            conn = self.connection()
+            conn.executemany("DELETE FROM memory_entries WHERE id = ?", ids)
+            conn.executemany("DELETE FROM memory_passages WHERE entry_id = ?", ids)
+            conn.commit()
+            for (index_id,) in ids:
+                self._pending_access.pop(index_id, None)
+
+    def stale_ids(self, cutoff_time, min_access_count):
+        """Ids of entries that are neither recent nor frequently accessed"""
+        self.flush_access()
+        if not self.exists():
+            return []
+        with self._lock:
+            rows = self.connection().execute(
+                "SELECT id FROM memory_entries WHERE timestamp <= ? AND access_count < ?",
+                (cutoff_time, min_access_count)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def record_access(self, ids):
+        """Count search hits in memory; they are written in batches"""
+        with self._lock:
+            self._pending_access.update(int(index_id) for index_id in ids)
+            should_flush = sum(self._pending_access.values()) >= ACCESS_FLUSH_EVERY
+        if should_flush:
+            self.flush_access()
+
+    def flush_access(self):
+        """Write pending access_count increments"""
+        with self._lock:
+            if not self._pending_access:
+                return
+            rows = [(count, index_id) for index_id, count in self._pending_access.items()]
+            self._pending_access.clear()
+            conn = self.connection()
+            conn.executemany("UPDATE memory_entries SET access_count = access_count + ? WHERE id = ?", rows)
+            conn.commit()
+
+    def get_state(self, key, default=None):
+        if not self.exists():
+            return default
+        with self._lock:
+            row = self.connection().execute("SELECT value FROM memory_state WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_state(self, key, value):
+        with self._lock:
+            conn = self.connection()
+            conn.execute("INSERT OR REPLACE INTO memory_state (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+            conn.commit()
+
+    def import_pickle(self, path=LEGACY_METADATA_PATH):
+        """One-time migration from the old pickled dict"""
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'rb') as f:
+                legacy = pickle.load(f)
+            self.add_many(legacy)
+            os.replace(path, path + ".migrated")
+            print(f"Migrated {len(legacy)} memory entries from {path}")
+            return len(legacy)
+        except Exception as e:
+            print(f"Error migrating memory metadata: {e}")
+            return 0
+
+    def clear(self):
+        with self._lock:
+            conn = self.connection()
+            conn.execute("DELETE FROM memory_entries")
+            conn.execute("DELETE FROM memory_passages")
+            conn.execute("DELETE FROM memory_state")
+            conn.commit()
+            self._pending_access.clear()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,226 @@
+import os
+import json
+import threading
+import numpy as np
+
+# Files holding the persisted question-vector matrix
+QUESTION_VECTORS_FILE = 'question_vectors.npy'
+QUESTION_LIST_FILE = 'question_vectors.json'
+
+# Persist after this many incremental additions
+SAVE_EVERY = 20
+
+class QuestionIndex:
+    """Matrix of unit-normalized spaCy vectors, one row per known question.
+
+    Replaces per-node ``nlp(node).similarity`` loops: each question is parsed
+    once, and a lookup is a single matrix-vector product plus a top-k
+    selection.  Cosine scores match spaCy's ``Doc.similarity``.
+    """
+
+    def __init__(self, nlp, vectors_path=QUESTION_VECTORS_FILE, questions_path=QUESTION_LIST_FILE):
+        self.nlp = nlp
+        self.vectors_path = vectors_path
+        self.questions_path = questions_path
+        self.questions = []
+        self.positions = {}  # question -> row in the matrix
+        self._matrix = None  # preallocated buffer, rows [0, size) are valid
+        self._size = 0
+        self._unsaved = 0
+        self._pending = {}  # questions from note_write, embedded together at the next search or sync
+        self._lock = threading.RLock()
+        self.load()
+
+    @property
+    def model_name(self):
+        meta = getattr(self.nlp, "meta", {}) or {}
+        return f"{meta.get('lang', '')}_{meta.get('name', '')}-{meta.get('version', '')}"
+
+    @property
+    def matrix(self):
+        """Contiguous float32 view of the valid rows"""
+        if self._matrix is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, question):
+        return question in self.positions or question in self._pending
+
+    def load(self):
+        """Load persisted vectors if they were built with the same model"""
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.questions_path)):
+            return False
+        try:
+            with open(self.questions_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get("model") != self.model_name:
+                print("Question index was built with a different model, rebuilding")
+                return False
+            matrix = np.load(self.vectors_path)
+            questions = meta.get("questions", [])
+            if matrix.shape[0] != len(questions):
+                print("Question index files are out of sync, rebuilding")
+                return False
+            with self._lock:
+                self._matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+                self._size = len(questions)
+                self.questions = questions
+                self.positions = {q: i for i, q in enumerate(questions)}
+            return True
+        except Exception as e:
+            print(f"Error loading question index: {e}")
+            return False
+
+    def save(self):
+        """Persist the matrix and question list"""
+        try:
+            with self._lock:
+                matrix = self.matrix.copy()
+                meta = {"model": self.model_name, "questions": list(self.questions)}
+                self._unsaved = 0
+
+            tmp_vectors = self.vectors_path + ".tmp.npy"
+            tmp_questions = self.questions_path + ".tmp"
+            np.save(tmp_vectors, matrix)
+            with open(tmp_questions, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_questions, self.questions_path)
+            return True
+        except Exception as e:
+            print(f"Error saving question index: {e}")
+            return False
+
+    def _embed(self, texts):
+        """Unit-normalized vectors for texts, one spaCy pass per text"""
+        vectors = [doc.vector for doc in self.nlp.pipe([t.lower() for t in texts], batch_size=64)]
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def _append(self, questions, vectors):
+        dim = vectors.shape[1]
+        if self._matrix is None or self._matrix.shape[1] != dim:
+            self._matrix = np.zeros((max(64, len(questions)), dim), dtype=np.float32)
+            self._size = 0
+            self.questions = []
+            self.positions = {}
+
+        needed = self._size + len(questions)
+        if needed > self._matrix.shape[0]:
+            # Grow geometrically so appends stay amortized O(1)
+            capacity = max(needed, self._matrix.shape[0] * 2)
+            grown = np.zeros((capacity, dim), dtype=np.float32)
+            grown[:self._size] = self._matrix[:self._size]
+            self._matrix = grown
+
+        for question, vector in zip(questions, vectors):
+            position = self.positions.get(question)
+            if position is None:
+                position = self._size
+                self.positions[question] = position
+                self.questions.append(question)
+                self._size += 1
+            self._matrix[position] = vector
+
+    def add_questions(self, questions, replace=False):
+        """Embed and add questions; existing rows are kept unless replace=True"""
+        with self._lock:
+            pending = [q for q in dict.fromkeys(questions) if replace or q not in self.positions]
+        if not pending:
+            return 0
+
+        vectors = self._embed(pending)
+        with self._lock:
+            self._append(pending, vectors)
+            self._unsaved += len(pending)
+            should_save = self._unsaved >= SAVE_EVERY
+        if should_save:
+            self.save()
+        return len(pending)
+
+    def remove_questions(self, questions):
+        """Drop the rows of questions; returns how many were indexed"""
+        with self._lock:
+            drop = {q for q in questions if q in self.positions}
+            if not drop:
+                return 0
+            keep = [i for i, q in enumerate(self.questions) if q not in drop]
+            # A new buffer, so a search holding the old matrix and question list stays consistent
+            self._matrix = self._matrix[keep]
+            self._size = len(keep)
+            self.questions = [self.questions[i] for i in keep]
+            self.positions = {q: i for i, q in enumerate(self.questions)}
+            self._unsaved += len(drop)
+        return len(drop)
+
+    def sync(self, questions):
+        """Match the index to the knowledge base: add new questions (e.g. rows written
+        by other processes) and drop the ones no longer in it"""
+        questions = list(questions)
+        current = set(questions)
+        with self._lock:
+            pending, self._pending = list(self._pending), {}
+            removed = self.remove_questions([q for q in self.questions if q not in current])
+        added = self.add_questions([q for q in pending if q in current] + questions)
+        if added or removed:
+            self.save()
+        return added
+
+    def flush_pending(self):
+        """Embed the questions queued by note_write in one pass"""
+        with self._lock:
+            pending, self._pending = list(self._pending), {}
+        return self.add_questions(pending) if pending else 0
+
+    def note_write(self, question, answer=None, weight=None, source=None):
+        """knowledge_store write listener: queue newly saved questions.
+
+        A save_many calls it once per row; queuing keeps the spaCy parse out
+        of the write path and embeds the batch together.
+        """
+        with self._lock:
+            if question not in self.positions:
+                self._pending[question] = None
+
+    def search(self, text, k=5, min_similarity=0.0, exclude=None):
+        """Return up to k (question, similarity) pairs, best first"""
+        self.flush_pending()
+        with self._lock:
+            matrix = self.matrix
+            questions = self.questions
+            size = self._size
+        if size == 0:
+            return []
+
+        query = self._embed([text])[0]
+        if query.shape[0] != matrix.shape[1]:
+            return []
+        scores = matrix @ query
+
+        # Leave room for excluded entries before taking the top k
+        take = min(size, k + (len(exclude) if exclude else 0))
+        if take < size:
+            top = np.argpartition(-scores, take - 1)[:take]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(-scores[top])]
+
+        results = []
+        for idx in top:
+            score = float(scores[idx])
+            if score < min_similarity:
+                break
+            question = questions[idx]
+            if exclude and question in exclude:
+                continue
+            results.append((question, score))
+            if len(results) >= k:
+                break
+        return results
@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import threading
+import networkx as nx
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Default time budget of a retrieve call (milliseconds); slower backends are left out
+RETRIEVE_BUDGET_MS = float(os.environ.get('RETRIEVE_BUDGET_MS', 300))
+
+# Results asked of each backend, as a multiple of the k requested
+RETRIEVE_FANOUT = 2
+
+# Largest budget a request may ask for (milliseconds)
+RETRIEVE_MAX_BUDGET_MS = 5000
+
+# Reciprocal-rank fusion constant: larger values flatten the weight of the top ranks
+RRF_K = 60
+
+# A backend with this many calls still running (e.g. hung past earlier budgets) is skipped
+RETRIEVE_MAX_INFLIGHT = 2
+
+# Longest entity name, in words, matched in a query by the graph backend
+GRAPH_MAX_ENTITY_WORDS = 4
+
+def question_key(question):
+    """Results for the same question from different backends are merged on this"""
+    return " ".join(str(question).split()).casefold()
+
+def normalize_scores(results):
+    """Min-max scale a backend's scores to 0..1 (1.0 when they are all equal)"""
+    scores = [result.get("score") or 0.0 for result in results]
+    low, high = min(scores, default=0.0), max(scores, default=0.0)
+    return [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+
+class Retriever:
+    """One retrieval API over full-text search, vector memory and the knowledge graph.
+
+    Backends are search(query, limit) functions returning ranked dicts with
+    a question and a score (answer and source when they have them). They
+    run concurrently; those that fail or miss the time budget are left
+    out. Lists are merged with reciprocal-rank fusion, each rank's share
+    scaled by the backend's weight and the result's min-max normalized
+    score, and deduplicated by question.
+    """
+
+    def __init__(self, rrf_k=RRF_K, fanout=RETRIEVE_FANOUT, max_inflight=RETRIEVE_MAX_INFLIGHT, answer_for=None):
+        self.rrf_k = rrf_k
+        # answer_for(question) fills in results only found by backends without answers
+        self.answer_for = answer_for
+        self.fanout = fanout
+        self.max_inflight = max_inflight
+        self.backends = {}
+        self.stats = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def add_backend(self, name, search, weight=1.0):
+        with self._lock:
+            self.backends[name] = (search, weight)
+            self.stats.setdefault(name, {"calls": 0, "results": 0, "errors": 0, "timeouts": 0,
+                                         "skipped": 0, "total_ms": 0.0})
+            self._inflight.setdefault(name, 0)
+            # Resized on the next retrieve
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def remove_backend(self, name):
+        with self._lock:
+            self.backends.pop(name, None)
+
+    def _call(self, name, search, query, limit):
+        start = time.perf_counter()
+        try:
+            return list(search(query, limit) or [])
+        finally:
+            with self._lock:
+                self._inflight[name] -= 1
+                self.stats[name]["total_ms"] += 1000 * (time.perf_counter() - start)
+
+    def retrieve(self, query, k=10, budget_ms=RETRIEVE_BUDGET_MS):
+        """Top k results for query from every backend that answers within budget_ms.
+
+        Each result has question, answer, source, score (the fused score),
+        and the rank and normalized score it had in each backend that found it.
+        """
+        deadline = time.monotonic() + budget_ms / 1000
+        futures = {}
+        with self._lock:
+            if not self.backends:
+                return []
+            if self._pool is None:
+                # Room for every backend's calls, including those allowed to overrun
+                self._pool = ThreadPoolExecutor(max_workers=len(self.backends) * self.max_inflight,
+                                                thread_name_prefix="retrieve")
+            pool = self._pool
+            for name, (search, weight) in self.backends.items():
+                if self._inflight[name] >= self.max_inflight:
+                    self.stats[name]["skipped"] += 1
+                    continue
+                self._inflight[name] += 1
+                self.stats[name]["calls"] += 1
+                futures[pool.submit(self._call, name, search, query, k * self.fanout)] = (name, weight)
+        if not futures:
+            return []
+
+        done, late = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        ranked = []
+        with self._lock:
+            for future in late:
+                self.stats[futures[future][0]]["timeouts"] += 1
+            # In registration order, so merged entries do not depend on which backend finished first
+            for future in [future for future in futures if future in done]:
+                name, weight = futures[future]
+                if future.exception() is not None:
+                    print(f"Error retrieving from {name}: {future.exception()}")
+                    self.stats[name]["errors"] += 1
+                    continue
+                results = [result for result in future.result() if result.get("question")]
+                self.stats[name]["results"] += len(results)
+                ranked.append((name, weight, results))
+
+        results = self.fuse(ranked, k)
+        if self.answer_for is not None:
+            for result in results:
+                if result["answer"] is None:
+                    result["answer"] = self.answer_for(result["question"])
+        return results
+
+    def fuse(self, ranked, k):
+        """Merge (backend, weight, results) lists with score-scaled reciprocal-rank fusion.
+
+        Scaling by the normalized score keeps a backend's weak matches from
+        outranking another backend's confident one, as they do in plain RRF.
+        """
+        merged = {}
+        for name, weight, results in ranked:
+            seen = set()
+            for rank, (result, normalized) in enumerate(zip(results, normalize_scores(results)), 1):
+                key = question_key(result["question"])
+                # A backend may list a question more than once (e.g. several memory entries)
+                if key in seen:
+                    continue
+                seen.add(key)
+                entry = merged.get(key)
+                if entry is None:
+                    entry = merged[key] = {"question": result["question"], "answer": None, "source": None,
+                                           "score": 0.0, "ranks": {}, "scores": {}}
+                if entry["answer"] is None and result.get("answer") is not None:
+                    entry["answer"] = result["answer"]
+                    entry["source"] = result.get("source")
+                entry["score"] += weight * normalized / (self.rrf_k + rank)
+                entry["ranks"][name] = rank
+                entry["scores"][name] = normalized
+        return sorted(merged.values(),
+                      key=lambda entry: (entry["score"], sum(entry["scores"].values())), reverse=True)[:k]
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                name: dict(stats, avg_ms=stats["total_ms"] / stats["calls"] if stats["calls"] else 0.0,
+                           inflight=self._inflight[name])
+                for name, stats in self.stats.items()
+            }
+
+def fulltext_search(query, limit):
+    """Elasticsearch when configured, else the database's ranked full-text search"""
+    # Import here to avoid circular imports
+    import search_engine
+    return search_engine.search(query, limit)
+
+def memory_search(query, limit):
+    """Nearest questions in AdvancedMemory's FAISS index"""
+    # Import here to avoid circular imports
+    from advanced_memory import advanced_memory
+    return [dict(result, score=result["similarity"]) for result in advanced_memory.search(query, k=limit)]
+
+def graph_search(graph):
+    """Backend over a knowledge graph (a KnowledgeGraph or its networkx graph).
+
+    Entity nodes named in the query (up to GRAPH_MAX_ENTITY_WORDS words)
+    are looked up directly; questions linked to them are scored by the
+    entities they share with the query, rarer entities counting more.
+    """
+    # Entity names by casefolded name, rebuilt when the graph's node count changes
+    cache = {"nodes": -1, "entities": {}}
+
+    def search(query, limit):
+        nx_graph = graph if isinstance(graph, nx.Graph) else graph.graph
+        if cache["nodes"] != nx_graph.number_of_nodes():
+            cache["entities"] = {str(node).casefold(): node for node, node_type in nx_graph.nodes(data="type")
+                                 if node_type == "entity"}
+            cache["nodes"] = nx_graph.number_of_nodes()
+        entities = cache["entities"]
+        words = re.findall(r"\w+", query)
+        matched = {
+            entities.get(" ".join(words[start:start + size]).casefold())
+            for size in range(1, GRAPH_MAX_ENTITY_WORDS + 1)
+            for start in range(len(words) - size + 1)
+        }
+        scores = {}
+        for entity in matched:
+            if entity is None or entity not in nx_graph:
+                continue
+            questions = [node for node in nx_graph.predecessors(entity)
+                         if nx_graph.nodes[node].get("type") == "question"]
+            for question in questions:
+                scores[question] = scores.get(question, 0.0) + 1.0 / len(questions)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        return [{"question": question, "score": score} for question, score in best]
+    return search
+
+def stored_answer(question):
+    # Import here to avoid circular imports
+    from knowledge_store import knowledge_store
+    return knowledge_store.get_answer(question)
+
+def create_retriever():
+    """Full-text search and vector memory; the app adds the graph when it has one"""
+    retriever = Retriever(answer_for=stored_answer)
+    retriever.add_backend("fulltext", fulltext_search)
+    retriever.add_backend("memory", memory_search)
+    return retriever
+
+# Create singleton instance
+retriever = create_retriever()
+
+def retrieve(query, k=10, budget_ms=RETRIEVE_BUDGET_MS):
+    return retriever.retrieve(query, k, budget_ms)
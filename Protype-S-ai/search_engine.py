@@ -1,6 +1,10 @@
 
 import os
-from elasticsearch import Elasticsearch
+import atexit
+import hashlib
+import threading
+from datetime import datetime
+from elasticsearch import Elasticsearch, helpers
 from elasticsearch.exceptions import ConnectionError, NotFoundError
 import database
 
@@ -13,6 +17,56 @@ if HAS_ELASTICSEARCH:
     es_url = os.environ.get('ELASTICSEARCH_URL')
     es_client = Elasticsearch(es_url)
 
+# Documents per bulk request when syncing from the database
+ES_SYNC_CHUNK_SIZE = int(os.environ.get('ES_SYNC_CHUNK_SIZE', 500))
+
+# index_document buffering: flush at this many pending documents or after this many seconds
+ES_BUFFER_SIZE = int(os.environ.get('ES_BUFFER_SIZE', 500))
+ES_FLUSH_INTERVAL = float(os.environ.get('ES_FLUSH_INTERVAL', 1.0))
+
+# New documents become searchable within this interval; writes never force a refresh
+ES_REFRESH_INTERVAL = os.environ.get('ES_REFRESH_INTERVAL', '1s')
+
+# Index holding the sync high-water mark and the stable-id migration marker
+SYNC_STATE_INDEX = "knowledge_sync"
+
+# Flushes a buffered document is tried in before it is dropped
+ES_INDEX_MAX_ATTEMPTS = int(os.environ.get('ES_INDEX_MAX_ATTEMPTS', 5))
+
+sync_stats = {"syncs": 0, "indexed": 0, "failed": 0}
+
+def document_id(question):
+    """Stable _id: a question always maps to the same document"""
+    return hashlib.sha1(question.encode('utf-8')).hexdigest()
+
+def _es_date(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    # SQLite stores CURRENT_TIMESTAMP as 'YYYY-MM-DD HH:MM:SS'
+    return str(value).replace(' ', 'T', 1)
+
+def make_document(question, answer, weight, source, created_at=None, modified_at=None, created_by=None, modified_by=None):
+    doc = {
+        "question": question,
+        "answer": answer,
+        "weight": weight,
+        "source": source
+    }
+    
+    # Add version control fields if available
+    if created_at:
+        doc["created_at"] = _es_date(created_at)
+    if created_by:
+        doc["created_by"] = created_by
+    if modified_at:
+        doc["modified_at"] = _es_date(modified_at)
+    if modified_by:
+        doc["modified_by"] = modified_by
+    return doc
+
+def _index_action(doc):
+    return {"_op_type": "index", "_index": "knowledge", "_id": document_id(doc["question"]), "_source": doc}
+
 def init_elasticsearch():
     """Initialize Elasticsearch index and mappings"""
     if not HAS_ELASTICSEARCH or not es_client:
@@ -28,6 +82,7 @@ def init_elasticsearch():
                     "settings": {
                         "number_of_shards": 1,
                         "number_of_replicas": 0,
+                        "refresh_interval": ES_REFRESH_INTERVAL,
                         "analysis": {
                             "analyzer": {
                                 "custom_analyzer": {
@@ -69,104 +124,169 @@ def init_elasticsearch():
                     }
                 }
             )
+        elif _load_state("migration") is None and _load_sync_state() is None:
+            # Indexed before documents had stable ids: every sync added duplicates.
+            # Runs once; the marker below keeps later boots from clearing the index.
+            es_client.delete_by_query(index="knowledge", body={"query": {"match_all": {}}}, refresh=True)
+        if _load_state("migration") is None:
+            es_client.index(index=SYNC_STATE_INDEX, id="migration", body={"stable_ids": True})
         return True
     except Exception as e:
         print(f"Elasticsearch initialization error: {e}")
         return False
 
-def sync_database_to_elasticsearch():
-    """Sync all database records to Elasticsearch"""
+def _load_state(doc_id):
+    try:
+        return es_client.get(index=SYNC_STATE_INDEX, id=doc_id)["_source"]
+    except NotFoundError:
+        return None
+
+def _load_sync_state():
+    return _load_state("knowledge")
+
+def sync_database_to_elasticsearch(full=False):
+    """Index knowledge rows modified since the last sync, or all rows when full.
+
+    Rows stream from a database cursor into chunked bulk requests, and each
+    document's _id comes from its question, so a re-sync overwrites instead
+    of duplicating. The high-water mark (latest modified_at indexed) is kept
+    in the knowledge_sync index and only advances when every document of
+    the sync was indexed.
+    """
     if not HAS_ELASTICSEARCH or not es_client:
         return False
         
     try:
-        # Get all data from database
-        data = database.load_data()
-        if not data:
+        state = None if full else _load_sync_state()
+        since = state.get("high_water_mark") if state else None
+        latest = None
+
+        def actions():
+            nonlocal latest
+            for row in database.iter_knowledge(modified_since=since, chunk_size=ES_SYNC_CHUNK_SIZE):
+                modified_at = row["modified_at"]
+                if modified_at is not None and (latest is None or modified_at > latest):
+                    latest = modified_at
+                row.pop("id")
+                yield _index_action(make_document(**row))
+
+        indexed = failed = 0
+        for ok, item in helpers.streaming_bulk(es_client, actions(), chunk_size=ES_SYNC_CHUNK_SIZE,
+                                               raise_on_error=False, max_retries=3):
+            if ok:
+                indexed += 1
+            else:
+                failed += 1
+                if failed <= 5:
+                    print(f"Elasticsearch sync error: {item}")
+        sync_stats["syncs"] += 1
+        sync_stats["indexed"] += indexed
+        sync_stats["failed"] += failed
+
+        if failed:
+            print(f"Elasticsearch sync: {failed} documents failed, keeping the previous high-water mark")
             return False
-            
-        # Bulk index data
-        bulk_data = []
-        for question, answers in data.items():
-            for answer_data in answers:
-                # Get additional fields if available
-                history = database.get_knowledge_history(question)
-                created_at = None
-                created_by = None
-                modified_at = None
-                modified_by = None
-                
-                if history and len(history) > 0:
-                    created_at = history[0].get('created_at')
-                    created_by = history[0].get('created_by')
-                    modified_at = history[0].get('modified_at')
-                    modified_by = history[0].get('modified_by')
-                
-                # Add index action
-                bulk_data.append({"index": {"_index": "knowledge"}})
-                
-                # Add document
-                doc = {
-                    "question": question,
-                    "answer": answer_data["answer"],
-                    "weight": answer_data["weight"],
-                    "source": answer_data["source"]
-                }
-                
-                # Add version control fields if available
-                if created_at:
-                    doc["created_at"] = created_at
-                if created_by:
-                    doc["created_by"] = created_by
-                if modified_at:
-                    doc["modified_at"] = modified_at
-                if modified_by:
-                    doc["modified_by"] = modified_by
-                    
-                bulk_data.append(doc)
-                
-        if bulk_data:
-            es_client.bulk(body=bulk_data, refresh=True)
-            return True
-        return False
+        if indexed:
+            es_client.indices.refresh(index="knowledge")
+        if latest is not None:
+            es_client.index(index=SYNC_STATE_INDEX, id="knowledge", body={"high_water_mark": str(latest)})
+        return True
     except Exception as e:
         print(f"Elasticsearch sync error: {e}")
         return False
 
+class IndexBuffer:
+    """Write-behind buffer for index_document.
+
+    Pending documents are coalesced by id and sent in one bulk request once
+    ES_BUFFER_SIZE are waiting or every ES_FLUSH_INTERVAL seconds. There is
+    no per-document refresh; the index refresh_interval makes them
+    searchable. Documents that fail are queued again for the next flush,
+    unless a newer version is already waiting, and dropped after
+    max_attempts flushes.
+    """
+
+    def __init__(self, max_size=ES_BUFFER_SIZE, flush_interval=ES_FLUSH_INTERVAL, max_attempts=ES_INDEX_MAX_ATTEMPTS):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.stats = {"buffered": 0, "flushes": 0, "indexed": 0, "failed": 0, "retried": 0, "dropped": 0}
+        self._pending = {}
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, doc):
+        with self._lock:
+            self._pending[document_id(doc["question"])] = doc
+            self.stats["buffered"] += 1
+            full = len(self._pending) >= self.max_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="es-index-buffer", daemon=True)
+                self._thread.start()
+        if full:
+            self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Send pending documents now; returns the number indexed"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            try:
+                indexed, errors = helpers.bulk(es_client, [_index_action(doc) for doc in pending.values()],
+                                               raise_on_error=False, max_retries=3)
+                failed = {next(iter(item.values())).get("_id") for item in errors}
+            except Exception as e:
+                print(f"Elasticsearch indexing error: {e}")
+                indexed, failed = 0, set(pending)
+            if failed:
+                print(f"Elasticsearch indexing error: {len(failed)} documents not indexed")
+            self._requeue(pending, failed)
+            self.stats["flushes"] += 1
+            self.stats["indexed"] += indexed
+            self.stats["failed"] += len(failed)
+            return indexed
+
+    def _requeue(self, sent, failed):
+        with self._lock:
+            for doc_id in sent:
+                attempts = self._attempts.pop(doc_id, 0) + 1
+                if doc_id not in failed or doc_id in self._pending:
+                    continue
+                if attempts >= self.max_attempts:
+                    self.stats["dropped"] += 1
+                    print(f"Elasticsearch indexing: dropping document {doc_id} after {attempts} attempts")
+                    continue
+                self._pending[doc_id] = sent[doc_id]
+                self._attempts[doc_id] = attempts
+                self.stats["retried"] += 1
+
+# Create singleton instance
+index_buffer = IndexBuffer()
+
 def index_document(question, answer, weight, source, created_at=None, modified_at=None, created_by=None, modified_by=None):
-    """Index a single document in Elasticsearch"""
+    """Queue a document for indexing in Elasticsearch; sent by the write-behind buffer"""
     if not HAS_ELASTICSEARCH or not es_client:
         return False
         
-    try:
-        doc = {
-            "question": question,
-            "answer": answer,
-            "weight": weight,
-            "source": source
-        }
-        
-        # Add version control fields if available
-        if created_at:
-            doc["created_at"] = created_at
-        if created_by:
-            doc["created_by"] = created_by
-        if modified_at:
-            doc["modified_at"] = modified_at
-        if modified_by:
-            doc["modified_by"] = modified_by
-            
-        es_client.index(index="knowledge", body=doc, refresh=True)
-        return True
-    except Exception as e:
-        print(f"Elasticsearch indexing error: {e}")
-        return False
+    index_buffer.add(make_document(question, answer, weight, source, created_at, modified_at, created_by, modified_by))
+    return True
 
 def search(query, limit=10, min_score=0.1):
     """Perform advanced search using Elasticsearch"""
     if not HAS_ELASTICSEARCH or not es_client:
-        # Fallback to database search if Elasticsearch is not available
-        return database.search_knowledge(query, limit)
+        # Fallback to database full-text search if Elasticsearch is not available
+        return database.full_text_search(query, limit)
         
     try:
         response = es_client.search(
@@ -213,10 +333,15 @@ def search(query, limit=10, min_score=0.1):
         return results
     except Exception as e:
         print(f"Elasticsearch search error: {e}")
-        # Fallback to database search
-        return database.search_knowledge(query, limit)
+        # Fallback to database full-text search
+        return database.full_text_search(query, limit)
 
 # Initialize Elasticsearch
 if HAS_ELASTICSEARCH:
     if init_elasticsearch():
         sync_database_to_elasticsearch()
+
+    # Keep the index current between syncs
+    from knowledge_store import knowledge_store
+    knowledge_store.add_write_listener(index_document)
+    atexit.register(index_buffer.flush)
@@ -0,0 +1,339 @@
+import os
+import time
+import threading
+import numpy as np
+import faiss
+
+import database
+from memory_index import EMBEDDING_DIM
+
+# Cosine similarity above which a previously answered question counts as the same question
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', 0.92))
+
+# Seconds a cached answer stays valid (0 disables expiry)
+SEMANTIC_CACHE_TTL = float(os.environ.get('SEMANTIC_CACHE_TTL', 7 * 24 * 3600))
+
+# Minimum seconds between checks for entries added by other processes
+SEMANTIC_CACHE_SYNC_INTERVAL = float(os.environ.get('SEMANTIC_CACHE_SYNC_INTERVAL', 5.0))
+
+# Seconds between full comparisons with the table. Ids from PostgreSQL
+# sequences can commit out of order, so the incremental id scan may miss a
+# row; the full resync picks it up, and drops rows deleted elsewhere.
+SEMANTIC_CACHE_FULL_RESYNC_INTERVAL = float(os.environ.get('SEMANTIC_CACHE_FULL_RESYNC_INTERVAL', 300.0))
+
+class SemanticCache:
+    """Answers to previously asked questions, looked up by meaning.
+
+    Questions are embedded with the AdvancedMemory MiniLM model and kept in
+    an inner-product FAISS index over unit vectors; entries live in the
+    ``semantic_cache`` table next to ``knowledge``. A lookup whose nearest
+    neighbour scores at least ``threshold`` returns the stored answer
+    instead of calling the LLM again.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 sync_interval=SEMANTIC_CACHE_SYNC_INTERVAL,
+                 full_resync_interval=SEMANTIC_CACHE_FULL_RESYNC_INTERVAL, embed=None):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self.full_resync_interval = full_resync_interval
+        self._embed = embed
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        """Forget the in-memory index; it is rebuilt from the table on next use"""
+        with self._lock:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(EMBEDDING_DIM))
+            self.entries = {}  # row id -> (question, source, created_at)
+            self.ids_by_question = {}
+            self._max_id = 0
+            self._loaded = False
+            self._last_sync = 0.0
+            self._last_full_sync = 0.0
+            self.stats = {"hits": 0, "misses": 0, "expired": 0, "stores": 0,
+                          "invalidated": 0, "full_resyncs": 0, "lookup_time": 0.0}
+
+    def embed(self, texts):
+        """Unit-normalized embeddings, or None when no embedding model is available"""
+        if self._embed is None:
+            # Import here to avoid circular imports
+            from advanced_memory import advanced_memory
+            if advanced_memory.model is None:
+                return None
+            self._embed = advanced_memory.get_embeddings
+        vectors = np.ascontiguousarray(self._embed(texts), dtype='float32')
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _expired(self, created_at, now=None):
+        return self.ttl > 0 and created_at < (now or time.time()) - self.ttl
+
+    def _sync(self, force=False):
+        """Load entries added since the last sync, including those from other processes"""
+        now = time.monotonic()
+        if self._loaded and not force and now - self._last_sync < self.sync_interval:
+            return
+        if self._loaded and now - self._last_full_sync >= self.full_resync_interval:
+            self._full_resync()
+            self._last_full_sync = now
+        rows = self._select_rows("id > {placeholder}", (self._max_id,))
+        if rows is None:
+            return
+
+        self._add_rows(rows)
+        if not self._loaded:
+            self._last_full_sync = now
+        self._loaded = True
+        self._last_sync = now
+
+    def _select_rows(self, condition, params):
+        conn, is_postgres = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholder = "%s" if is_postgres else "?"
+            cursor.execute(
+                "SELECT id, question, source, created_at, embedding FROM semantic_cache WHERE "
+                + condition.format(placeholder=placeholder),
+                params
+            )
+            return cursor.fetchall()
+        except Exception as e:
+            print(f"Error loading semantic cache: {e}")
+            return None
+        finally:
+            database.release_connection(conn, is_postgres)
+
+    def _full_resync(self):
+        """Add rows the id scan skipped and forget rows deleted by other processes"""
+        conn, is_postgres = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM semantic_cache")
+            ids = {row[0] for row in cursor.fetchall()}
+        except Exception as e:
+            print(f"Error loading semantic cache: {e}")
+            return
+        finally:
+            database.release_connection(conn, is_postgres)
+
+        self._forget([row_id for row_id in self.entries if row_id not in ids])
+        missing = [row_id for row_id in ids if row_id not in self.entries and row_id <= self._max_id]
+        for offset in range(0, len(missing), 500):
+            chunk = missing[offset:offset + 500]
+            rows = self._select_rows(
+                "id IN (" + ", ".join(["{placeholder}"] * len(chunk)) + ")", tuple(chunk))
+            if rows:
+                self._add_rows(rows)
+        self.stats["full_resyncs"] += 1
+
+    def _add_rows(self, rows):
+        rows = [row for row in rows if row[0] not in self.entries and not self._expired(row[3])]
+        if not rows:
+            return
+        # A re-stored question gets a new row; drop the old one from the index
+        replaced = [self.ids_by_question[row[1]] for row in rows if row[1] in self.ids_by_question]
+        self._forget(replaced)
+
+        ids = np.array([row[0] for row in rows], dtype='int64')
+        vectors = np.vstack([np.frombuffer(bytes(row[4]), dtype='float32') for row in rows])
+        self.index.add_with_ids(vectors, ids)
+        for row_id, question, source, created_at, _ in rows:
+            self.entries[row_id] = (question, source, created_at)
+            self.ids_by_question[question] = row_id
+            self._max_id = max(self._max_id, row_id)
+
+    def _forget(self, ids):
+        ids = [row_id for row_id in ids if row_id in self.entries]
+        if not ids:
+            return
+        self.index.remove_ids(np.array(ids, dtype='int64'))
+        for row_id in ids:
+            question = self.entries.pop(row_id)[0]
+            if self.ids_by_question.get(question) == row_id:
+                del self.ids_by_question[question]
+
+    def _fetch_answer(self, row_id):
+        conn, is_postgres = database.get_connection()
+        try:
+            cursor = conn.cursor()
+            placeholder = "%s" if is_postgres else "?"
+            cursor.execute(f"SELECT answer FROM semantic_cache WHERE id = {placeholder}", (row_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            print(f"Error reading semantic cache: {e}")
+            return None
+        finally:
+            database.release_connection(conn, is_postgres)
+
+    def _miss(self):
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def lookup(self, question):
+        """Return {question, answer, source, similarity} for a cached paraphrase, or None"""
+        start = time.perf_counter()
+        try:
+            # The lock covers only the index; embedding and the answer fetch run unlocked
+            with self._lock:
+                self._sync()
+                empty = self.index.ntotal == 0
+            if empty:
+                return self._miss()
+            vector = self.embed([question])
+            if vector is None:
+                return self._miss()
+
+            with self._lock:
+                scores, ids = self.index.search(vector, 1)
+                score, row_id = float(scores[0][0]), int(ids[0][0])
+                entry = self.entries.get(row_id)
+            if row_id < 0 or score < self.threshold or entry is None:
+                return self._miss()
+
+            cached_question, source, created_at = entry
+            if self._expired(created_at):
+                self._delete_rows([row_id])
+                with self._lock:
+                    self.stats["expired"] += 1
+                return self._miss()
+
+            answer = self._fetch_answer(row_id)
+            if answer is None:
+                # Invalidated by another process
+                with self._lock:
+                    self._forget([row_id])
+                return self._miss()
+
+            with self._lock:
+                self.stats["hits"] += 1
+            return {"question": cached_question, "answer": answer, "source": source, "similarity": score}
+        except Exception as e:
+            print(f"Error looking up semantic cache: {e}")
+            return None
+        finally:
+            with self._lock:
+                self.stats["lookup_time"] += time.perf_counter() - start
+
+    def store(self, question, answer, source):
+        """Cache an answer produced for question; returns False when it cannot be embedded"""
+        return self.store_many([(question, answer, source)]) == 1
+
+    def store_many(self, items):
+        """Cache (question, answer, source) items with one embedding call and one transaction.
+
+        Returns the number stored: 0 when they cannot be embedded or saved.
+        """
+        if not items:
+            return 0
+        try:
+            vectors = self.embed([question for question, _, _ in items])
+        except Exception as e:
+            print(f"Error embedding question for semantic cache: {e}")
+            return 0
+        if vectors is None:
+            return 0
+
+        created_at = time.time()
+        embeddings = [vector.tobytes() for vector in vectors]
+
+        def insert(cursor, is_postgres):
+            row_ids = []
+            for (question, answer, source), embedding in zip(items, embeddings):
+                if is_postgres:
+                    cursor.execute("DELETE FROM semantic_cache WHERE question = %s", (question,))
+                    cursor.execute(
+                        "INSERT INTO semantic_cache (question, answer, source, created_at, embedding) "
+                        "VALUES (%s, %s, %s, %s, %s) RETURNING id",
+                        (question, answer, source, created_at, embedding)
+                    )
+                    row_ids.append(cursor.fetchone()[0])
+                    continue
+                cursor.execute("DELETE FROM semantic_cache WHERE question = ?", (question,))
+                cursor.execute(
+                    "INSERT INTO semantic_cache (question, answer, source, created_at, embedding) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (question, answer, source, created_at, embedding)
+                )
+                row_ids.append(cursor.lastrowid)
+            return row_ids
+
+        try:
+            row_ids = database.run_write(insert)
+        except Exception as e:
+            print(f"Error saving to semantic cache: {e}")
+            return 0
+
+        with self._lock:
+            self._add_rows([(row_id, question, source, created_at, embedding)
+                            for row_id, (question, _, source), embedding in zip(row_ids, items, embeddings)])
+            self.stats["stores"] += len(items)
+        return len(items)
+
+    def _delete_rows(self, ids):
+        if not ids:
+            return 0
+
+        def delete(cursor, is_postgres):
+            placeholder = "%s" if is_postgres else "?"
+            cursor.executemany(f"DELETE FROM semantic_cache WHERE id = {placeholder}", [(row_id,) for row_id in ids])
+
+        try:
+            database.run_write(delete)
+        except Exception as e:
+            print(f"Error deleting from semantic cache: {e}")
+            return 0
+        with self._lock:
+            self._forget(ids)
+        return len(ids)
+
+    def invalidate(self, question=None, source=None):
+        """Drop cached answers for a question and/or everything from a source"""
+        with self._lock:
+            self._sync(force=True)
+            ids = [
+                row_id for row_id, (cached_question, cached_source, _) in self.entries.items()
+                if (question is None or cached_question == question) and (source is None or cached_source == source)
+            ]
+        count = self._delete_rows(ids)
+        self.stats["invalidated"] += count
+        return count
+
+    def purge_expired(self):
+        """Delete entries older than the TTL"""
+        if self.ttl <= 0:
+            return 0
+
+        def purge(cursor, is_postgres):
+            placeholder = "%s" if is_postgres else "?"
+            cursor.execute(f"DELETE FROM semantic_cache WHERE created_at < {placeholder}", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+        try:
+            count = database.run_write(purge)
+        except Exception as e:
+            print(f"Error purging semantic cache: {e}")
+            return 0
+        with self._lock:
+            self._forget([row_id for row_id, entry in self.entries.items() if self._expired(entry[2])])
+        return count
+
+    def note_write(self, question, answer, weight, source):
+        """Knowledge write listener: a re-taught question must not be served from the cache"""
+        if question in self.ids_by_question:
+            self.invalidate(question=question)
+
+    def get_stats(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(
+            self.stats,
+            entries=len(self.entries),
+            hit_rate=self.stats["hits"] / lookups if lookups else 0.0,
+            avg_lookup_ms=1000 * self.stats["lookup_time"] / lookups if lookups else 0.0
+        )
+
+# Create singleton instance
+semantic_cache = SemanticCache()
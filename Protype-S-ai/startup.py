@@ -0,0 +1,77 @@
+import os
+import logging
+import threading
+from database import init_db
+from write_behind import write_behind
+
+logger = logging.getLogger('protype_ai')
+
+# Set to 0 to serve without the learning manager and autonomous agent threads
+BACKGROUND_AGENTS_ENABLED = os.environ.get('BACKGROUND_AGENTS', '1') != '0'
+
+_started = False
+_start_lock = threading.Lock()
+
+def init_storage():
+    """Create the database tables and replay side effects left by the last run"""
+    try:
+        init_db()
+        logger.info("Database initialized successfully")
+    except Exception as e:
+        logger.error(f"Error initializing database: {e}")
+
+    # Save answers still queued when the server last stopped
+    try:
+        replayed = write_behind.replay()
+        if replayed:
+            logger.info(f"Replaying {replayed} queued side effects")
+    except Exception as e:
+        logger.error(f"Error replaying side effects: {e}")
+
+def start_ai_components():
+    """Start continuous learning and the supervised autonomous agent in background threads"""
+    try:
+        # Initialize enhanced AI components
+        from symbolic_reasoning import symbolic_reasoning
+        from temporal_awareness import temporal_awareness
+        from self_reflection import self_reflection
+        from advanced_memory import advanced_memory
+        from autonomous_agent import autonomous_agent
+        from learning_manager import learning_manager
+    except Exception as e:
+        logger.error(f"Error initializing AI components: {e}")
+        return
+
+    # Start the continuous learning process in a separate thread
+    def start_learning_thread():
+        logger.info("Starting continuous learning processes...")
+        try:
+            learning_manager.start_learning()
+        except Exception as e:
+            logger.error(f"Error starting learning: {e}")
+
+    # Start autonomous agent with limited autonomy
+    def start_agent_thread():
+        logger.info("Starting autonomous agent in background...")
+        try:
+            autonomous_agent.start_agent(autonomous_mode=False)
+        except Exception as e:
+            logger.error(f"Error starting agent: {e}")
+
+    for target in (start_learning_thread, start_agent_thread):
+        threading.Thread(target=target, daemon=True).start()
+
+def start_services():
+    """Everything a server process runs before taking requests; later calls do nothing.
+
+    Shared by main.py and async_app's startup hook, so every way of
+    launching the app replays queued side effects and starts the agents.
+    """
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        init_storage()
+        if BACKGROUND_AGENTS_ENABLED:
+            start_ai_components()
+        _started = True
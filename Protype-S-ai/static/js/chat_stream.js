@@ -0,0 +1,74 @@
+/**
+ * chat_stream.js - incremental rendering of streamed chat answers (server-sent events)
+ */
+
+/**
+ * POST a JSON payload and dispatch the server-sent events of the response.
+ * EventSource only supports GET, so the stream is read with fetch.
+ *
+ * handlers: {status(data), chunk(data), done(data), error(data)}
+ * Resolves once the stream ends; rejects on network errors.
+ */
+function streamChat(url, payload, handlers) {
+    return fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(payload),
+    }).then(response => {
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.startsWith('text/event-stream')) {
+            // Validation errors come back as plain JSON
+            return response.json().then(data => {
+                (handlers.error || function() {})({ message: data.message || data.error });
+            });
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        function dispatch(block) {
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    event = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    dataLines.push(line.slice(5).trimStart());
+                }
+            });
+            if (dataLines.length && handlers[event]) {
+                handlers[event](JSON.parse(dataLines.join('\n')));
+            }
+        }
+
+        function read() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    if (buffer.trim()) dispatch(buffer);
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+                // Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    dispatch(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                }
+                return read();
+            });
+        }
+
+        return read();
+    });
+}
+
+/**
+ * Whether this browser can read a fetch response as a stream
+ */
+function canStreamChat() {
+    return typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined';
+}
@@ -0,0 +1,156 @@
+import os
+import time
+import queue
+import atexit
+import itertools
+import threading
+from concurrent.futures import Future, CancelledError
+
+# Worker threads running tasks in-process when there is no Celery broker
+TASK_WORKERS = int(os.environ.get('TASK_WORKERS', 2))
+
+# Background tasks waiting beyond this are refused; interactive tasks get
+# another quarter of it as headroom, so a learning backlog cannot lock users out
+TASK_MAX_QUEUE = int(os.environ.get('TASK_MAX_QUEUE', 100))
+
+# Seconds shutdown waits for running tasks at interpreter exit
+TASK_SHUTDOWN_TIMEOUT = float(os.environ.get('TASK_SHUTDOWN_TIMEOUT', 30))
+
+INTERACTIVE = 0
+BACKGROUND = 1
+# Queued after every task, so workers exit once the queue is drained
+_STOP = 2
+
+class TaskQueueFull(Exception):
+    """The executor's queue is at its depth limit, or it is shut down"""
+
+class LocalResult:
+    """Handle for a task run by TaskExecutor, with the AsyncResult methods callers use"""
+
+    def __init__(self, task_id, future):
+        self.id = task_id
+        self._future = future
+        self.deduplicated = None
+
+    @property
+    def state(self):
+        if self._future.cancelled():
+            return "REVOKED"
+        if not self._future.done():
+            return "STARTED" if self._future.running() else "PENDING"
+        return "FAILURE" if self._future.exception() else "SUCCESS"
+
+    def ready(self):
+        return self._future.done()
+
+    def successful(self):
+        return self.state == "SUCCESS"
+
+    def get(self, timeout=None, propagate=True):
+        try:
+            return self._future.result(timeout)
+        except (Exception, CancelledError) as e:
+            if propagate:
+                raise
+            return e
+
+    @property
+    def result(self):
+        return self.get(timeout=0, propagate=False) if self.ready() else None
+
+class TaskExecutor:
+    """Runs tasks on a bounded pool of worker threads in this process.
+
+    Interactive tasks are taken before queued background tasks; within a
+    priority, tasks run in submission order. Threads, not processes: tasks
+    such as train_knowledge_gnn update state of this process.
+    """
+
+    def __init__(self, workers=TASK_WORKERS, max_queue=TASK_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "cancelled": 0, "max_depth": 0}
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._threads = []
+        self._closed = False
+
+    def submit(self, fn, task_id, interactive=False):
+        """Queue fn() to run on a worker thread; raises TaskQueueFull when over the limit"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise TaskQueueFull("task executor is shut down")
+            limit = self.max_queue + (self.max_queue // 4 if interactive else 0)
+            if self._queue.qsize() >= limit:
+                self.stats["rejected"] += 1
+                raise TaskQueueFull(f"{self._queue.qsize()} tasks already queued")
+            if not self._threads:
+                self._threads = [threading.Thread(target=self._run, name=f"task-worker-{n}", daemon=True)
+                                 for n in range(self.workers)]
+                for thread in self._threads:
+                    thread.start()
+            self._pending[task_id] = future
+            self._queue.put((INTERACTIVE if interactive else BACKGROUND, next(self._order), task_id, fn, future))
+            self.stats["submitted"] += 1
+            self.stats["max_depth"] = max(self.stats["max_depth"], self._queue.qsize())
+        return LocalResult(task_id, future)
+
+    def get_result(self, task_id):
+        """Handle for a queued or running task, or None"""
+        with self._lock:
+            future = self._pending.get(task_id)
+        return LocalResult(task_id, future) if future else None
+
+    def _run(self):
+        while True:
+            priority, _, task_id, fn, future = self._queue.get()
+            if priority == _STOP:
+                return
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn())
+                except BaseException as e:
+                    future.set_exception(e)
+            with self._lock:
+                self._pending.pop(task_id, None)
+                if future.cancelled():
+                    self.stats["cancelled"] += 1
+                elif future.exception():
+                    self.stats["failed"] += 1
+                else:
+                    self.stats["completed"] += 1
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, queued=self._queue.qsize(), workers=len(self._threads))
+
+    def shutdown(self, wait=True, cancel_pending=False, timeout=None):
+        """Stop accepting tasks and let the workers finish.
+
+        Queued tasks still run unless cancel_pending; with wait, returns once
+        the workers exit or timeout seconds have passed.
+        """
+        with self._lock:
+            self._closed = True
+            if cancel_pending:
+                for future in self._pending.values():
+                    future.cancel()
+            threads = self._threads
+            for _ in threads:
+                self._queue.put((_STOP, next(self._order), None, None, None))
+        if wait:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            for thread in threads:
+                thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+
+# Create singleton instance
+task_executor = TaskExecutor()
+
+# Finish running tasks at exit; queued learning work is dropped
+atexit.register(task_executor.shutdown, cancel_pending=True, timeout=TASK_SHUTDOWN_TIMEOUT)
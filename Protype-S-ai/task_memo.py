@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import threading
+
+# Seconds a finished learning task's result is reused for the same topic or question
+TASK_FRESHNESS_SECONDS = int(os.environ.get('TASK_FRESHNESS_SECONDS', 6 * 3600))
+
+# Failed results are reused for a shorter time, so the work is retried soon
+TASK_ERROR_FRESHNESS_SECONDS = int(os.environ.get('TASK_ERROR_FRESHNESS_SECONDS', 300))
+
+# A claimed task that has not finished after this long is treated as lost
+TASK_INFLIGHT_SECONDS = int(os.environ.get('TASK_INFLIGHT_SECONDS', 600))
+
+STAT_NAMES = ("enqueued", "collapsed", "memoized", "executed", "failed")
+
+def normalize_key(value):
+    """A topic or question as an idempotency key: case, whitespace and underscores folded"""
+    return " ".join(str(value).replace("_", " ").split()).casefold()
+
+def summarize_stats(stats):
+    stats = {name: int(stats.get(name, 0)) for name in STAT_NAMES}
+    # Enqueues that ran no new work
+    stats["avoided"] = stats["collapsed"] + stats["memoized"]
+    requested = stats["enqueued"] + stats["avoided"]
+    stats["avoided_rate"] = stats["avoided"] / requested if requested else 0.0
+    return stats
+
+class MemoryTaskMemo:
+    """Idempotency records for tasks run in this process (the memory:// broker).
+
+    A record is either in flight ({"state": "pending", "task_id"}) or
+    finished ({"state": "done", "task_id", "result"}), and expires after
+    its ttl.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = {}
+        self.stats = dict.fromkeys(STAT_NAMES, 0)
+
+    def _get(self, key):
+        record = self._records.get(key)
+        if record is not None and record[1] <= time.monotonic():
+            del self._records[key]
+            return None
+        return record[0] if record else None
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def claim(self, key, task_id, ttl=TASK_INFLIGHT_SECONDS):
+        """Mark key in flight under task_id, unless it has a record.
+
+        Returns the existing record, or None if the claim was taken.
+        """
+        with self._lock:
+            record = self._get(key)
+            if record is None:
+                self._records[key] = ({"state": "pending", "task_id": task_id}, time.monotonic() + ttl)
+            return record
+
+    def complete(self, key, task_id, result, ttl):
+        """Memoize a finished task's result for ttl seconds"""
+        with self._lock:
+            self._records[key] = ({"state": "done", "task_id": task_id, "result": result}, time.monotonic() + ttl)
+
+    def release(self, key, task_id):
+        """Drop task_id's in-flight claim, e.g. when it could not be enqueued"""
+        with self._lock:
+            record = self._get(key)
+            if record and record["state"] == "pending" and record["task_id"] == task_id:
+                del self._records[key]
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def get_stats(self):
+        with self._lock:
+            return summarize_stats(self.stats)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self.stats = dict.fromkeys(STAT_NAMES, 0)
+
+class RedisTaskMemo:
+    """Idempotency records shared by every process and worker through Redis.
+
+    Same records as MemoryTaskMemo; claims are atomic with SET NX and
+    records expire with the key.
+    """
+
+    def __init__(self, client, prefix="protype:task:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def claim(self, key, task_id, ttl=TASK_INFLIGHT_SECONDS):
+        record = json.dumps({"state": "pending", "task_id": task_id})
+        while not self.client.set(self.prefix + key, record, nx=True, ex=ttl):
+            existing = self.get(key)
+            if existing is not None:
+                return existing
+            # Expired between SET and GET: try to claim again
+        return None
+
+    def complete(self, key, task_id, result, ttl):
+        record = {"state": "done", "task_id": task_id, "result": result}
+        self.client.set(self.prefix + key, json.dumps(record), ex=ttl)
+
+    def release(self, key, task_id):
+        record = self.get(key)
+        if record and record["state"] == "pending" and record["task_id"] == task_id:
+            self.client.delete(self.prefix + key)
+
+    def incr(self, name, amount=1):
+        self.client.hincrby(self.prefix + "stats", name, amount)
+
+    def get_stats(self):
+        stats = self.client.hgetall(self.prefix + "stats")
+        return summarize_stats({
+            (name.decode() if isinstance(name, bytes) else name): value
+            for name, value in stats.items()
+        })
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+def create_task_memo():
+    """Shared through Redis when it is the broker, otherwise per process"""
+    if 'REDIS_URL' in os.environ:
+        try:
+            import redis
+            return RedisTaskMemo(redis.Redis.from_url(os.environ['REDIS_URL']))
+        except ImportError:
+            print("redis is not installed; learning tasks are deduplicated per process only")
+    return MemoryTaskMemo()
+
+# Create singleton instance
+task_memo = create_task_memo()
@@ -0,0 +1,230 @@
+import sys
+import os
+import pytest
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("faiss")
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+import advanced_memory
+from advanced_memory import AdvancedMemory
+from embedding_cache import EmbeddingCache
+
+class CountingModel(torch.nn.Module):
+    """Wraps a tiny BERT and counts how many texts it embeds"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+        self.texts_seen = 0
+
+    def forward(self, **inputs):
+        self.texts_seen += inputs["input_ids"].shape[0]
+        return self.model(**inputs)
+
+@pytest.fixture
+def make_memory(tmp_path, monkeypatch):
+    """Build AdvancedMemory instances with a tiny randomly initialised BERT instead of MiniLM"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(advanced_memory, "USE_GPU", False)
+
+    words = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", "what", "is", "python", "a",
+             "programming", "language", "java", "the", "capital", "of", "france", "paris"]
+    vocab_file = tmp_path / "vocab.txt"
+    vocab_file.write_text("\n".join(words))
+
+    torch.manual_seed(0)
+    config = transformers.BertConfig(vocab_size=len(words), hidden_size=advanced_memory.EMBEDDING_DIM,
+                                     num_hidden_layers=1, num_attention_heads=4, intermediate_size=64)
+    bert = transformers.BertModel(config).eval()
+    caches = []
+
+    def initialize_embeddings(self):
+        self.tokenizer = transformers.BertTokenizer(str(vocab_file))
+        self.model = CountingModel(bert)
+        self.embedding_cache = EmbeddingCache(str(tmp_path / "cache.db"), model_name="tiny-bert")
+        caches.append(self.embedding_cache)
+
+    monkeypatch.setattr(AdvancedMemory, "initialize_embeddings", initialize_embeddings)
+    yield lambda: AdvancedMemory(index_type="flat")
+    for cache in caches:
+        cache.close()
+
+@pytest.fixture
+def memory(make_memory):
+    return make_memory()
+
+def test_padding_does_not_change_embedding(memory):
+    """A short text embeds the same alone or batched with a longer one"""
+    memory.embedding_cache = None
+    alone = memory.get_embeddings(["what is java"])[0]
+    batched = memory.get_embeddings(["what is the capital of france", "what is java"], batch_size=2)
+    assert np.allclose(alone, batched[1], atol=1e-5)
+
+def test_cache_skips_model(memory):
+    """Texts already embedded are served from the cache"""
+    memory.get_embeddings(["what is python", "what is java"])
+    assert memory.model.texts_seen == 2
+
+    memory.get_embeddings(["what is java", "what is python", "paris"])
+    assert memory.model.texts_seen == 3
+    assert memory.embedding_cache.hits == 2
+
+def test_batch_and_async_ingest(memory):
+    """Batched and background ingestion both land in the index"""
+    added = memory.add_knowledge_batch([
+        {"question": "what is python", "answer": "a programming language"},
+        {"question": "what is java", "answer": "a programming language", "source": "test"},
+    ])
+    assert added == 2
+    assert memory.index.ntotal == 2
+    assert memory.metadata[1]["source"] == "test"
+
+    memory.add_knowledge_async("what is the capital of france", "paris")
+    memory.flush()
+    assert memory.index.ntotal == 3
+    assert memory.search("what is the capital of france", k=1)[0]["question"] == "what is the capital of france"
+
+def test_metadata_survives_unsaved_index(make_memory):
+    """Entries added after the last checkpoint are re-indexed on restart"""
+    memory = make_memory()
+    memory.add_knowledge("what is python", "a programming language")
+    assert memory.index.ntotal == 1
+    assert not os.path.exists("memory_index.faiss")
+
+    restarted = make_memory()
+    assert restarted.index.ntotal == 1
+    assert restarted.next_id == 1
+    assert restarted.search("what is python", k=1)[0]["answer"] == "a programming language"
+
+def test_orphaned_index_entries_are_dropped(make_memory):
+    """Index entries whose metadata was deleted are removed on restart"""
+    memory = make_memory()
+    memory.add_knowledge_batch([{"question": f"what is java {i}", "answer": "a language"} for i in range(10)])
+    assert os.path.exists("memory_index.faiss")
+    memory.metadata.delete_many([0, 1])
+
+    restarted = make_memory()
+    assert restarted.index.ntotal == 8
+    assert restarted.next_id == 10
+
+def test_access_counts_are_batched(memory, monkeypatch):
+    """Search hits are buffered and written together"""
+    monkeypatch.setattr("memory_metadata.ACCESS_FLUSH_EVERY", 3)
+    memory.add_knowledge("what is python", "a programming language")
+    conn = memory.metadata.connection()
+
+    memory.search("what is python", k=1)
+    memory.search("what is python", k=1)
+    assert conn.execute("SELECT access_count FROM memory_entries").fetchone()[0] == 0
+    assert memory.metadata[0]["access_count"] == 2
+
+    memory.search("what is python", k=1)
+    assert conn.execute("SELECT access_count FROM memory_entries").fetchone()[0] == 3
+
+def test_pickle_metadata_is_migrated(make_memory):
+    """An existing memory_metadata.pkl is imported once"""
+    import pickle
+    with open("memory_metadata.pkl", "wb") as f:
+        pickle.dump({0: {"question": "what is java", "answer": "a language", "source": "test",
+                         "timestamp": 1.0, "access_count": 4, "additional": {}}}, f)
+
+    memory = make_memory()
+    assert memory.metadata[0]["access_count"] == 4
+    assert memory.index.ntotal == 1
+    assert not os.path.exists("memory_metadata.pkl")
+
+def test_split_passages():
+    """Answers become overlapping word windows, capped per answer"""
+    text = " ".join(f"w{i}" for i in range(300))
+    spans = advanced_memory.split_passages(text, words=120, overlap=30)
+    assert [text[start:end].split()[0] for start, end in spans] == ["w0", "w90", "w180"]
+    assert text[spans[-1][0]:spans[-1][1]].split()[-1] == "w299"
+    # Past the cap, kept windows are spread over the whole text
+    capped = advanced_memory.split_passages(text, words=20, overlap=5, max_passages=4)
+    assert [text[start:end].split()[0] for start, end in capped] == ["w0", "w90", "w195", "w285"]
+    assert text[capped[-1][0]:capped[-1][1]].split()[-1] == "w299"
+    assert advanced_memory.split_passages("") == [(0, 0)]
+    assert advanced_memory.merge_spans([(50, 90), (0, 60), (100, 120)]) == [(0, 90), (100, 120)]
+
+def test_mmr_prefers_diverse_rows():
+    """A near-duplicate of the best row loses to a different, still relevant one"""
+    query = np.array([1.0, 0.0])
+    vectors = np.array([[1.0, 0.0], [0.99, 0.05], [0.7, 0.7]])
+    assert advanced_memory.mmr(query, vectors, 2, mmr_lambda=1.0) == [0, 1]
+    assert advanced_memory.mmr(query, vectors, 2, mmr_lambda=0.3) == [0, 2]
+
+def long_answer(words=300):
+    vocab = ["python", "is", "a", "programming", "language", "java", "the", "capital", "of", "france", "paris"]
+    return " ".join(vocab[i % len(vocab)] for i in range(words))
+
+def test_long_answers_are_indexed_as_passages(make_memory):
+    """Each passage has its own vector pointing back at its entry"""
+    memory = make_memory()
+    answer = long_answer()
+    memory.add_knowledge_batch([
+        {"question": "what is python", "answer": answer},
+        {"question": "what is java", "answer": "a programming language"},
+    ])
+    assert memory.index.ntotal == 4
+    assert len(memory.metadata.passage_ids([0])) == 3
+
+    results = memory.search("what is python", k=2)
+    assert sorted(result["question"] for result in results) == ["what is java", "what is python"]
+    python = next(result for result in results if result["question"] == "what is python")
+    assert python["answer"] == answer and python["passage"] in answer
+
+    # Candidate vectors come from the index, not another embedding pass
+    embed_entries = memory.embed_entries
+    memory.embed_entries = None
+    passages = memory.search_passages("what is python programming", k=3)
+    memory.embed_entries = embed_entries
+    assert len({(passage["entry_id"], passage["position"]) for passage in passages}) == 3
+    for passage in passages:
+        assert passage["answer"][passage["start"]:passage["end"]] == passage["passage"]
+
+    # Restarted without a saved index, every passage is embedded again
+    restarted = make_memory()
+    assert (restarted.index.ntotal, restarted.next_passage_id) == (4, 4)
+
+    # Removing an entry removes its passages
+    restarted.cleanup_old_entries(max_age_days=-1, min_access_count=1000)
+    assert restarted.index.ntotal == 0
+    assert restarted.metadata.passage_ids() == []
+
+def test_rag_context_fits_the_token_budget(memory):
+    """Context quotes the chosen passages of an answer, not the whole answer"""
+    answer = long_answer()
+    memory.add_knowledge("what is python", answer)
+    memory.add_knowledge("what is java", "a programming language")
+
+    context = memory.get_rag_context("what is python", min_similarity=float("-inf"), token_budget=250)
+    python = next(item for item in context if item.startswith("Q: what is python\n"))
+    quoted = python.split("\nA: ", 1)[1]
+    assert len(quoted.split()) <= 250
+    assert all(part in answer for part in quoted.split(" ... "))
+
+    # Short answers are quoted whole
+    context = memory.get_rag_context("what is java", max_results=1, min_similarity=float("-inf"))
+    assert len(context) == 1
+    assert context[0] in ("Q: what is java\nA: a programming language", python)
+
+def test_index_saved_before_passages_is_rebuilt(make_memory):
+    """A checkpoint without passage ids means the index holds whole-answer vectors"""
+    memory = make_memory()
+    memory.add_knowledge_batch([{"question": f"what is java {i}", "answer": "a language"} for i in range(10)])
+    assert os.path.exists("memory_index.faiss")
+    checkpoint = memory.metadata.get_state("checkpoint")
+    del checkpoint["next_passage_id"]
+    memory.metadata.set_state("checkpoint", checkpoint)
+    memory.metadata.connection().execute("DELETE FROM memory_passages")
+    memory.metadata.connection().commit()
+
+    restarted = make_memory()
+    assert restarted.index.ntotal == 10
+    assert sorted(restarted.metadata.passage_ids()) == list(range(10))
+    assert restarted.search("what is java 3", k=1)[0]["question"].startswith("what is java")
@@ -0,0 +1,176 @@
+import sys
+import os
+import time
+import json
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+from aiohttp.test_utils import TestServer, TestClient
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import chat_service
+import async_app
+import startup
+from knowledge_store import KnowledgeStore
+from semantic_cache import SemanticCache
+from llm_gateway import LLMGateway, LLMError, StubBackend
+from write_behind import WriteBehindQueue
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    test_db_path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    store = KnowledgeStore(sync_interval=0)
+    monkeypatch.setattr("knowledge_store.knowledge_store", store)
+    monkeypatch.setattr(chat_service, "knowledge_store", store)
+    # No embedder: every cache lookup misses
+    monkeypatch.setattr(chat_service, "semantic_cache", SemanticCache(embed=lambda texts: None))
+    monkeypatch.setattr(chat_service, "log_action", lambda *args: None)
+    monkeypatch.setattr(chat_service, "index_answers", lambda payloads: None)
+    side_effects = WriteBehindQueue(str(tmp_path / "write_behind.db"))
+    chat_service.register_side_effects(side_effects)
+    monkeypatch.setattr(chat_service, "write_behind", side_effects)
+    # Startup runs once per test, without the learning and agent threads
+    monkeypatch.setattr(startup, "_started", False)
+    monkeypatch.setattr(startup, "write_behind", side_effects)
+    monkeypatch.setattr(startup, "start_ai_components", lambda: side_effects.stats.update(agents=1))
+
+    def use_backend(backend, **kwargs):
+        monkeypatch.setattr(chat_service, "llm_gateway", LLMGateway(backend, **kwargs))
+    yield use_backend
+    side_effects.close(timeout=10)
+
+async def with_client(test):
+    client = TestClient(TestServer(await async_app.create_app()))
+    await client.start_server()
+    try:
+        return await test(client)
+    finally:
+        await client.close()
+
+def test_chat_and_stream(service):
+    service(StubBackend(["Water boils at 100 degrees"], persist=True))
+
+    async def test(client):
+        response = await client.post('/api/chat', json={"message": "when does water boil"})
+        assert await response.json() == {"response": "Water boils at 100 degrees", "source": "gemini_flash_2",
+                                         "cached": False}
+
+        # The saved answer now comes from the knowledge base
+        response = await client.post('/chat/stream', json={"question": "when does water boil"})
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        events = [
+            block.split("\n")[0][len("event: "):]
+            for block in (await response.text()).strip().split("\n\n")
+        ]
+        assert events == ["status", "chunk", "done"]
+
+        response = await client.post('/api/chat', json={"message": ""})
+        assert response.status == 400
+
+    asyncio.run(with_client(test))
+
+def test_startup_replays_side_effects_once(service, tmp_path, monkeypatch):
+    # An answer journaled by a previous run that stopped before saving it
+    crashed = WriteBehindQueue(str(tmp_path / "write_behind.db"))
+    crashed.register("answer", lambda payloads: None)
+    monkeypatch.setattr(crashed, "_start_worker", lambda: None)
+    crashed.enqueue("answer", "who wrote hamlet",
+                    {"question": "who wrote hamlet", "answer": "Shakespeare", "user": "api_user"})
+    side_effects = chat_service.write_behind
+
+    async def test(client):
+        assert side_effects.flush(timeout=10)
+        assert chat_service.knowledge_store.get_answer("who wrote hamlet") == "Shakespeare"
+
+    asyncio.run(with_client(test))
+    # A second app in the same process does not start the services again
+    asyncio.run(with_client(test))
+    assert side_effects.stats["agents"] == 1
+
+def test_search_limit_is_parsed_and_clamped(service, monkeypatch):
+    limits = []
+    monkeypatch.setattr(async_app, "full_text_search", lambda query, limit: limits.append(limit) or [])
+
+    async def test(client):
+        for value in ("abc", "0", "1000", "5"):
+            response = await client.get('/api/search', params={"q": "water", "limit": value})
+            assert response.status == 200
+        await client.get('/api/search', params={"q": "water"})
+
+    asyncio.run(with_client(test))
+    assert limits == [10, 1, 50, 5, 10]
+
+def test_non_string_fields_are_rejected(service):
+    service(StubBackend(persist=True))
+
+    async def test(client):
+        for path, key in (('/chat', 'question'), ('/chat/stream', 'question'),
+                          ('/api/chat', 'message'), ('/api/chat/stream', 'message')):
+            for body in ({key: 42}, {key: ["a"]}, [key]):
+                response = await client.post(path, json=body)
+                assert response.status == 400
+        response = await client.post('/api/cache/invalidate', json={"source": {"all": True}})
+        assert response.status == 400
+
+    asyncio.run(with_client(test))
+
+def test_cache_invalidate_requires_admin_token(service, monkeypatch):
+    cache = chat_service.semantic_cache
+    monkeypatch.setattr(async_app, "semantic_cache", cache)
+
+    async def test(client):
+        # Loopback clients are trusted while no token is configured
+        response = await client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"})
+        assert await response.json() == {"removed": 0}
+
+        monkeypatch.setattr(chat_service, "ADMIN_TOKEN", "s3cret")
+        response = await client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"})
+        assert response.status == 403
+        response = await client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"},
+                                     headers={"X-Admin-Token": "wrong"})
+        assert response.status == 403
+        response = await client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"},
+                                     headers={"X-Admin-Token": "s3cret"})
+        assert response.status == 200
+
+    asyncio.run(with_client(test))
+
+def test_waiting_chats_do_not_hold_threads(service):
+    service(StubBackend(delay=0.5), max_async_concurrency=500)
+
+    async def test(client):
+        threads_before = threading.active_count()
+        start = time.monotonic()
+        responses = await asyncio.gather(*[
+            client.post('/api/chat', json={"message": f"question {n}"}) for n in range(100)
+        ])
+        elapsed = time.monotonic() - start
+        assert all(response.status == 200 for response in responses)
+        # 100 half-second LLM calls overlap instead of running one per thread
+        assert elapsed < 5
+        assert threading.active_count() - threads_before < 50
+
+    asyncio.run(with_client(test))
+
+def test_async_stream_cancel_releases_slot():
+    gateway = LLMGateway(StubBackend(), max_async_concurrency=1)
+
+    async def test():
+        chunks = gateway.astream("one two three")
+        assert await chunks.__anext__() == "Stub "
+        await chunks.aclose()
+        response = await gateway.agenerate("next", timeout=0.5)
+        assert response.text == "Stub response to: next"
+
+        slow = LLMGateway(StubBackend(delay=1.0), max_retries=0)
+        with pytest.raises(LLMError):
+            await slow.agenerate("too slow", timeout=0.1)
+
+    asyncio.run(test())
+    assert gateway.recent_calls[0]["error"] == "cancelled"
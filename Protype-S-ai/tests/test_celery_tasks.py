@@ -0,0 +1,223 @@
+import sys
+import os
+import json
+import fnmatch
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import celery_tasks
+from celery_tasks import learn_from_wikipedia, learn_from_gemini_flash
+from knowledge_store import knowledge_store
+from llm_gateway import LLMGateway, StubBackend
+from learning_manager import LearningManager
+from task_executor import TaskExecutor
+from task_memo import MemoryTaskMemo, RedisTaskMemo
+
+@pytest.fixture
+def tasks(monkeypatch):
+    """Learning tasks with a fresh memo and stubbed Wikipedia, Gemini and database"""
+    memo = MemoryTaskMemo()
+    fetched = []
+    saved = []
+
+    def fetch(topic):
+        fetched.append(topic)
+        return None if topic == "No_such_article" else f"{topic} is a field of study."
+
+    # Enqueued to the memory:// broker, where tasks wait until the test runs them
+    monkeypatch.setattr(celery_tasks, "TASK_BACKEND", "celery")
+    monkeypatch.setattr(celery_tasks, "task_memo", memo)
+    monkeypatch.setattr(celery_tasks, "get_wikipedia_content", fetch)
+    monkeypatch.setattr(celery_tasks, "query_gemini_flash", lambda question: f"An answer to {question}")
+    monkeypatch.setattr(celery_tasks, "save_data", lambda *args: saved.append(args) or True)
+    return SimpleNamespace(memo=memo, fetched=fetched, saved=saved)
+
+def test_duplicate_enqueues_collapse_then_memoize(tasks):
+    first = learn_from_wikipedia.delay("Machine_learning")
+    assert first.deduplicated is None
+
+    # Same topic, differently written, while the first is queued
+    second = learn_from_wikipedia.delay("machine learning")
+    assert second.deduplicated == "collapsed"
+    assert second.id == first.id
+
+    # A worker runs the queued task
+    learn_from_wikipedia.apply(("Machine_learning",), task_id=first.id)
+
+    third = learn_from_wikipedia.delay("Machine_learning")
+    assert third.deduplicated == "memoized"
+    assert third.get()["status"] == "success"
+
+    assert tasks.fetched == ["Machine_learning"]
+    assert len(tasks.saved) == 1
+    stats = tasks.memo.get_stats()
+    assert (stats["enqueued"], stats["collapsed"], stats["memoized"], stats["executed"]) == (1, 1, 1, 1)
+    assert stats["avoided"] == 2
+
+def test_queued_duplicate_runs_once(tasks):
+    """A task queued before an identical one finished returns the memoized result"""
+    learn_from_gemini_flash.apply(("How do neural networks function?",))
+    result = learn_from_gemini_flash.apply(("how do neural  networks function?",))
+
+    assert result.get()["status"] == "success"
+    assert len(tasks.saved) == 1
+    assert tasks.memo.get_stats()["memoized"] == 1
+
+def test_errors_are_retried_after_a_short_window(tasks, monkeypatch):
+    monkeypatch.setattr(celery_tasks, "TASK_ERROR_FRESHNESS_SECONDS", 0)
+    assert learn_from_wikipedia.apply(("No_such_article",)).get()["status"] == "error"
+    assert learn_from_wikipedia.apply(("No_such_article",)).get()["status"] == "error"
+
+    assert tasks.fetched == ["No_such_article", "No_such_article"]
+    assert tasks.memo.get_stats()["failed"] == 2
+
+class FakeRedis:
+    """The Redis commands RedisTaskMemo uses, without expiry"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, ex=None):
+        with self.lock:
+            if nx and key in self.data:
+                return None
+            self.data[key] = value.encode()
+            return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+    def hincrby(self, key, field, amount):
+        with self.lock:
+            counts = self.data.setdefault(key, {})
+            counts[field.encode()] = counts.get(field.encode(), 0) + amount
+
+    def hgetall(self, key):
+        return self.data.get(key, {})
+
+    def scan_iter(self, pattern):
+        return [key for key in list(self.data) if fnmatch.fnmatch(key, pattern)]
+
+def test_redis_memo_is_shared_between_processes(tasks, monkeypatch):
+    client = FakeRedis()
+    web_process = RedisTaskMemo(client)
+    worker = RedisTaskMemo(client)
+
+    monkeypatch.setattr(celery_tasks, "task_memo", web_process)
+    first = learn_from_wikipedia.delay("Robotics")
+    assert learn_from_wikipedia.delay("Robotics").id == first.id
+
+    monkeypatch.setattr(celery_tasks, "task_memo", worker)
+    learn_from_wikipedia.apply(("Robotics",), task_id=first.id)
+    assert json.loads(client.get("protype:task:celery_tasks.learn_from_wikipedia:robotics"))["state"] == "done"
+
+    monkeypatch.setattr(celery_tasks, "task_memo", web_process)
+    assert learn_from_wikipedia.delay("Robotics").deduplicated == "memoized"
+    assert tasks.fetched == ["Robotics"]
+    assert web_process.get_stats()["avoided"] == 2
+
+    web_process.clear()
+    assert client.data == {}
+
+def test_reinforcement_cycles_do_not_reenqueue(tasks, tmp_path):
+    """Repeated self-learning cycles expand each successful topic once"""
+    manager = LearningManager()
+    manager.reinforcement_file = str(tmp_path / "reinforcement_data.json")
+    manager.learning_active = True
+    manager.reinforcement_data["successful_responses"] = [{"question": "How do neural networks function?"}]
+    logs = []
+    manager.log_activity = lambda *entry: logs.append(entry)
+
+    for _ in range(3):
+        manager.apply_reinforcement_learning()
+
+    stats = tasks.memo.get_stats()
+    assert (stats["enqueued"], stats["collapsed"]) == (3, 6)
+    assert len([entry for entry in logs if entry[1] == "expansion"]) == 3
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    """The in-process backend over a temporary database, with Wikipedia and Gemini stubbed"""
+    executor = TaskExecutor(workers=2)
+    fetched = []
+
+    def fetch(topic):
+        fetched.append(topic)
+        return None if topic == "No_such_article" else f"{topic.replace('_', ' ')} is a field of study."
+
+    monkeypatch.setattr(database, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(celery_tasks, "TASK_BACKEND", "local")
+    monkeypatch.setattr(celery_tasks, "task_executor", executor)
+    monkeypatch.setattr(celery_tasks, "task_memo", MemoryTaskMemo())
+    monkeypatch.setattr(celery_tasks, "get_wikipedia_content", fetch)
+    monkeypatch.setattr(celery_tasks, "query_gemini_flash", lambda question: f"An answer to {question}")
+    knowledge_store.reset()
+    database.init_db()
+    yield SimpleNamespace(executor=executor, fetched=fetched)
+    executor.shutdown(timeout=10)
+    database.close_connections()
+    knowledge_store.reset()
+
+def stored_answer(question):
+    history = database.get_knowledge_history(question)
+    return history[0]["answer"] if history else None
+
+def test_learning_manager_tasks_run_without_a_broker(local):
+    manager = LearningManager()
+    manager.log_activity = lambda *entry: None
+
+    manager.learn_from_wikipedia("Machine_learning")
+    manager.learn_from_wikipedia("No_such_article")
+    manager.learn_from_gemini("How do neural networks function?")
+    local.executor.shutdown(timeout=10)
+
+    questions = [row["question"] for row in database.iter_knowledge()]
+    assert len(questions) == 2
+    wikipedia_question = next(question for question in questions if "Machine_learning" in question)
+    assert stored_answer(wikipedia_question).endswith("Machine learning is a field of study.")
+    assert stored_answer("How do neural networks function?") == "An answer to How do neural networks function?"
+    assert sorted(local.fetched) == ["Machine_learning", "No_such_article"]
+    stats = local.executor.get_stats()
+    assert (stats["completed"], stats["failed"]) == (3, 0)
+
+def test_local_results_and_duplicates(local):
+    first = learn_from_wikipedia.delay("Robotics")
+    second = learn_from_wikipedia.delay("robotics")
+
+    assert first.get(timeout=10)["status"] == "success"
+    assert second.get(timeout=10) == first.get()
+    assert learn_from_wikipedia.delay("Robotics").deduplicated == "memoized"
+    assert local.fetched == ["Robotics"]
+    assert learn_from_wikipedia.delay("No_such_article").get(timeout=10)["status"] == "error"
+
+def test_failed_or_stub_llm_answers_are_not_saved(local, monkeypatch):
+    monkeypatch.setattr(celery_tasks, "query_gemini_flash", lambda question: None)
+    assert learn_from_gemini_flash.delay("What is a quasar?").get(timeout=10)["status"] == "error"
+
+    monkeypatch.setattr(celery_tasks, "query_gemini_flash", lambda question: f"Stub response to: {question}")
+    monkeypatch.setattr(celery_tasks, "llm_gateway", LLMGateway(StubBackend()))
+    assert learn_from_gemini_flash.delay("What is a pulsar?").get(timeout=10)["status"] == "error"
+    assert list(database.iter_knowledge()) == []
+
+def test_full_queue_releases_the_claim(local, monkeypatch):
+    full = TaskExecutor(workers=1, max_queue=0)
+    monkeypatch.setattr(celery_tasks, "task_executor", full)
+    manager = LearningManager()
+    manager.log_activity = lambda *entry: None
+
+    manager.learn_from_wikipedia("Robotics")
+    assert full.get_stats()["rejected"] == 1
+
+    # The topic is not left claimed by the rejected task
+    monkeypatch.setattr(celery_tasks, "task_executor", local.executor)
+    assert learn_from_wikipedia.delay("Robotics").get(timeout=10)["status"] == "success"
@@ -9,12 +9,13 @@ from unittest import mock
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import database
+from knowledge_store import knowledge_store
 
 @pytest.fixture
-def setup_sqlite_db():
+def setup_sqlite_db(tmp_path):
     """Setup a temporary SQLite database for testing"""
-    # Use in-memory database for tests
-    test_db_path = ":memory:"
+    # Use a temporary file so every connection sees the same database
+    test_db_path = str(tmp_path / "test.db")
     
     # Mock the get_connection function to use our test db
     original_get_connection = database.get_connection
@@ -23,12 +24,14 @@ def setup_sqlite_db():
         return sqlite3.connect(test_db_path), False
     
     database.get_connection = mock_get_connection
+    knowledge_store.reset()
     database.init_db()
     
     yield
     
     # Restore original function
     database.get_connection = original_get_connection
+    knowledge_store.reset()
 
 def test_init_db(setup_sqlite_db):
     """Test database initialization"""
@@ -78,6 +81,66 @@ def test_update_existing_data(setup_sqlite_db):
     assert data[test_question][0]["weight"] == 0.7
     assert data[test_question][0]["source"] == "test_updated"
 
+def test_save_many(setup_sqlite_db):
+    """Many rows are saved in one call; a repeated question keeps the last row"""
+    database.save_data("What is Python?", "A snake", 0.3, "test")
+    rows = [
+        ("What is Python?", "A programming language", 0.6, "wikipedia"),
+        ("What is Java?", "An island", 0.6, "wikipedia"),
+        ("What is Java?", "A programming language", 0.7, "wikipedia"),
+    ]
+    assert database.save_many(rows, "celery_worker") == 2
+    
+    data = database.load_data()
+    assert data["What is Python?"][0]["answer"] == "A programming language"
+    assert data["What is Java?"][0]["answer"] == "A programming language"
+    assert data["What is Java?"][0]["weight"] == 0.7
+    assert database.save_many([]) == 0
+
+def test_save_data_updates_in_place(setup_sqlite_db):
+    """Re-saving a question updates its row instead of replacing it"""
+    database.save_data("What is Python?", "A snake", 0.3, "test", "user1")
+    conn, _ = database.get_connection()
+    before = conn.execute("SELECT id, created_at, created_by FROM knowledge WHERE question = ?", ("What is Python?",)).fetchone()
+    conn.close()
+
+    database.save_data("What is Python?", "A programming language", 0.6, "wiki", "user2")
+
+    conn, _ = database.get_connection()
+    after = conn.execute("SELECT id, created_at, created_by, modified_by, answer FROM knowledge WHERE question = ?", ("What is Python?",)).fetchone()
+    conn.close()
+    assert after[:3] == before
+    assert after[3:] == ("user2", "A programming language")
+
+def test_save_many_commits_in_chunks(setup_sqlite_db):
+    """A failing chunk is rolled back; chunks committed before it are kept"""
+    rows = [(f"Question {n}?", f"Answer {n}", 0.5, "test") for n in range(5)]
+    assert database.save_many(rows, chunk_size=2) == 5
+
+    # A dict cannot be bound as a parameter, so the second chunk fails
+    rows = [(f"Question {n}?", f"New answer {n}", 0.5, "test") for n in range(5)]
+    rows[3] = ("Question 3?", {"not": "bindable"}, 0.5, "test")
+    assert database.save_many(rows, chunk_size=2) == 2
+
+    data = database.load_data()
+    assert len(data) == 5
+    assert [data[f"Question {n}?"][0]["answer"] for n in range(5)] == ["New answer 0", "New answer 1", "Answer 2", "Answer 3", "Answer 4"]
+
+def test_iter_knowledge(setup_sqlite_db):
+    """Rows stream in chunks, optionally only those modified since a mark"""
+    database.save_many([(f"Question {n}?", f"Answer {n}", 0.5, "test") for n in range(5)], "user1")
+    conn, _ = database.get_connection()
+    conn.execute("UPDATE knowledge SET modified_at = '2024-01-01 00:00:00'")
+    conn.execute("UPDATE knowledge SET modified_at = '2024-02-01 00:00:00' WHERE question = 'Question 4?'")
+    conn.commit()
+    conn.close()
+
+    rows = list(database.iter_knowledge(chunk_size=2))
+    assert [row["question"] for row in rows] == [f"Question {n}?" for n in range(5)]
+    assert set(rows[0]) == set(database.KNOWLEDGE_FIELDS)
+    assert rows[0]["created_by"] == "user1"
+    assert [row["question"] for row in database.iter_knowledge(modified_since="2024-01-15 00:00:00")] == ["Question 4?"]
+
 def test_get_knowledge_history(setup_sqlite_db):
     """Test getting version history"""
     # Save data
@@ -115,3 +178,145 @@ def test_search_knowledge(setup_sqlite_db):
             programming_found = True
             break
     assert programming_found
+
+def test_full_text_search_ranking(setup_sqlite_db):
+    """FTS results are ranked and shaped like Elasticsearch results"""
+    database.save_data("What is Python?", "Python is a programming language", 0.5, "wiki", "user1")
+    database.save_data("What is a snake?", "Some snakes are pythons, others are not", 0.5, "wiki", "user1")
+    database.save_data("What is Java?", "An island in Indonesia", 0.5, "wiki", "user1")
+    
+    results = database.full_text_search("python")
+    
+    assert [r["question"] for r in results] == ["What is Python?", "What is a snake?"]
+    assert set(results[0].keys()) == {"question", "answer", "answer_snippet", "weight", "source", "score"}
+    assert "<em>" in results[0]["answer_snippet"]
+    assert results[0]["score"] > results[1]["score"]
+
+def test_full_text_search_blends_weight(setup_sqlite_db):
+    """Between equally relevant rows the higher stored weight wins"""
+    database.save_data("Tell me about tennis", "Tennis is a sport", 0.2, "wiki", "user1")
+    database.save_data("Explain tennis", "Tennis is a sport", 0.9, "wiki", "user1")
+    
+    results = database.full_text_search("tennis sport")
+    assert results[0]["question"] == "Explain tennis"
+
+def test_full_text_index_tracks_updates(setup_sqlite_db):
+    """Triggers keep the index in sync when answers are overwritten"""
+    database.save_data("What is Python?", "A snake", 0.5, "wiki", "user1")
+    database.save_data("What is Python?", "A programming language", 0.5, "wiki", "user1")
+    
+    assert database.full_text_search("snake") == []
+    assert len(database.full_text_search("programming")) == 1
+
+def test_full_text_backfill_existing_rows(tmp_path, monkeypatch):
+    """Rows stored before the index existed are searchable after init_db"""
+    test_db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(test_db_path)
+    conn.execute("""
+        CREATE TABLE knowledge (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT UNIQUE, answer TEXT,
+            weight REAL, source TEXT, created_at TIMESTAMP, created_by TEXT,
+            modified_at TIMESTAMP, modified_by TEXT)
+    """)
+    conn.execute("INSERT INTO knowledge (question, answer, weight, source) VALUES ('Old question', 'Legacy answer text', 0.5, 'user')")
+    conn.commit()
+    conn.close()
+    
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    database.init_db()
+    
+    results = database.full_text_search("legacy")
+    assert len(results) == 1
+    assert results[0]["question"] == "Old question"
+
+def long_answer(topic, paragraphs=20):
+    return "According to Wikipedia under CC BY-SA 3.0:\n" + "\n\n".join(
+        f"Paragraph {n} about {topic} and its long history in the region. " * 3 for n in range(paragraphs))
+
+def test_long_answers_stored_compressed_once(setup_sqlite_db):
+    """Long answers are stored once, compressed, and read back in full everywhere"""
+    answer = long_answer("volcanoes") + "The last paragraph mentions obsidian."
+    database.save_data("What is a volcano?", answer, 0.5, "wikipedia")
+    database.save_data("Define volcano", answer, 0.6, "wikipedia")
+
+    conn, _ = database.get_connection()
+    rows = conn.execute("SELECT answer, content_hash FROM knowledge ORDER BY id").fetchall()
+    bodies, stored = conn.execute("SELECT COUNT(*), SUM(length(body)) FROM knowledge_content").fetchone()
+    conn.close()
+    assert rows[0] == rows[1]
+    assert rows[0][0] == answer[:database.ANSWER_PREVIEW_CHARS]
+    assert bodies == 1 and stored < len(answer) / 2
+
+    assert database.load_data()["What is a volcano?"][0]["answer"] == answer
+    assert database.get_knowledge_history("Define volcano")[0]["answer"] == answer
+    assert [row["answer"] for row in database.iter_knowledge()] == [answer, answer]
+    # Words past the preview are indexed
+    results = database.full_text_search("obsidian")
+    assert [r["question"] for r in results] == ["Define volcano", "What is a volcano?"]
+    assert results[0]["answer"] == answer
+    assert "<em>obsidian</em>" in results[0]["answer_snippet"]
+
+def test_replaced_long_answer_is_reindexed_and_collected(setup_sqlite_db):
+    """Overwriting a long answer updates the index and drops the unused body"""
+    database.save_data("What is a volcano?", long_answer("volcanoes") + "Obsidian.", 0.5, "wikipedia")
+    database.save_data("What is a volcano?", long_answer("volcanoes") + "Pumice.", 0.5, "wikipedia")
+    assert database.full_text_search("obsidian") == []
+    assert len(database.full_text_search("pumice")) == 1
+
+    def count_bodies():
+        conn, _ = database.get_connection()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM knowledge_content").fetchone()[0]
+        finally:
+            conn.close()
+
+    assert count_bodies() == 1
+    database.save_data("What is a volcano?", "A mountain", 0.5, "user")
+    assert count_bodies() == 0
+    assert database.full_text_search("pumice") == []
+    assert len(database.full_text_search("mountain")) == 1
+
+@pytest.mark.skipif(not database.HAS_ZSTD, reason="zstandard is not installed")
+def test_dictionary_trained_once_enough_bodies(setup_sqlite_db):
+    """The first dictionary is trained from stored bodies, which are recompressed with it"""
+    rows = [(f"Topic {n}?", long_answer(f"topic {n}"), 0.5, "wikipedia") for n in range(database.ANSWER_DICT_MIN_SAMPLES)]
+    database.save_many(rows[:-1])
+    conn, _ = database.get_connection()
+    assert conn.execute("SELECT COUNT(*) FROM answer_dictionaries").fetchone()[0] == 0
+
+    database.save_many(rows[-1:])
+    dict_ids = {row[0] for row in conn.execute("SELECT dict_id FROM knowledge_content")}
+    assert dict_ids == {conn.execute("SELECT dict_id FROM answer_dictionaries").fetchone()[0]}
+    conn.close()
+    assert [row["answer"] for row in database.iter_knowledge()] == [row[1] for row in rows]
+
+@pytest.mark.skipif(not database.HAS_ZSTD, reason="zstandard is not installed")
+def test_existing_long_answers_are_moved(tmp_path, monkeypatch):
+    """init_db moves long inline answers of an existing database out of line, once"""
+    test_db_path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(test_db_path)
+    conn.execute("""
+        CREATE TABLE knowledge (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, question TEXT UNIQUE, answer TEXT,
+            weight REAL, source TEXT, created_at TIMESTAMP, created_by TEXT,
+            modified_at TIMESTAMP, modified_by TEXT)
+    """)
+    answers = {f"Topic {n}?": long_answer(f"topic {n}") + f"Marker{n}." for n in range(database.ANSWER_DICT_MIN_SAMPLES)}
+    answers["Short?"] = "A short answer"
+    conn.executemany("INSERT INTO knowledge (question, answer, weight, source) VALUES (?, ?, 0.5, 'wikipedia')", answers.items())
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    database.init_db()
+    database.init_db()
+
+    conn = sqlite3.connect(test_db_path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SQLITE_STORAGE_VERSION
+    assert conn.execute("SELECT COUNT(*) FROM knowledge WHERE content_hash IS NOT NULL").fetchone()[0] == len(answers) - 1
+    assert conn.execute("SELECT COUNT(*) FROM knowledge_content WHERE dict_id IS NOT NULL").fetchone()[0] == len(answers) - 1
+    assert conn.execute("SELECT answer FROM knowledge WHERE question = 'Short?'").fetchone()[0] == "A short answer"
+    conn.close()
+
+    assert {row["question"]: row["answer"] for row in database.iter_knowledge()} == answers
+    assert [r["question"] for r in database.full_text_search("marker7")] == ["Topic 7?"]
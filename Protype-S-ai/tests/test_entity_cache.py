@@ -0,0 +1,52 @@
+import sys
+import os
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from entity_cache import EntityCache
+
+class FakeEntity:
+    def __init__(self, text):
+        self.text = text
+        self.label_ = "ORG"
+
+class FakeDoc:
+    def __init__(self, text):
+        self.ents = [FakeEntity(word) for word in text.split() if word[:1].isupper()]
+
+class FakeNLP:
+    """Treats capitalised words as entities so tests do not need a spaCy model"""
+    meta = {"lang": "en", "name": "fake", "version": "1"}
+
+    def __init__(self):
+        self.texts_seen = 0
+
+    def pipe(self, texts, batch_size=64):
+        for text in texts:
+            self.texts_seen += 1
+            yield FakeDoc(text)
+
+def test_entities_survive_restart(tmp_path):
+    """Cached texts are not run through the pipeline again, even by a new instance"""
+    nlp = FakeNLP()
+    cache = EntityCache(str(tmp_path / "entities.db"))
+    assert cache.extract(nlp, ["Python by Guido", "Java at Sun"]) == [
+        [("Python", "ORG"), ("Guido", "ORG")], [("Java", "ORG"), ("Sun", "ORG")]]
+    cache.close()
+
+    cache = EntityCache(str(tmp_path / "entities.db"))
+    entities = cache.extract(nlp, ["Java at Sun", "no entities here", "Java at Sun"])
+    assert entities == [[("Java", "ORG"), ("Sun", "ORG")], [], [("Java", "ORG"), ("Sun", "ORG")]]
+    assert nlp.texts_seen == 3
+    assert cache.hits == 1
+
+def test_cache_is_keyed_by_model(tmp_path):
+    cache = EntityCache(str(tmp_path / "entities.db"))
+    nlp = FakeNLP()
+    cache.extract(nlp, ["Python"])
+
+    other = FakeNLP()
+    other.meta = {"lang": "en", "name": "other", "version": "1"}
+    cache.extract(other, ["Python"])
+    assert other.texts_seen == 1
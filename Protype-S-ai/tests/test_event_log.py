@@ -0,0 +1,63 @@
+import sys
+import os
+import json
+import time
+import threading
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_log import EventLog
+
+def make_log(tmp_path, **kwargs):
+    return EventLog(str(tmp_path / "events.db"), legacy_logs=kwargs.pop("legacy_logs", []), **kwargs)
+
+def test_recent_and_time_range(tmp_path):
+    log = make_log(tmp_path)
+    for day in range(1, 6):
+        log.append("learning", {"timestamp": f"2025-01-0{day}T12:00:00", "action": "learning", "n": day})
+    log.append("actions", {"timestamp": "2025-01-03T08:00:00", "action": "chat"})
+
+    assert [e["n"] for e in log.recent("learning", 2)] == [4, 5]
+    assert [e["n"] for e in log.between("learning", "2025-01-02", "2025-01-04")] == [2, 3]
+    assert log.count("actions") == 1
+
+def test_daily_counts(tmp_path):
+    log = make_log(tmp_path)
+    log.append("actions", {"timestamp": "2025-01-01T10:00:00", "action": "chat"})
+    log.append("actions", {"timestamp": "2025-01-01T11:00:00", "action": "chat"})
+    log.append("actions", {"timestamp": "2025-01-02T11:00:00", "action": "teach"})
+    log.append("actions", {"timestamp": "2025-01-02T12:00:00"})
+
+    assert log.daily_counts("actions", "action") == {
+        "2025-01-01": {"chat": 2},
+        "2025-01-02": {"teach": 1, "unknown": 1},
+    }
+
+def test_background_flush_and_concurrent_writers(tmp_path):
+    """Appends from many threads are all written without an explicit flush"""
+    log = make_log(tmp_path, flush_interval=0.05)
+
+    def writer(i):
+        for j in range(50):
+            log.append("learning", {"source": f"thread-{i}", "n": j})
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    time.sleep(0.3)
+
+    other = make_log(tmp_path)
+    assert other.count("learning") == 400
+
+def test_legacy_json_is_imported(tmp_path):
+    legacy = tmp_path / "learning_logs.json"
+    legacy.write_text(json.dumps({"logs": [
+        {"timestamp": "2024-12-31T23:00:00", "source": "system", "action": "learning", "description": "old"}
+    ]}))
+
+    log = make_log(tmp_path, legacy_logs=[(str(legacy), "learning", "logs")])
+    assert log.recent("learning", 5)[0]["description"] == "old"
+    assert not legacy.exists()
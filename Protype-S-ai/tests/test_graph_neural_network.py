@@ -0,0 +1,130 @@
+import sys
+import os
+import pytest
+import numpy as np
+import networkx as nx
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("torch_geometric")
+import torch.nn.functional as F
+from graph_neural_network import KnowledgeGNN
+
+def make_graph(num_questions=30, seed=0):
+    """Small question/answer/entity graph shaped like KnowledgeGraph's"""
+    rng = np.random.default_rng(seed)
+    graph = nx.DiGraph()
+    for i in range(num_questions):
+        graph.add_node(f"q{i}", type='question')
+        graph.add_node(f"a{i}", type='answer')
+        graph.add_edge(f"q{i}", f"a{i}")
+        for e in rng.integers(0, 10, 2):
+            graph.add_node(f"e{e}", type='entity')
+            graph.add_edge(f"q{i}", f"e{e}")
+    return graph
+
+def test_link_loss_matches_per_edge_loop():
+    """Vectorized loss equals the summed per-pair MSE of the old loop"""
+    gnn = KnowledgeGNN(make_graph())
+    data = gnn.prepare_graph_data()
+    out = torch.randn(data.num_nodes, 8)
+    neg_edge_index = gnn.sample_negative_edges(data.edge_index, data.num_nodes, 20)
+
+    expected = 0
+    for u, v in data.edge_index.t().tolist():
+        similarity = F.cosine_similarity(out[u].unsqueeze(0), out[v].unsqueeze(0))
+        expected += F.mse_loss(similarity, torch.tensor([1.0]))
+    for u, v in neg_edge_index.t().tolist():
+        similarity = F.cosine_similarity(out[u].unsqueeze(0), out[v].unsqueeze(0))
+        expected += F.mse_loss(similarity, torch.tensor([0.0]))
+
+    assert torch.allclose(gnn.link_loss(out, data.edge_index, neg_edge_index), expected, atol=1e-4)
+
+def test_negative_samples_are_not_edges():
+    gnn = KnowledgeGNN(make_graph())
+    data = gnn.prepare_graph_data()
+    neg_edge_index = gnn.sample_negative_edges(data.edge_index, data.num_nodes, 500)
+
+    assert neg_edge_index.size(1) > 0
+    for u, v in neg_edge_index.t().tolist():
+        assert not gnn.knowledge_graph.has_edge(gnn.reverse_mapping[u], gnn.reverse_mapping[v])
+
+def test_sample_subgraph_caps_fanout():
+    """A hub node contributes at most num_neighbors incoming edges per hop"""
+    graph = nx.DiGraph()
+    graph.add_node("hub", type='source')
+    for i in range(100):
+        graph.add_node(f"q{i}", type='question')
+        graph.add_edge(f"q{i}", "hub")
+    gnn = KnowledgeGNN(graph)
+    data = gnn.prepare_graph_data()
+
+    seeds = torch.tensor([gnn.node_mapping["hub"]])
+    subset, sub_edge_index, position = gnn.sample_subgraph(seeds, data.edge_index, data.num_nodes, [5, 5])
+    assert sub_edge_index.size(1) == 5
+    assert subset.numel() == 6
+    assert (position[subset] == torch.arange(6)).all()
+    assert (sub_edge_index[1] == position[seeds[0]]).all()
+
+@pytest.mark.parametrize("batch_size", [None, 16])
+def test_train_full_and_mini_batch(batch_size):
+    """Both training modes produce one embedding per node"""
+    graph = make_graph()
+    gnn = KnowledgeGNN(graph)
+    assert gnn.train(epochs=3, batch_size=batch_size)
+    assert gnn.embeddings.shape == (graph.number_of_nodes(), 64)
+    assert torch.isfinite(gnn.embeddings).all()
+
+def brute_force_inferred(gnn, embeddings, threshold):
+    """The pairwise loop infer_new_knowledge used to run"""
+    edges = []
+    for node1, idx1 in gnn.node_mapping.items():
+        for node2, idx2 in gnn.node_mapping.items():
+            type1 = gnn.knowledge_graph.nodes[node1].get('type')
+            type2 = gnn.knowledge_graph.nodes[node2].get('type')
+            if node1 != node2 and not gnn.knowledge_graph.has_edge(node1, node2) and \
+               type1 == type2 and type1 in ('entity', 'question'):
+                similarity = F.cosine_similarity(embeddings[idx1].unsqueeze(0), embeddings[idx2].unsqueeze(0)).item()
+                if similarity > threshold:
+                    edges.append((node1, node2))
+    return set(edges)
+
+@pytest.fixture
+def embedded_gnn():
+    """GNN with random embeddings in place of a trained model"""
+    gnn = KnowledgeGNN(make_graph(40))
+    gnn.prepare_graph_data()
+    torch.manual_seed(0)
+    gnn.embeddings = torch.randn(len(gnn.node_mapping), 4)
+    gnn.normalized_embeddings = F.normalize(gnn.embeddings, dim=1).numpy()
+    return gnn
+
+@pytest.mark.parametrize("use_faiss", [False, True])
+def test_infer_matches_pairwise_loop(embedded_gnn, use_faiss):
+    """With top_k covering every node, matrix inference equals the old loop"""
+    if use_faiss:
+        pytest.importorskip("faiss")
+    expected = brute_force_inferred(embedded_gnn, embedded_gnn.embeddings, 0.7)
+    inferred = embedded_gnn.infer_new_knowledge(threshold=0.7, top_k=100, use_faiss=use_faiss)
+
+    assert {(a, b) for a, b, _ in inferred} == expected
+    scores = [score for _, _, score in inferred]
+    assert scores == sorted(scores, reverse=True)
+
+def test_infer_caps_candidates_per_node(embedded_gnn):
+    inferred = embedded_gnn.infer_new_knowledge(threshold=-1.0, top_k=2)
+    sources = [a for a, _, _ in inferred]
+    assert max(sources.count(node) for node in set(sources)) == 2
+
+def test_find_related_concepts_is_exact(embedded_gnn):
+    gnn = embedded_gnn
+    related = gnn.find_related_concepts("q0", top_k=5)
+
+    expected = sorted(
+        ((node, F.cosine_similarity(gnn.embeddings[0:1], gnn.embeddings[idx:idx + 1]).item())
+         for node, idx in gnn.node_mapping.items() if node != "q0"),
+        key=lambda x: x[1], reverse=True)[:5]
+    assert [node for node, _ in related] == [node for node, _ in expected]
+    assert np.allclose([s for _, s in related], [s for _, s in expected], atol=1e-5)
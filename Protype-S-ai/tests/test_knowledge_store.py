@@ -0,0 +1,91 @@
+import sys
+import os
+import pytest
+import sqlite3
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from knowledge_store import KnowledgeStore
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Knowledge store backed by a temporary SQLite database"""
+    test_db_path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    database.init_db()
+
+    store = KnowledgeStore(max_answer_bytes=1024, sync_interval=0)
+    monkeypatch.setattr("knowledge_store.knowledge_store", store)
+    yield store, test_db_path
+
+def test_load_once_then_write_through(store):
+    """Writes update the store without a full reload"""
+    store, _ = store
+    database.save_data("What is Python?", "A language", 0.5, "test")
+
+    data = database.load_data()
+    assert data["What is Python?"][0]["answer"] == "A language"
+    assert store.stats["full_loads"] == 1
+
+    database.save_data("What is Java?", "Another language", 0.6, "test")
+    data = database.load_data()
+    assert "What is Java?" in data
+    assert data["What is Java?"][0]["weight"] == 0.6
+    assert store.stats["full_loads"] == 1
+
+def test_sync_rows_from_other_process(store):
+    """Rows written by another connection are picked up via modified_at"""
+    store, db_path = store
+    database.save_data("What is Python?", "A language", 0.5, "test")
+    assert len(database.load_data()) == 1
+
+    conn = database.connect_sqlite(db_path)
+    conn.execute(
+        "INSERT INTO knowledge (question, answer, weight, source, modified_at) VALUES (?, ?, ?, ?, ?)",
+        ("What is Rust?", "A systems language", 0.7, "celery", "2999-01-01 00:00:00")
+    )
+    conn.commit()
+    conn.close()
+
+    data = database.load_data()
+    assert data["What is Rust?"][0]["answer"] == "A systems language"
+    assert data["What is Rust?"][0]["source"] == "celery"
+    assert store.stats["full_loads"] == 1
+    assert store.stats["synced_rows"] >= 1
+
+def test_answer_cache_is_bounded(store):
+    """Answer bodies beyond the byte budget are evicted, not lost"""
+    store, _ = store
+    database.load_data()
+    for i in range(10):
+        database.save_data(f"Question {i}?", "x" * 300, 0.5, "test")
+
+    assert store._answer_bytes <= store.max_answer_bytes
+
+    data = database.load_data()
+    assert len(data) == 10
+    assert all(answers[0]["answer"] == "x" * 300 for _, answers in data.items())
+
+def test_changes_since_reports_only_new_changes(store):
+    """Consumers can apply just the rows touched since their last cursor"""
+    store, db_path = store
+    database.save_data("What is Python?", "A language", 0.5, "test")
+    cursor = store.cursor()
+
+    database.save_data("What is Java?", "Another language", 0.6, "test")
+    conn = database.connect_sqlite(db_path)
+    conn.execute("DELETE FROM knowledge WHERE question = ?", ("What is Python?",))
+    conn.commit()
+    conn.close()
+    store.invalidate()
+
+    cursor, changed = store.changes_since(cursor)
+    assert set(changed) == {"What is Java?", "What is Python?"}
+    assert "What is Python?" not in database.load_data()
+
+    assert store.changes_since(cursor)[1] == []
+
+    store.reset()
+    assert store.changes_since(cursor)[1] is None
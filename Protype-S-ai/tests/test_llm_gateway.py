@@ -0,0 +1,144 @@
+import sys
+import os
+import time
+import threading
+
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import llm_gateway as gateway_module
+from llm_gateway import LLMGateway, LLMError, StubBackend
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(gateway_module, "LLM_RETRY_BASE_DELAY", 0.001)
+
+def test_generate_is_stateless():
+    backend = StubBackend()
+    gateway = LLMGateway(backend)
+
+    assert gateway.generate("first", caller="agent").text == "Stub response to: first"
+    gateway.generate("second", caller="agent")
+
+    assert [len(contents) for contents in backend.calls] == [1, 1]
+    assert backend.calls[1][0]["parts"] == ["second"]
+
+def test_session_history_is_bounded_and_summarized():
+    backend = StubBackend()
+    gateway = LLMGateway(backend)
+    session = gateway.session(caller="chat", max_turns=2, summarize=True)
+
+    for n in range(3):
+        session.send_message(f"message {n}")
+    assert [user for user, _ in session.history] == ["message 1", "message 2"]
+    assert session.summary.startswith("Stub response to:")
+
+    session.send_message("message 3")
+    contents = next(c for c in backend.calls if c[-1]["parts"] == ["message 3"])
+    # Summary exchange, two kept turns, then the new message
+    assert len(contents) == 2 + 2 * 2 + 1
+    assert contents[0]["parts"][0].startswith("Summary of our conversation so far")
+    assert "chat:summary" in gateway.get_stats()
+
+def test_retries_transient_errors():
+    backend = StubBackend([ConnectionError("reset"), ConnectionError("reset"), "ok"])
+    gateway = LLMGateway(backend, max_retries=3)
+
+    response = gateway.generate("hello", caller="celery")
+
+    assert response.text == "ok"
+    assert response.attempts == 3
+    assert gateway.get_stats()["celery"]["retries"] == 2
+
+def test_gives_up_after_max_retries():
+    backend = StubBackend([ConnectionError("down")] * 5)
+    gateway = LLMGateway(backend, max_retries=1)
+
+    with pytest.raises(LLMError):
+        gateway.generate("hello", caller="celery")
+    assert len(backend.calls) == 2
+    assert gateway.get_stats()["celery"]["failures"] == 1
+
+def test_concurrency_limit_and_deadline():
+    backend = StubBackend(delay=0.3)
+    gateway = LLMGateway(backend, max_concurrency=1, max_retries=0)
+    results = []
+
+    def slow_call():
+        results.append(gateway.generate("slow", timeout=5).text)
+
+    worker = threading.Thread(target=slow_call)
+    worker.start()
+    time.sleep(0.05)
+
+    # The only slot is busy for longer than this call's deadline
+    start = time.monotonic()
+    with pytest.raises(LLMError):
+        gateway.generate("queued", timeout=0.1, caller="impatient")
+    assert time.monotonic() - start < 0.25
+
+    worker.join()
+    assert results == ["Stub response to: slow"]
+    assert len(backend.calls) == 1
+
+def test_stats_account_tokens():
+    gateway = LLMGateway(StubBackend(["four word answer here"]))
+    gateway.generate("two words", caller="reasoning")
+
+    stats = gateway.get_stats()["reasoning"]
+    assert stats["calls"] == 1
+    assert stats["prompt_tokens"] == 2
+    assert stats["output_tokens"] == 4
+    assert stats["avg_latency"] >= 0
+    assert gateway.recent_calls[-1]["caller"] == "reasoning"
+
+def test_stream_yields_chunks_and_records_usage():
+    gateway = LLMGateway(StubBackend(["streamed answer text"]))
+
+    assert list(gateway.stream("question", caller="web_chat")) == ["streamed ", "answer ", "text"]
+    stats = gateway.get_stats()["web_chat"]
+    assert (stats["calls"], stats["failures"], stats["output_tokens"]) == (1, 0, 3)
+
+def test_stream_retries_only_before_first_chunk():
+    class FailingMidStream(StubBackend):
+        def stream(self, contents, generation_config, timeout, model=None):
+            yield "partial "
+            raise ConnectionError("dropped")
+
+    gateway = LLMGateway(StubBackend([ConnectionError("reset"), "ok"]))
+    assert "".join(gateway.stream("hello")) == "ok"
+
+    backend = FailingMidStream()
+    gateway = LLMGateway(backend, max_retries=3)
+    chunks = []
+    with pytest.raises(LLMError):
+        for chunk in gateway.stream("hello"):
+            chunks.append(chunk)
+    # Already-sent text cannot be taken back, so there is no retry
+    assert chunks == ["partial "]
+
+def test_closed_stream_releases_slot():
+    gateway = LLMGateway(StubBackend(), max_concurrency=1)
+    stream = gateway.stream("one two three")
+    next(stream)
+    stream.close()
+
+    assert gateway.generate("next", timeout=0.5).text == "Stub response to: next"
+    assert gateway.recent_calls[0]["error"] == "cancelled"
+
+def test_missing_api_key(monkeypatch):
+    """Without a key the default Gemini backend fails; the stub is only used when asked for"""
+    monkeypatch.setattr(gateway_module, "GEMINI_API_KEY", None)
+    monkeypatch.setattr(gateway_module, "LLM_BACKEND", "gemini")
+    gateway = LLMGateway(gateway_module.GeminiBackend(api_key=None))
+    assert isinstance(LLMGateway().backend, gateway_module.GeminiBackend)
+    assert gateway.persists_answers
+    with pytest.raises(LLMError, match="GEMINI_API_KEY is not set"):
+        gateway.generate("hello", caller="test")
+
+    monkeypatch.setattr(gateway_module, "LLM_BACKEND", "stub")
+    stub = LLMGateway()
+    assert isinstance(stub.backend, StubBackend)
+    assert not stub.persists_answers
@@ -0,0 +1,63 @@
+import sys
+import os
+import pytest
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+faiss = pytest.importorskip("faiss")
+import memory_index
+
+def random_vectors(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((count, memory_index.EMBEDDING_DIM)).astype('float32')
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_remove_keeps_ids_stable(index_type):
+    """Removing entries does not renumber the remaining ids"""
+    vectors = random_vectors(50)
+    index = memory_index.create_index(index_type)
+    index.add_with_ids(vectors, np.arange(100, 150, dtype='int64'))
+    
+    index = memory_index.remove_ids(index, [100, 101, 102])
+    assert index.ntotal == 47
+    
+    _, labels = index.search(vectors[10:11], 1)
+    assert labels[0][0] == 110
+
+def test_ivfpq_falls_back_to_flat_until_trainable(monkeypatch):
+    """IVF-PQ is only built once there are enough training vectors"""
+    monkeypatch.setattr(memory_index, "MIN_TRAINING_VECTORS", 2000)
+    small = memory_index.create_index("ivfpq", training_vectors=random_vectors(100))
+    assert memory_index.index_kind(small) == "flat"
+    
+    vectors = random_vectors(2000)
+    small.add_with_ids(vectors, np.arange(2000, dtype='int64'))
+    assert memory_index.needs_upgrade(small, "ivfpq")
+    
+    upgraded = memory_index.rebuild_index(small, "ivfpq")
+    assert memory_index.index_kind(upgraded) == "ivfpq"
+    assert upgraded.ntotal == 2000
+    # No exact vectors to read back
+    assert memory_index.reconstruct_ids(upgraded, [5]) is None
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+def test_reconstruct_ids_returns_stored_vectors(index_type):
+    vectors = random_vectors(30)
+    index = memory_index.create_index(index_type)
+    index.add_with_ids(vectors, np.arange(100, 130, dtype='int64'))
+    assert np.allclose(memory_index.reconstruct_ids(index, [129, 104]), vectors[[29, 4]])
+
+def test_legacy_flat_index_is_wrapped(tmp_path):
+    """A pre-existing IndexFlatL2 loads with ids equal to row numbers"""
+    path = str(tmp_path / "memory_index.faiss")
+    legacy = faiss.IndexFlatL2(memory_index.EMBEDDING_DIM)
+    vectors = random_vectors(20)
+    legacy.add(vectors)
+    faiss.write_index(legacy, path)
+    
+    index = memory_index.read_index(path)
+    assert isinstance(index, faiss.IndexIDMap2)
+    _, labels = index.search(vectors[7:8], 1)
+    assert labels[0][0] == 7
@@ -0,0 +1,96 @@
+import sys
+import os
+import numpy as np
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from question_index import QuestionIndex
+
+class FakeDoc:
+    def __init__(self, vector):
+        self.vector = vector
+
+class FakeNLP:
+    """Bag-of-words 'model' so tests do not need spaCy vectors"""
+    meta = {"lang": "en", "name": "fake", "version": "1"}
+    vocabulary = ["python", "java", "language", "snake", "coffee", "island"]
+
+    def __init__(self):
+        self.calls = 0
+        self.batches = 0
+
+    def pipe(self, texts, batch_size=64):
+        self.batches += 1
+        for text in texts:
+            self.calls += 1
+            words = text.replace("?", "").split()
+            yield FakeDoc(np.array([words.count(w) for w in self.vocabulary], dtype=np.float32))
+
+def make_index(tmp_path):
+    return QuestionIndex(FakeNLP(),
+                         vectors_path=str(tmp_path / "vectors.npy"),
+                         questions_path=str(tmp_path / "vectors.json"))
+
+def test_search_ranks_by_cosine(tmp_path):
+    """Best match and related questions come from one top-k call"""
+    index = make_index(tmp_path)
+    index.add_questions(["python language", "java language", "python snake", "java coffee island"])
+
+    results = index.search("python language", k=3)
+    assert results[0][0] == "python language"
+    assert abs(results[0][1] - 1.0) < 1e-6
+    assert {q for q, _ in results[1:]} == {"java language", "python snake"}
+
+    related = index.search("python language", k=3, exclude={"python language"})
+    assert "python language" not in [q for q, _ in related]
+
+def test_questions_are_embedded_once(tmp_path):
+    """Re-adding known questions does not re-run the pipeline"""
+    index = make_index(tmp_path)
+    index.add_questions(["python language", "java language"])
+    calls = index.nlp.calls
+    index.sync(["python language", "java language"])
+    assert index.nlp.calls == calls
+
+    index.note_write("python snake")
+    assert "python snake" in index
+    assert index.matrix.dtype == np.float32
+    assert index.matrix.flags["C_CONTIGUOUS"]
+
+def test_persistence_round_trip(tmp_path):
+    """A saved matrix is reused on startup"""
+    index = make_index(tmp_path)
+    index.add_questions(["python language", "java coffee island"])
+    assert index.save()
+
+    reloaded = make_index(tmp_path)
+    assert len(reloaded) == 2
+    assert reloaded.nlp.calls == 0
+    assert np.allclose(reloaded.matrix, index.matrix)
+
+def test_sync_drops_deleted_questions(tmp_path):
+    """Questions gone from the knowledge base stop matching, also after a reload"""
+    index = make_index(tmp_path)
+    index.sync(["python language", "java language", "python snake"])
+    index.sync(["python language", "java coffee island"])
+
+    assert index.questions == ["python language", "java coffee island"]
+    assert [q for q, _ in index.search("java language python snake", k=5)] == ["python language",
+                                                                                 "java coffee island"]
+    reloaded = make_index(tmp_path)
+    assert reloaded.questions == index.questions
+    assert np.allclose(reloaded.matrix, index.matrix)
+
+def test_written_questions_are_embedded_in_one_batch(tmp_path):
+    """note_write for every row of a save_many costs one pipeline pass at the next search"""
+    index = make_index(tmp_path)
+    for question in ["python language", "java language", "python snake"]:
+        index.note_write(question)
+    assert index.nlp.batches == 0
+    assert "python snake" in index
+
+    assert index.search("python snake", k=1)[0][0] == "python snake"
+    # One pass for the three questions, one for the query
+    assert index.nlp.batches == 2
+    assert len(index) == 3
@@ -0,0 +1,133 @@
+import sys
+import os
+import time
+import threading
+
+import networkx as nx
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import retrieval
+from knowledge_store import knowledge_store
+from retrieval import Retriever, graph_search, normalize_scores
+
+def ranked(*questions):
+    """A backend returning questions in order, with falling scores"""
+    return lambda query, limit: [{"question": question, "answer": f"About {question}", "score": 10.0 - n}
+                                 for n, question in enumerate(questions[:limit])]
+
+def test_results_found_by_several_backends_rank_first():
+    retriever = Retriever()
+    retriever.add_backend("fulltext", ranked("What is Python?", "What is Java?", "What is Rust?"))
+    retriever.add_backend("memory", ranked("What is Rust?", "what is  python?", "What is Go?"))
+
+    results = retriever.retrieve("python", k=3)
+    assert [result["question"] for result in results] == ["What is Python?", "What is Rust?", "What is Java?"]
+    assert results[0]["ranks"] == {"fulltext": 1, "memory": 2}
+    assert results[0]["scores"] == {"fulltext": 1.0, "memory": 0.5}
+    assert results[0]["answer"] == "About What is Python?"
+
+def test_no_backends_returns_nothing():
+    retriever = Retriever()
+    assert retriever.retrieve("python") == []
+    retriever.add_backend("fulltext", ranked("What is Python?"))
+    retriever.remove_backend("fulltext")
+    assert retriever.retrieve("python") == []
+
+def test_backend_weights():
+    retriever = Retriever()
+    retriever.add_backend("fulltext", ranked("A?", "B?"))
+    retriever.add_backend("memory", ranked("B?", "A?"), weight=2.0)
+    assert [result["question"] for result in retriever.retrieve("q")] == ["B?", "A?"]
+
+def test_slow_and_failing_backends_are_left_out():
+    release = threading.Event()
+
+    def slow(query, limit):
+        release.wait(10)
+        return [{"question": "Late?", "score": 1.0}]
+
+    def broken(query, limit):
+        raise ConnectionError("search is down")
+
+    retriever = Retriever(max_inflight=1)
+    retriever.add_backend("fulltext", ranked("What is Python?"))
+    retriever.add_backend("memory", slow)
+    retriever.add_backend("graph", broken)
+
+    start = time.monotonic()
+    results = retriever.retrieve("python", budget_ms=100)
+    assert time.monotonic() - start < 1.0
+    assert [result["question"] for result in results] == ["What is Python?"]
+
+    # The hung backend is not called again until its call returns
+    retriever.retrieve("python", budget_ms=50)
+    stats = retriever.get_stats()
+    assert (stats["memory"]["timeouts"], stats["memory"]["skipped"]) == (1, 1)
+    assert stats["graph"]["errors"] == 2
+
+    release.set()
+    time.sleep(0.1)
+    assert retriever.get_stats()["memory"]["inflight"] == 0
+
+def test_normalize_scores():
+    assert normalize_scores([{"score": 4.0}, {"score": 2.0}, {"score": 3.0}]) == [1.0, 0.0, 0.5]
+    assert normalize_scores([{"score": 0.3}]) == [1.0]
+
+def test_graph_neighbours():
+    graph = nx.DiGraph()
+    for question, entities in [("Who founded Apple?", ["Steve Jobs", "Apple"]),
+                               ("What did Steve Jobs invent?", ["Steve Jobs", "iPhone"]),
+                               ("What is an apple?", ["fruit"])]:
+        graph.add_node(question, type="question")
+        for entity in entities:
+            graph.add_node(entity, type="entity")
+            graph.add_edge(question, entity, relation="contains")
+
+    search = graph_search(graph)
+    results = search("what company did steve jobs found with apple", 5)
+    assert [result["question"] for result in results] == ["Who founded Apple?", "What did Steve Jobs invent?"]
+    assert search("nothing relevant", 5) == []
+
+    # Entities added later are found
+    graph.add_node("Go", type="entity")
+    graph.add_edge("What is an apple?", "Go", relation="contains")
+    assert search("go", 5)[0]["question"] == "What is an apple?"
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    knowledge_store.reset()
+    database.init_db()
+    yield
+    database.close_connections()
+    knowledge_store.reset()
+
+def test_fulltext_and_graph_over_the_database(db):
+    database.save_many([
+        ("What is photosynthesis?", "Plants turn light into chemical energy.", 0.6, "wikipedia"),
+        ("Who was Marie Curie?", "A physicist who studied radioactivity.", 0.6, "wikipedia"),
+    ])
+    graph = nx.DiGraph()
+    graph.add_node("Who was Marie Curie?", type="question")
+    graph.add_node("Marie Curie", type="entity")
+    graph.add_edge("Who was Marie Curie?", "Marie Curie", relation="contains")
+
+    retriever = Retriever(answer_for=retrieval.stored_answer)
+    retriever.add_backend("fulltext", retrieval.fulltext_search)
+    retriever.add_backend("graph", graph_search(graph))
+
+    results = retriever.retrieve("marie curie radioactivity", k=5, budget_ms=2000)
+    assert results[0]["question"] == "Who was Marie Curie?"
+    assert set(results[0]["ranks"]) == {"fulltext", "graph"}
+    assert results[0]["answer"] == "A physicist who studied radioactivity."
+
+    # Only the graph knows this question; its answer comes from the knowledge base
+    graph.add_node("What is photosynthesis?", type="question")
+    graph.add_node("chlorophyll", type="entity")
+    graph.add_edge("What is photosynthesis?", "chlorophyll", relation="contains")
+    results = retriever.retrieve("chlorophyll", budget_ms=2000)
+    assert results[0]["answer"] == "Plants turn light into chemical energy."
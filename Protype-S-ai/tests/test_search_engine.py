@@ -1,14 +1,18 @@
 
 import sys
 import os
+import time
+import sqlite3
 import pytest
 from unittest import mock
+from elasticsearch.exceptions import NotFoundError
 
 # Add parent directory to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import search_engine
 import database
+from knowledge_store import KnowledgeStore
 
 @pytest.fixture
 def mock_elasticsearch():
@@ -52,34 +56,158 @@ def test_init_elasticsearch(mock_elasticsearch):
     mock_elasticsearch.indices.exists.assert_called_once_with(index="knowledge")
     mock_elasticsearch.indices.create.assert_called_once()
 
-def test_sync_database_to_elasticsearch(mock_elasticsearch):
-    """Test syncing database to Elasticsearch"""
-    # Mock database.load_data to return test data
-    test_data = {
-        "What is Python?": [
-            {
-                "answer": "Python is a programming language.",
-                "weight": 0.7,
-                "source": "test"
-            }
-        ]
-    }
-    
-    with mock.patch('database.load_data', return_value=test_data), \
-         mock.patch('database.get_knowledge_history', return_value=[]):
-        assert search_engine.sync_database_to_elasticsearch() is True
-        mock_elasticsearch.bulk.assert_called_once()
-
-def test_index_document(mock_elasticsearch):
-    """Test indexing a single document"""
-    assert search_engine.index_document(
-        "What is Python?",
-        "Python is a programming language.",
-        0.7,
-        "test"
-    ) is True
-    
-    mock_elasticsearch.index.assert_called_once()
+def test_legacy_index_is_cleared_once(mock_elasticsearch):
+    """An index without the migration marker or a sync state is cleared, then marked"""
+    state = {}
+
+    def get(index, id):
+        if id not in state:
+            raise NotFoundError("not found", mock.Mock(status=404), {})
+        return {"_source": state[id]}
+
+    mock_elasticsearch.indices.exists.return_value = True
+    mock_elasticsearch.get.side_effect = get
+    mock_elasticsearch.index.side_effect = lambda index, id, body: state.update({id: body})
+
+    assert search_engine.init_elasticsearch() is True
+    mock_elasticsearch.delete_by_query.assert_called_once()
+    assert state["migration"] == {"stable_ids": True}
+
+    # Still no sync state (e.g. the first sync partly failed): the index is kept
+    assert search_engine.init_elasticsearch() is True
+    mock_elasticsearch.delete_by_query.assert_called_once()
+
+class FakeHelpers:
+    """Stands in for elasticsearch.helpers, recording the bulk actions sent"""
+
+    def __init__(self, fail=()):
+        self.requests = []
+        self.fail = set(fail)
+
+    def streaming_bulk(self, client, actions, chunk_size=500, **kwargs):
+        chunk = []
+        for action in actions:
+            chunk.append(action)
+            if len(chunk) == chunk_size:
+                yield from self._send(chunk)
+                chunk = []
+        if chunk:
+            yield from self._send(chunk)
+
+    def _send(self, chunk):
+        self.requests.append(list(chunk))
+        for action in chunk:
+            ok = action["_source"]["question"] not in self.fail
+            yield ok, {"index": {"_id": action["_id"], "status": 201 if ok else 400}}
+
+    def bulk(self, client, actions, **kwargs):
+        results = list(self._send(list(actions)))
+        return sum(ok for ok, _ in results), [item for ok, item in results if not ok]
+
+@pytest.fixture
+def knowledge_db(tmp_path, monkeypatch):
+    test_db_path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    monkeypatch.setattr("knowledge_store.knowledge_store", KnowledgeStore(sync_interval=0))
+    database.init_db()
+    for n in range(5):
+        database.save_data(f"Question {n}?", f"Answer {n}", 0.5, "test")
+    return test_db_path
+
+def set_modified_at(path, questions, value):
+    conn = sqlite3.connect(path)
+    conn.executemany("UPDATE knowledge SET modified_at = ? WHERE question = ?", [(value, q) for q in questions])
+    conn.commit()
+    conn.close()
+
+def test_sync_streams_chunks_with_stable_ids(mock_elasticsearch, knowledge_db, monkeypatch):
+    """Rows are sent in chunks with _id derived from the question; only newer rows are re-sent"""
+    fake = FakeHelpers()
+    monkeypatch.setattr(search_engine, "helpers", fake)
+    monkeypatch.setattr(search_engine, "ES_SYNC_CHUNK_SIZE", 2)
+    mock_elasticsearch.get.side_effect = NotFoundError("not found", mock.Mock(status=404), {})
+    set_modified_at(knowledge_db, [f"Question {n}?" for n in range(5)], "2024-01-01 00:00:00")
+
+    assert search_engine.sync_database_to_elasticsearch() is True
+    assert [len(chunk) for chunk in fake.requests] == [2, 2, 1]
+    actions = [action for chunk in fake.requests for action in chunk]
+    assert {action["_id"] for action in actions} == {search_engine.document_id(f"Question {n}?") for n in range(5)}
+    assert actions[0]["_source"]["modified_at"] == "2024-01-01T00:00:00"
+    mock_elasticsearch.index.assert_called_once_with(
+        index=search_engine.SYNC_STATE_INDEX, id="knowledge", body={"high_water_mark": "2024-01-01 00:00:00"})
+
+    # The next sync starts from the stored high-water mark
+    mock_elasticsearch.get.side_effect = None
+    mock_elasticsearch.get.return_value = {"_source": {"high_water_mark": "2024-01-01 00:00:00"}}
+    database.save_data("Question 1?", "A new answer", 0.5, "test")
+    set_modified_at(knowledge_db, ["Question 1?"], "2024-01-02 00:00:00")
+    fake.requests.clear()
+
+    assert search_engine.sync_database_to_elasticsearch() is True
+    sent = {action["_source"]["question"]: action for chunk in fake.requests for action in chunk}
+    # >= keeps rows sharing the mark's second; re-sending them overwrites the same documents
+    assert sent["Question 1?"]["_source"]["answer"] == "A new answer"
+    mock_elasticsearch.index.assert_called_with(
+        index=search_engine.SYNC_STATE_INDEX, id="knowledge", body={"high_water_mark": "2024-01-02 00:00:00"})
+
+def test_sync_failure_keeps_high_water_mark(mock_elasticsearch, knowledge_db, monkeypatch):
+    monkeypatch.setattr(search_engine, "helpers", FakeHelpers(fail={"Question 3?"}))
+    mock_elasticsearch.get.side_effect = NotFoundError("not found", mock.Mock(status=404), {})
+
+    assert search_engine.sync_database_to_elasticsearch() is False
+    mock_elasticsearch.index.assert_not_called()
+
+def test_index_document_is_buffered(mock_elasticsearch, monkeypatch):
+    """index_document queues documents; a flush sends them in one bulk request without refresh"""
+    fake = FakeHelpers()
+    monkeypatch.setattr(search_engine, "helpers", fake)
+    buffer = search_engine.IndexBuffer(max_size=100, flush_interval=60)
+    monkeypatch.setattr(search_engine, "index_buffer", buffer)
+
+    assert search_engine.index_document("What is Python?", "A snake", 0.7, "test") is True
+    assert search_engine.index_document("What is Python?", "A programming language.", 0.7, "test") is True
+    assert search_engine.index_document("What is Java?", "An island", 0.7, "test") is True
+    mock_elasticsearch.index.assert_not_called()
+
+    assert buffer.flush() == 2
+    assert len(fake.requests) == 1
+    assert fake.requests[0][0]["_source"]["answer"] == "A programming language."
+    assert buffer.flush() == 0
+
+def test_index_buffer_flushes_when_full(mock_elasticsearch, monkeypatch):
+    fake = FakeHelpers()
+    monkeypatch.setattr(search_engine, "helpers", fake)
+    buffer = search_engine.IndexBuffer(max_size=2, flush_interval=60)
+    monkeypatch.setattr(search_engine, "index_buffer", buffer)
+
+    search_engine.index_document("What is Python?", "A language", 0.7, "test")
+    search_engine.index_document("What is Java?", "An island", 0.7, "test")
+    deadline = time.time() + 5
+    while buffer.stats["indexed"] < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert buffer.stats["indexed"] == 2
+
+def test_failed_documents_are_retried(mock_elasticsearch, monkeypatch):
+    fake = FakeHelpers(fail={"What is Java?"})
+    monkeypatch.setattr(search_engine, "helpers", fake)
+    buffer = search_engine.IndexBuffer(max_size=100, flush_interval=60, max_attempts=3)
+
+    buffer.add(search_engine.make_document("What is Python?", "A language", 0.7, "test"))
+    buffer.add(search_engine.make_document("What is Java?", "An island", 0.7, "test"))
+    assert buffer.flush() == 1
+    assert buffer.flush() == 0
+    fake.fail.clear()
+    assert buffer.flush() == 1
+    assert [action["_source"]["question"] for action in fake.requests[-1]] == ["What is Java?"]
+    assert (buffer.stats["retried"], buffer.stats["dropped"]) == (2, 0)
+
+    # Dropped after max_attempts failed flushes
+    fake.fail.add("What is Go?")
+    buffer.add(search_engine.make_document("What is Go?", "A language", 0.7, "test"))
+    for _ in range(4):
+        buffer.flush()
+    assert buffer.stats["dropped"] == 1
+    assert len(fake.requests) == 6
 
 def test_search(mock_elasticsearch):
     """Test search functionality"""
@@ -0,0 +1,263 @@
+import sys
+import os
+import re
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+import numpy as np
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from knowledge_store import KnowledgeStore
+from semantic_cache import SemanticCache
+from llm_gateway import LLMGateway, StubBackend
+from write_behind import WriteBehindQueue
+
+def bag_of_words(texts):
+    """Deterministic stand-in for MiniLM: questions sharing words get similar vectors"""
+    vectors = np.zeros((len(texts), 384), dtype='float32')
+    for row, text in enumerate(texts):
+        for word in re.findall(r"\w+", text.lower()):
+            vectors[row, zlib.crc32(word.encode()) % 384] += 1.0
+    return vectors
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    test_db_path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    database.init_db()
+    store = KnowledgeStore(sync_interval=0)
+    monkeypatch.setattr("knowledge_store.knowledge_store", store)
+    return store
+
+@pytest.fixture
+def side_effects(tmp_path, monkeypatch):
+    """A write-behind queue of its own for the chat service"""
+    import chat_service
+
+    queue = WriteBehindQueue(str(tmp_path / "write_behind.db"))
+    # Answers indexed into the vector memory are recorded instead
+    queue.indexed = []
+    monkeypatch.setattr(chat_service, "index_answers", queue.indexed.extend)
+    chat_service.register_side_effects(queue)
+    monkeypatch.setattr(chat_service, "write_behind", queue)
+    yield queue
+    queue.close(timeout=10)
+
+def make_cache(**kwargs):
+    kwargs.setdefault("threshold", 0.8)
+    return SemanticCache(embed=bag_of_words, sync_interval=0, **kwargs)
+
+def test_paraphrase_hits_and_unrelated_misses(db):
+    cache = make_cache()
+    assert cache.store("what is the speed of light", "About 300,000 km/s", "gemini_flash_2")
+
+    hit = cache.lookup("what is the speed of light exactly")
+    assert hit["answer"] == "About 300,000 km/s"
+    assert hit["question"] == "what is the speed of light"
+    assert hit["similarity"] >= 0.8
+    assert cache.lookup("who painted the mona lisa") is None
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+def test_entries_expire(db):
+    cache = make_cache(ttl=60)
+    cache.store("what is gravity", "A force", "gemini_flash_2")
+    cache.entries = {row_id: (q, s, created_at - 120) for row_id, (q, s, created_at) in cache.entries.items()}
+
+    assert cache.lookup("what is gravity") is None
+    assert cache.get_stats()["expired"] == 1
+    # The expired row is deleted, so a fresh instance does not load it either
+    assert make_cache(ttl=60).lookup("what is gravity") is None
+
+def test_invalidate_by_source_across_instances(db):
+    writer = make_cache()
+    reader = make_cache()
+    writer.store("what is python", "A language", "gemini_flash_2")
+    writer.store("what is java", "Another language", "manual")
+
+    # Entries written by another process are picked up on the next sync
+    assert reader.lookup("what is python")["answer"] == "A language"
+
+    assert writer.invalidate(source="gemini_flash_2") == 1
+    assert reader.lookup("what is python") is None
+    assert reader.lookup("what is java")["answer"] == "Another language"
+
+def test_restore_replaces_entry(db):
+    cache = make_cache()
+    cache.store("what is python", "A snake", "gemini_flash_2")
+    cache.store("what is python", "A language", "gemini_flash_2")
+
+    assert cache.lookup("what is python")["answer"] == "A language"
+    assert cache.index.ntotal == 1
+    assert make_cache().lookup("what is python")["answer"] == "A language"
+
+def test_retaught_question_is_invalidated(db):
+    cache = make_cache()
+    db.add_write_listener(cache.note_write)
+    cache.store("what is python", "A snake", "gemini_flash_2")
+
+    database.save_data("what is python", "A language", 0.9, "manual")
+    assert cache.lookup("what is python") is None
+
+def test_lookups_embed_concurrently(db):
+    """The embedding forward pass runs outside the cache lock"""
+    def slow_embed(texts):
+        time.sleep(0.2)
+        return bag_of_words(texts)
+
+    cache = make_cache()
+    cache.store("what is python", "A language", "gemini_flash_2")
+    cache._embed = slow_embed
+
+    threads = [threading.Thread(target=cache.lookup, args=("what is python",)) for _ in range(4)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.perf_counter() - start < 0.6
+    assert cache.get_stats()["hits"] == 4
+
+def test_full_resync_loads_rows_committed_out_of_order(db):
+    """A row committed late with a lower id is picked up by the periodic full resync"""
+    writer = make_cache()
+    reader = make_cache(full_resync_interval=3600)
+    writer.store("what is java", "Another language", "manual")
+    writer.store("what is python", "A language", "gemini_flash_2")
+    assert reader.lookup("what is python")["answer"] == "A language"
+
+    # Simulate a concurrent transaction that took a lower id but committed after the reader synced
+    conn, _ = database.get_connection()
+    java_id = conn.execute("SELECT id FROM semantic_cache WHERE question = 'what is java'").fetchone()[0]
+    conn.execute("UPDATE semantic_cache SET id = 0 WHERE id = ?", (java_id,))
+    conn.commit()
+    conn.close()
+    reader._forget([java_id])
+    assert reader.lookup("what is java") is None
+
+    reader.full_resync_interval = 0
+    assert reader.lookup("what is java")["answer"] == "Another language"
+    assert reader.get_stats()["full_resyncs"] == 1
+
+def test_web_chat_uses_cache_before_llm(db, side_effects, monkeypatch):
+    import chat_service
+    import web_app
+
+    backend = StubBackend(["Paris"], persist=True)
+    cache = make_cache()
+    monkeypatch.setattr(chat_service, "semantic_cache", cache)
+    monkeypatch.setattr(chat_service, "knowledge_store", db)
+    monkeypatch.setattr(chat_service, "llm_gateway", LLMGateway(backend))
+    monkeypatch.setattr(chat_service, "log_action", lambda *args: None)
+    client = web_app.app.test_client()
+
+    first = client.post('/api/chat', json={"message": "what is the capital of france"}).get_json()
+    assert first == {"response": "Paris", "source": "gemini_flash_2", "cached": False}
+    assert side_effects.flush(timeout=10)
+
+    second = client.post('/chat', json={"question": "what is the capital city of france"}).get_json()
+    assert second["answer"] == "Paris"
+    assert second["cached"] is True
+
+    # The exact question is now answered from the knowledge base
+    third = client.post('/chat', json={"question": "what is the capital of france"}).get_json()
+    assert third["source"] == "knowledge_base"
+    assert len(backend.calls) == 1
+
+def parse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_web_chat_stream_persists_once_at_end(db, side_effects, monkeypatch):
+    import chat_service
+    import web_app
+
+    cache = make_cache()
+    saved = []
+    monkeypatch.setattr(chat_service, "semantic_cache", cache)
+    monkeypatch.setattr(chat_service, "knowledge_store", db)
+    monkeypatch.setattr(chat_service, "llm_gateway", LLMGateway(StubBackend(["Water boils at 100 degrees"], persist=True)))
+    monkeypatch.setattr(chat_service, "log_action", lambda *args: None)
+    monkeypatch.setattr(chat_service, "save_many", lambda *args: saved.append(args) or database.save_many(*args))
+    client = web_app.app.test_client()
+
+    response = client.post('/chat/stream', json={"question": "when does water boil"})
+    assert response.mimetype == "text/event-stream"
+    events = parse_events(response.get_data(as_text=True))
+
+    assert [data["stage"] for event, data in events if event == "status"] == ["knowledge_base", "cache", "model"]
+    chunks = [data["text"] for event, data in events if event == "chunk"]
+    assert len(chunks) == 5
+    assert events[-1] == ("done", {"answer": "Water boils at 100 degrees", "source": "gemini_flash_2", "cached": False})
+    assert side_effects.flush(timeout=10)
+    assert len(saved) == 1
+    assert cache.lookup("when does water boil exactly")["answer"] == "Water boils at 100 degrees"
+    assert side_effects.indexed == [{"question": "when does water boil", "answer": "Water boils at 100 degrees",
+                                     "user": "web_user"}]
+    # The request's log entry, the answer, its cache embedding and its memory index entry
+    assert side_effects.get_stats()["processed"] == 4
+
+def test_web_chat_stream_error_is_not_persisted(db, side_effects, monkeypatch):
+    import chat_service
+    import web_app
+
+    monkeypatch.setattr(chat_service, "semantic_cache", make_cache())
+    monkeypatch.setattr(chat_service, "knowledge_store", db)
+    monkeypatch.setattr(chat_service, "llm_gateway", LLMGateway(StubBackend([ConnectionError("down")]), max_retries=0))
+    monkeypatch.setattr(chat_service, "log_action", lambda *args: None)
+    client = web_app.app.test_client()
+
+    events = parse_events(client.post('/api/chat/stream', json={"message": "anything"}).get_data(as_text=True))
+    assert events[-1][0] == "error"
+    # Only the request's log entry
+    assert side_effects.get_stats()["enqueued"] == 1
+    assert side_effects.pending("answer", "anything") is None
+
+def test_stub_answers_are_not_saved(db, side_effects, monkeypatch):
+    import chat_service
+    import web_app
+
+    monkeypatch.setattr(chat_service, "semantic_cache", make_cache())
+    monkeypatch.setattr(chat_service, "knowledge_store", db)
+    monkeypatch.setattr(chat_service, "llm_gateway", LLMGateway(StubBackend()))
+    monkeypatch.setattr(chat_service, "log_action", lambda *args: None)
+    client = web_app.app.test_client()
+
+    response = client.post('/api/chat', json={"message": "what is the capital of peru"}).get_json()
+    assert response["response"] == "Stub response to: what is the capital of peru"
+    assert side_effects.get_stats()["enqueued"] == 1
+    assert side_effects.flush(timeout=10)
+    assert db.get_answer("what is the capital of peru") is None
+
+def test_web_cache_invalidate_is_admin_only(db, monkeypatch):
+    import chat_service
+    import web_app
+
+    cache = make_cache()
+    cache.store("what is the capital of france", "Paris", "gemini_flash_2")
+    monkeypatch.setattr(web_app, "semantic_cache", cache)
+    client = web_app.app.test_client()
+    remote = {"REMOTE_ADDR": "203.0.113.7"}
+
+    assert client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"},
+                       environ_base=remote).status_code == 403
+    assert client.post('/api/cache/invalidate', json={"question": 1}).status_code == 400
+    assert client.post('/api/chat', json={"message": None}).status_code == 400
+
+    monkeypatch.setattr(chat_service, "ADMIN_TOKEN", "s3cret")
+    assert client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"}).status_code == 403
+    response = client.post('/api/cache/invalidate', json={"source": "gemini_flash_2"},
+                           headers={"X-Admin-Token": "s3cret"}, environ_base=remote)
+    assert response.get_json() == {"removed": 1}
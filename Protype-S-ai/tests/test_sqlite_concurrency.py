@@ -0,0 +1,142 @@
+import sys
+import os
+import time
+import threading
+import multiprocessing
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from knowledge_store import knowledge_store
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "SQLITE_DB_PATH", str(tmp_path / "test.db"))
+    knowledge_store.reset()
+    database.init_db()
+    yield
+    database.close_connections()
+    knowledge_store.reset()
+
+def count_rows():
+    conn, is_postgres = database.get_connection()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM knowledge").fetchone()[0]
+    finally:
+        database.release_connection(conn, is_postgres)
+
+def test_connection_settings(db):
+    """Connections use WAL and are reused within a thread, not across threads"""
+    conn, _ = database.get_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == database.SQLITE_BUSY_TIMEOUT_MS
+    database.release_connection(conn, False)
+    assert database.get_connection()[0] is conn
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(database.get_connection()[0]))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+def test_release_rolls_back_uncommitted(db):
+    """A reused connection does not carry a caller's open transaction"""
+    conn, _ = database.get_connection()
+    conn.execute("INSERT INTO knowledge (question, answer) VALUES ('Left open?', 'yes')")
+    database.release_connection(conn, False)
+    assert not conn.in_transaction
+    assert count_rows() == 0
+
+def test_failed_write_does_not_undo_its_batch(db):
+    """Writes queued together share one commit; a failing one is rolled back alone"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def blocking_write(cursor, is_postgres):
+        started.set()
+        release.wait(5)
+
+    def failing_write(cursor, is_postgres):
+        cursor.execute("INSERT INTO knowledge (question, answer) VALUES ('Partial?', 'no')")
+        raise ValueError("failed")
+
+    # Hold the writer so the next writes queue up behind it
+    blocker = threading.Thread(target=database.run_write, args=(blocking_write,))
+    blocker.start()
+    started.wait(5)
+
+    errors = []
+    def submit(question):
+        try:
+            if question is None:
+                database.run_write(failing_write)
+            else:
+                assert database.save_data(question, "answer", 0.5, "test")
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit, args=(question,)) for question in ("First?", None, "Second?")]
+    for thread in threads:
+        thread.start()
+    while database.sqlite_writer._queue.qsize() < 3:
+        time.sleep(0.01)
+    commits = database.sqlite_writer.stats["commits"]
+    release.set()
+    for thread in threads + [blocker]:
+        thread.join()
+
+    assert len(errors) == 1
+    assert database.sqlite_writer.stats["commits"] == commits + 2
+    assert set(database.load_data()) == {"First?", "Second?"}
+
+def write_from_process(path, count):
+    database.SQLITE_DB_PATH = path
+    for n in range(count):
+        if not database.save_data(f"Process question {n}?", f"Answer {n}", 0.5, "process"):
+            sys.exit(1)
+
+def test_concurrent_writes_without_lock_errors(db, capsys):
+    """Threads and a second process write at a target rate while others read"""
+    target_rate = 400
+    writer_threads = 8
+    writes_per_thread = 40
+    interval = writer_threads / target_rate
+    failures = []
+    done = threading.Event()
+
+    def writer(thread_id):
+        next_at = time.monotonic()
+        for n in range(writes_per_thread):
+            time.sleep(max(0, next_at - time.monotonic()))
+            if not database.save_data(f"Thread {thread_id} question {n % 30}?", f"Answer {n}", 0.5, "thread"):
+                failures.append((thread_id, n))
+            next_at += interval
+
+    def reader():
+        while not done.is_set():
+            database.full_text_search("answer")
+            database.load_data()
+
+    process = multiprocessing.get_context("fork").Process(
+        target=write_from_process, args=(database.SQLITE_DB_PATH, 100))
+    process.start()
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(writer_threads)]
+    commits = database.sqlite_writer.stats["commits"]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+    process.join(60)
+
+    assert failures == []
+    assert process.exitcode == 0
+    assert "locked" not in capsys.readouterr().out
+    assert count_rows() == writer_threads * 30 + 100
+    # Writes that arrived together were committed together
+    assert database.sqlite_writer.stats["commits"] - commits < writer_threads * writes_per_thread
@@ -0,0 +1,91 @@
+import sys
+import os
+import threading
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from task_executor import TaskExecutor, TaskQueueFull
+
+@pytest.fixture
+def blocked():
+    """An executor with one worker, busy until release is set"""
+    executor = TaskExecutor(workers=1, max_queue=4)
+    started = threading.Event()
+    release = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(10)
+
+    executor.submit(block, "blocker")
+    assert started.wait(10)
+    yield executor, release
+    release.set()
+    executor.shutdown(timeout=10)
+
+def test_interactive_tasks_run_before_queued_background(blocked):
+    executor, release = blocked
+    ran = []
+    results = [executor.submit(lambda name=name: ran.append(name) or name, name, interactive=name.startswith("ask"))
+               for name in ("learn-1", "learn-2", "ask-1", "ask-2")]
+    release.set()
+
+    assert [result.get(timeout=10) for result in results] == ["learn-1", "learn-2", "ask-1", "ask-2"]
+    assert ran == ["ask-1", "ask-2", "learn-1", "learn-2"]
+
+def test_queue_depth_limit_keeps_headroom_for_interactive(blocked):
+    executor, release = blocked
+    for n in range(4):
+        executor.submit(lambda: None, f"learn-{n}")
+
+    with pytest.raises(TaskQueueFull):
+        executor.submit(lambda: None, "learn-4")
+    executor.submit(lambda: None, "ask-1", interactive=True)
+    with pytest.raises(TaskQueueFull):
+        executor.submit(lambda: None, "ask-2", interactive=True)
+
+    stats = executor.get_stats()
+    assert (stats["queued"], stats["rejected"], stats["max_depth"]) == (5, 2, 5)
+
+def test_results_and_failures(blocked):
+    executor, release = blocked
+
+    def fail():
+        raise ValueError("no article")
+
+    ok = executor.submit(lambda: 42, "ok")
+    failed = executor.submit(fail, "failed")
+    assert ok.state == "PENDING"
+    assert executor.get_result("ok") is not None
+    release.set()
+
+    assert ok.get(timeout=10) == 42
+    with pytest.raises(ValueError):
+        failed.get(timeout=10)
+    assert isinstance(failed.get(propagate=False), ValueError)
+    assert (ok.state, failed.state) == ("SUCCESS", "FAILURE")
+    assert executor.get_result("ok") is None
+
+def test_shutdown_runs_queued_tasks():
+    executor = TaskExecutor(workers=2)
+    ran = []
+    for n in range(10):
+        executor.submit(lambda n=n: ran.append(n), f"task-{n}")
+    executor.shutdown(timeout=10)
+
+    assert sorted(ran) == list(range(10))
+    assert executor.get_stats()["completed"] == 10
+    with pytest.raises(TaskQueueFull):
+        executor.submit(lambda: None, "late")
+
+def test_shutdown_can_cancel_queued_tasks(blocked):
+    executor, release = blocked
+    queued = [executor.submit(lambda: None, f"learn-{n}") for n in range(3)]
+    executor.shutdown(wait=False, cancel_pending=True)
+    release.set()
+    executor.shutdown(timeout=10)
+
+    assert [result.state for result in queued] == ["REVOKED"] * 3
+    assert executor.get_stats()["cancelled"] == 3
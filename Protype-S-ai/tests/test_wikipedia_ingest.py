@@ -0,0 +1,180 @@
+import sys
+import os
+import hashlib
+import sqlite3
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from knowledge_store import KnowledgeStore
+from wikipedia_ingest import WikipediaIngestor, WikipediaFetchError, ParagraphExtractor, extract_paragraphs
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "wikipedia")
+
+class FixtureServer:
+    """Replays recorded pages from FIXTURE_DIR with ETag revalidation"""
+
+    def __init__(self, failures=None):
+        self.requests = Counter()
+        self.conditional = Counter()
+        self.connections = set()
+        self.failures = Counter(failures or {})
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                topic = unquote(self.path.rsplit("/", 1)[-1])
+                server.requests[topic] += 1
+                server.connections.add(self.client_address)
+                if server.failures[topic]:
+                    server.failures[topic] -= 1
+                    return self.reply(503, b"busy")
+                path = os.path.join(FIXTURE_DIR, f"{topic}.html")
+                if not os.path.exists(path):
+                    return self.reply(404, b"not found")
+                with open(path, "rb") as f:
+                    body = f.read()
+                etag = '"%s"' % hashlib.sha1(body).hexdigest()
+                if self.headers.get("If-None-Match") == etag:
+                    server.conditional[topic] += 1
+                    return self.reply(304, b"", etag)
+                self.reply(200, body, etag)
+
+            def reply(self, status, body, etag=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=UTF-8")
+                self.send_header("Content-Length", str(len(body)))
+                if etag:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/wiki/"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def server():
+    server = FixtureServer(failures={"Photosynthesis": 1})
+    yield server
+    server.close()
+
+@pytest.fixture
+def ingestor(server, tmp_path):
+    ingestor = WikipediaIngestor(base_url=server.base_url, cache_path=str(tmp_path / "cache.db"), retry_delay=0.01)
+    yield ingestor
+    ingestor.close()
+
+TOPICS = ["Python_(programming_language)", "Albert_Einstein", "Photosynthesis"]
+
+def test_extractor_keeps_paragraph_text_only():
+    with open(os.path.join(FIXTURE_DIR, "Python_(programming_language).html"), encoding="utf-8") as f:
+        content = extract_paragraphs(f.read())
+    lines = content.splitlines()
+
+    assert lines[0].startswith("Python is a high-level, general-purpose programming language.")
+    # Citation markers, inline CSS, infobox cells, list items and short paragraphs are dropped
+    assert "[1]" not in content
+    assert "templatequote" not in content
+    assert "Guido van Rossum began working on Python" in content
+    assert "January 1994" not in content
+    assert "Ok." not in lines
+    assert '"batteries included"' in content
+
+def test_extractor_handles_unclosed_paragraphs_and_line_limit():
+    with open(os.path.join(FIXTURE_DIR, "Photosynthesis.html"), encoding="utf-8") as f:
+        assert len(extract_paragraphs(f.read()).splitlines()) == 3
+
+    extractor = ParagraphExtractor(max_lines=5)
+    for n in range(100):
+        extractor.feed(f"<p>Paragraph number {n} with enough text.</p>")
+        if extractor.done:
+            break
+    extractor.close()
+    assert len(extractor.paragraphs) == 5
+    assert n == 4
+
+def test_fetch_many_concurrent_with_retry_and_missing(server, ingestor):
+    contents = ingestor.fetch_many(TOPICS + ["No_such_article"])
+
+    assert contents["Albert_Einstein"].startswith("Albert Einstein (")
+    assert "Zürich & later" in contents["Albert_Einstein"]
+    # One 503 then success
+    assert contents["Photosynthesis"].startswith("Photosynthesis is a biological process")
+    assert server.requests["Photosynthesis"] == 2
+    assert contents["No_such_article"] is None
+    assert ingestor.stats["fetched"] == 3
+    assert ingestor.stats["retries"] == 1
+
+def test_revalidation_uses_cache(server, ingestor, tmp_path):
+    first = ingestor.fetch_many(TOPICS)
+    second = ingestor.fetch_many(TOPICS)
+
+    assert first == second
+    assert sum(server.conditional.values()) == 3
+    assert ingestor.stats["not_modified"] == 3
+
+    # The cache is on disk, so a new process revalidates too
+    other = WikipediaIngestor(base_url=server.base_url, cache_path=str(tmp_path / "cache.db"))
+    assert other.fetch("Albert_Einstein") == first["Albert_Einstein"]
+    assert other.stats["not_modified"] == 1
+    other.close()
+
+def test_connections_are_reused(server, ingestor):
+    for _ in range(3):
+        ingestor.fetch("Albert_Einstein")
+    assert server.requests["Albert_Einstein"] == 3
+    assert len(server.connections) == 1
+
+def test_ingest_saves_rows_in_bulk(server, ingestor, tmp_path, monkeypatch):
+    test_db_path = str(tmp_path / "test.db")
+    monkeypatch.setattr(database, "get_connection", lambda: (sqlite3.connect(test_db_path), False))
+    monkeypatch.setattr("knowledge_store.knowledge_store", KnowledgeStore(sync_interval=0))
+    database.init_db()
+
+    results = ingestor.ingest(TOPICS + ["No_such_article"], user="celery_worker")
+
+    assert [r["status"] for r in results] == ["success", "success", "success", "error"]
+    conn = sqlite3.connect(test_db_path)
+    rows = conn.execute("SELECT question, answer, source, created_by FROM knowledge ORDER BY id").fetchall()
+    assert len(rows) == 3
+    assert all(row[1].startswith("According to Wikipedia under CC BY-SA 3.0:\n") for row in rows)
+    assert {row[2] for row in rows} == {"wikipedia"}
+    assert {row[3] for row in rows} == {"celery_worker"}
+    assert [row[0] for row in rows] == [r["question"] for r in results[:3]]
+
+def test_fetch_failure_is_not_missing_content(server, ingestor, tmp_path, monkeypatch):
+    """Pages that keep failing are reported as fetch errors, not as missing articles"""
+    server.failures["Albert_Einstein"] = 10
+    with pytest.raises(WikipediaFetchError):
+        ingestor.fetch("Albert_Einstein")
+    assert ingestor.fetch("No_such_article") is None
+
+    monkeypatch.setattr(database, "save_many", lambda rows, user: len(rows))
+    results = {r["topic"]: r for r in ingestor.ingest(["Albert_Einstein", "No_such_article"])}
+    assert results["Albert_Einstein"]["reason"].startswith("Failed to fetch Wikipedia content after 3 attempts")
+    assert results["No_such_article"]["reason"] == "No content found"
+
+def test_ingest_reports_rows_lost_by_partial_save(server, ingestor, monkeypatch):
+    """Only the rows save_many committed count as saved"""
+    monkeypatch.setattr(database, "save_many", lambda rows, user: 2)
+    results = ingestor.ingest(TOPICS)
+
+    assert [r["status"] for r in results] == ["success", "success", "error"]
+    assert results[2]["reason"] == "Failed to save data"
@@ -0,0 +1,149 @@
+import sys
+import os
+import time
+import threading
+import pytest
+
+# Add parent directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from write_behind import WriteBehindQueue
+
+class Recorder:
+    """A handler that records its batches and can be held or made to fail"""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, payloads):
+        self.release.wait(10)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database is down")
+        self.batches.append([payload["n"] for payload in payloads])
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "write_behind.db")
+
+def test_effects_run_in_order_in_batches(journal):
+    queue = WriteBehindQueue(journal)
+    answers, logs = Recorder(), Recorder()
+    queue.register("answer", answers)
+    queue.register("log", logs)
+
+    answers.release.clear()
+    queue.enqueue("answer", "q1", {"n": 0})
+    for n in range(1, 5):
+        queue.enqueue("answer", f"q{n % 2}", {"n": n})
+    queue.enqueue("log", "q1", {"n": 5})
+    assert queue.pending("answer", "q1") == {"n": 3}
+    answers.release.set()
+
+    assert queue.flush(timeout=10)
+    assert [n for batch in answers.batches for n in batch] == [0, 1, 2, 3, 4]
+    assert len(answers.batches) <= 2
+    assert logs.batches == [[5]]
+    assert queue.pending("answer", "q1") is None
+    assert queue.get_stats()["processed"] == 6
+    queue.close()
+
+def test_journaled_effects_are_replayed_after_a_crash(journal, monkeypatch):
+    crashed = WriteBehindQueue(journal)
+    crashed.register("answer", Recorder())
+    # The process dies before its writer runs anything
+    monkeypatch.setattr(crashed, "_start_worker", lambda: None)
+    for n in range(3):
+        crashed.enqueue("answer", f"q{n}", {"n": n})
+
+    restarted = WriteBehindQueue(journal)
+    handler = Recorder()
+    handler.release.clear()
+    restarted.register("answer", handler)
+    assert restarted.replay() == 3
+    assert restarted.pending("answer", "q2") == {"n": 2}
+    handler.release.set()
+    assert restarted.flush(timeout=10)
+
+    assert handler.batches == [[0, 1, 2]]
+    assert restarted.get_stats()["replayed"] == 3
+    assert WriteBehindQueue(journal).replay() == 0
+
+def test_replayed_effects_wait_for_their_handler(journal, monkeypatch):
+    crashed = WriteBehindQueue(journal)
+    crashed.register("answer", Recorder())
+    crashed.register("log", Recorder())
+    monkeypatch.setattr(crashed, "_start_worker", lambda: None)
+    crashed.enqueue("log", "u", {"n": 0})
+    crashed.enqueue("answer", "q", {"n": 1})
+
+    # Opening the journal runs nothing until replay()
+    restarted = WriteBehindQueue(journal)
+    answers = Recorder()
+    restarted.register("answer", answers)
+    assert restarted.pending("log", "u") == {"n": 0}
+    assert restarted._worker is None
+
+    # No handler for "log" yet: it stays queued and is not counted as a failure
+    assert restarted.replay() == 2
+    assert restarted.flush(timeout=10)
+    assert answers.batches == [[1]]
+    stats = restarted.get_stats()
+    assert (stats["retries"], stats["failed"], stats["unhandled"]) == (0, 0, 1)
+
+    logs = Recorder()
+    restarted.register("log", logs)
+    assert restarted.flush(timeout=10)
+    assert logs.batches == [[0]]
+    assert restarted.get_stats()["queued"] == 0
+    restarted.close()
+
+def test_failed_batches_are_retried_then_parked(journal):
+    queue = WriteBehindQueue(journal, max_attempts=3)
+    handler = Recorder(failures=2)
+    queue.register("answer", handler)
+    queue.enqueue("answer", "q", {"n": 1})
+    assert queue.flush(timeout=10)
+    assert handler.batches == [[1]]
+    assert queue.get_stats()["retries"] == 2
+
+    handler.failures = 3
+    queue.enqueue("answer", "q", {"n": 2})
+    assert queue.flush(timeout=10)
+    stats = queue.get_stats()
+    assert (stats["failed"], stats["queued"]) == (1, 0)
+    queue.close()
+
+    # Parked effects are kept in the journal but not replayed
+    assert WriteBehindQueue(journal).replay() == 0
+
+def test_enqueue_waits_while_the_backlog_is_full(journal):
+    queue = WriteBehindQueue(journal, max_pending=2, block_seconds=0.2)
+    handler = Recorder()
+    queue.register("answer", handler)
+    handler.release.clear()
+    for n in range(2):
+        queue.enqueue("answer", f"q{n}", {"n": n})
+
+    # Nothing drains: the request waits block_seconds, then queues anyway
+    start = time.monotonic()
+    queue.enqueue("answer", "q2", {"n": 2})
+    assert time.monotonic() - start >= 0.2
+
+    # The writer drains while the request waits
+    queue.block_seconds = 10
+    threading.Timer(0.1, handler.release.set).start()
+    queue.enqueue("answer", "q3", {"n": 3})
+    assert queue.flush(timeout=10)
+
+    stats = queue.get_stats()
+    assert (stats["waited"], stats["overflowed"], stats["processed"]) == (2, 1, 4)
+    assert [n for batch in handler.batches for n in batch] == [0, 1, 2, 3]
+    queue.close()
+
+def test_unknown_kind_is_refused(journal):
+    with pytest.raises(ValueError):
+        WriteBehindQueue(journal).enqueue("index", "q", {})
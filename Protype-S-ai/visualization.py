@@ -7,30 +7,12 @@ from collections import Counter
 import json
 from datetime import datetime, timedelta
 
-def create_activity_chart(activity_log):
-    """Create activity chart from log data"""
+def create_activity_chart(date_counts):
+    """Create activity chart from {date: {action type: count}}, e.g. event_log.daily_counts()"""
     try:
-        # Count activities by date
-        activities = activity_log.get("actions", [])
-
-        if not activities:
+        if not date_counts:
             return None
 
-        # Group by date and action type
-        date_counts = {}
-
-        for activity in activities:
-            date = activity.get("timestamp", "").split("T")[0]
-            action_type = activity.get("action", "unknown")
-
-            if date not in date_counts:
-                date_counts[date] = {}
-
-            if action_type not in date_counts[date]:
-                date_counts[date][action_type] = 0
-
-            date_counts[date][action_type] += 1
-
         # Sort dates
         dates = sorted(date_counts.keys())
 
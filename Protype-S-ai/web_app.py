@@ -1,7 +1,15 @@
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 import os
+import json
 import logging
+from database import full_text_search
+from semantic_cache import semantic_cache
+from task_memo import task_memo
+from task_executor import task_executor
+from write_behind import write_behind
+from retrieval import retriever, RETRIEVE_BUDGET_MS, RETRIEVE_MAX_BUDGET_MS
+from chat_service import answer_events, answer_question, parse_limit, text_field, is_admin
 
 # Setup logging
 logger = logging.getLogger('protype_ai')
@@ -23,25 +31,100 @@ app.secret_key = os.environ.get('SECRET_KEY', 'protype-ai-dev-key')
 def index():
     return render_template('index.html')
 
+def sse_response(events):
+    """Stream (event, data) pairs as server-sent events"""
+    def generate():
+        for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    # X-Accel-Buffering stops nginx from holding the stream until it ends
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    question = text_field(request.json or {}, 'question')
+    if question is None:
+        return jsonify({"status": "error", "message": "The question must be a string"}), 400
+    if not question:
+        return jsonify({"status": "error", "message": "No question provided"})
+    return jsonify(answer_question(question))
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    question = text_field(request.json or {}, 'question')
+    if question is None:
+        return jsonify({"status": "error", "message": "The question must be a string"}), 400
+    if not question:
+        return jsonify({"status": "error", "message": "No question provided"})
+    return sse_response(answer_events(question))
+
 # API endpoints
 @app.route('/api/chat', methods=['POST'])
 def chat_endpoint():
-    data = request.json
-    message = data.get('message', '')
+    message = text_field(request.json or {}, 'message')
+    if message is None:
+        return jsonify({"error": "The message must be a string"}), 400
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
     
-    # Process the message and generate a response
-    # This is a placeholder - implement actual chat processing here
-    response = {"response": f"You said: {message}"}
+    result = answer_question(message, user="api_user")
+    if result["status"] != "success":
+        return jsonify({"error": result["message"]}), 503
     
-    return jsonify(response)
+    return jsonify({
+        "response": result["answer"],
+        "source": result["source"],
+        "cached": result["cached"]
+    })
+
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    message = text_field(request.json or {}, 'message')
+    if message is None:
+        return jsonify({"error": "The message must be a string"}), 400
+    if not message:
+        return jsonify({"error": "No message provided"}), 400
+    return sse_response(answer_events(message, user="api_user"))
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats_endpoint():
+    return jsonify(semantic_cache.get_stats())
+
+@app.route('/api/tasks/stats', methods=['GET'])
+def task_stats_endpoint():
+    return jsonify(dict(task_memo.get_stats(), executor=task_executor.get_stats(),
+                        side_effects=write_behind.get_stats()))
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def cache_invalidate_endpoint():
+    if not is_admin(request.headers.get('X-Admin-Token'), request.remote_addr):
+        return jsonify({"error": "Admin token required"}), 403
+    data = request.json or {}
+    question, source = text_field(data, 'question'), text_field(data, 'source')
+    if question is None or source is None:
+        return jsonify({"error": "The question and source must be strings"}), 400
+    if not question and not source:
+        return jsonify({"error": "Provide a question or a source to invalidate"}), 400
+    removed = semantic_cache.invalidate(question=question or None, source=source or None)
+    return jsonify({"removed": removed})
 
 @app.route('/api/search', methods=['GET'])
 def search_endpoint():
-    query = request.args.get('q', '')
-    
-    # Implement search functionality here
-    results = [{"title": "Sample result", "content": "This is a sample search result"}]
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"results": []})
     
+    results = full_text_search(query, limit=parse_limit(request.args.get('limit')))
+    return jsonify({"results": results})
+
+@app.route('/api/retrieve', methods=['GET'])
+def retrieve_endpoint():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"results": []})
+
+    budget_ms = parse_limit(request.args.get('budget_ms'), int(RETRIEVE_BUDGET_MS), RETRIEVE_MAX_BUDGET_MS)
+    results = retriever.retrieve(query, parse_limit(request.args.get('k')), budget_ms)
     return jsonify({"results": results})
 
 @app.route('/dashboard')
@@ -0,0 +1,345 @@
+import os
+import re
+import time
+import random
+import codecs
+import sqlite3
+import asyncio
+import threading
+from html.parser import HTMLParser
+from urllib.parse import quote
+import aiohttp
+
+import database
+
+WIKIPEDIA_BASE_URL = os.environ.get('WIKIPEDIA_BASE_URL', 'https://en.wikipedia.org/wiki/')
+WIKIPEDIA_CACHE_PATH = 'wikipedia_cache.db'
+USER_AGENT = 'ProtypeAI/1.0'
+
+# Requests in flight to one host; the connection pool keeps this many alive
+PER_HOST_CONCURRENCY = int(os.environ.get('WIKIPEDIA_CONCURRENCY', 4))
+FETCH_TIMEOUT = 10
+MAX_RETRIES = 3
+RETRY_DELAY = 1.0
+
+# Same limits as the previous BeautifulSoup extraction
+MAX_LINES = 200
+MIN_PARAGRAPH_LENGTH = 10
+
+# Bump when extraction output changes, so cached pages are fetched again
+EXTRACTOR_VERSION = 1
+
+READ_CHUNK_SIZE = 64 * 1024
+
+class WikipediaFetchError(Exception):
+    """A page could not be fetched after all retries"""
+
+def clean_text(text):
+    """Clean Wikipedia text"""
+    return re.sub(r'\[.*?\]|\{.*?\}|\<.*?\>', '', text).strip()
+
+def generate_question(topic):
+    """Generate a question about a topic"""
+    question_types = [
+        f"What is {topic}?",
+        f"How does {topic} work?",
+        f"Why is {topic} important?",
+        f"Who discovered {topic}?",
+        f"What are the benefits of {topic}?",
+        f"How is {topic} used today?",
+        f"Why did {topic} become popular?",
+        f"Who contributed to {topic}?"
+    ]
+    return random.choice(question_types)
+
+def wikipedia_answer(content):
+    return f"According to Wikipedia under CC BY-SA 3.0:\n{content}"
+
+class ParagraphExtractor(HTMLParser):
+    """Collects cleaned <p> text while HTML is fed in chunks.
+
+    Builds no document tree, skips script/style content and sets ``done``
+    once MAX_LINES lines are collected, so the rest of the page need not
+    be parsed.
+    """
+
+    SKIP_TAGS = {'script', 'style'}
+
+    def __init__(self, max_lines=MAX_LINES, min_length=MIN_PARAGRAPH_LENGTH):
+        super().__init__(convert_charrefs=True)
+        self.max_lines = max_lines
+        self.min_length = min_length
+        self.paragraphs = []
+        self.line_count = 0
+        self.done = False
+        self._in_paragraph = False
+        self._skip_depth = 0
+        self._parts = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'p':
+            # <p> cannot nest; an unclosed one ends here
+            self._end_paragraph()
+            self._in_paragraph = True
+        elif tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'p':
+            self._end_paragraph()
+        elif tag in self.SKIP_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if self._in_paragraph and not self._skip_depth and not self.done:
+            self._parts.append(data)
+
+    def _end_paragraph(self):
+        if not self._in_paragraph:
+            return
+        self._in_paragraph = False
+        text = clean_text("".join(self._parts))
+        self._parts = []
+        if self.done or not text or len(text) <= self.min_length:
+            return
+        self.paragraphs.append(text)
+        self.line_count += text.count('\n') + 1
+        if self.line_count >= self.max_lines:
+            self.done = True
+
+    def close(self):
+        super().close()
+        self._end_paragraph()
+
+    def content(self):
+        """Paragraphs one per line, or None when nothing was found"""
+        return "".join(text + "\n" for text in self.paragraphs) or None
+
+def extract_paragraphs(html):
+    """Extract the content of a whole HTML document"""
+    extractor = ParagraphExtractor()
+    extractor.feed(html)
+    extractor.close()
+    return extractor.content()
+
+class ResponseCache:
+    """Validators and extracted content of fetched pages, keyed by URL.
+
+    Lets a page be revalidated with If-None-Match / If-Modified-Since;
+    on 304 Not Modified the stored content is reused without parsing.
+    """
+
+    def __init__(self, path=WIKIPEDIA_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content TEXT,
+                extractor_version INTEGER,
+                fetched_at REAL
+            )
+        ''')
+        self._conn.commit()
+
+    def get(self, url):
+        """Return (etag, last_modified, content) for a page extracted by this version, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT etag, last_modified, content FROM responses WHERE url = ? AND extractor_version = ?",
+                (url, EXTRACTOR_VERSION)
+            ).fetchone()
+        return row
+
+    def put(self, url, etag, last_modified, content):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (url, etag, last_modified, content, extractor_version, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, content, EXTRACTOR_VERSION, time.time())
+            )
+            self._conn.commit()
+
+    def touch(self, url):
+        with self._lock:
+            self._conn.execute("UPDATE responses SET fetched_at = ? WHERE url = ?", (time.time(), url))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class WikipediaIngestor:
+    """Fetches Wikipedia articles concurrently and saves them as Q&A rows.
+
+    Requests run on a private event loop thread over one pooled keep-alive
+    session, at most ``per_host_concurrency`` at a time. Pages are
+    revalidated against the response cache and parsed while they stream in.
+    """
+
+    def __init__(self, base_url=WIKIPEDIA_BASE_URL, cache_path=WIKIPEDIA_CACHE_PATH,
+                 per_host_concurrency=PER_HOST_CONCURRENCY, timeout=FETCH_TIMEOUT,
+                 max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY):
+        self.base_url = base_url
+        self.cache_path = cache_path
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.cache = None
+        self.stats = {"requests": 0, "fetched": 0, "not_modified": 0, "errors": 0, "retries": 0, "bytes": 0}
+        self._loop = None
+        self._session = None
+        self._lock = threading.Lock()
+
+    def url_for(self, topic):
+        return self.base_url + quote(topic.replace(' ', '_'), safe="_()',-.:")
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                if self.cache is None:
+                    self.cache = ResponseCache(self.cache_path)
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+            return self._loop
+
+    async def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit_per_host=self.per_host_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={'User-Agent': USER_AGENT},
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    async def fetch_async(self, topic):
+        """Content of one article, or None when it is missing; raises WikipediaFetchError on failure"""
+        url = self.url_for(topic)
+        cached = self.cache.get(url)
+        headers = {}
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        session = await self._get_session()
+        for attempt in range(self.max_retries):
+            try:
+                self.stats["requests"] += 1
+                async with session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached:
+                        self.stats["not_modified"] += 1
+                        self.cache.touch(url)
+                        return cached[2]
+                    if response.status == 404:
+                        return None
+                    if response.status == 429 or response.status >= 500:
+                        raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                          status=response.status, message=response.reason)
+                    response.raise_for_status()
+
+                    content = await self._extract(response)
+                    self.stats["fetched"] += 1
+                    self.cache.put(url, response.headers.get('ETag'), response.headers.get('Last-Modified'), content)
+                    return content
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt < self.max_retries - 1:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(self.retry_delay * 2 ** attempt)
+                else:
+                    self.stats["errors"] += 1
+                    raise WikipediaFetchError(
+                        f"Failed to fetch Wikipedia content after {self.max_retries} attempts: {e}") from e
+
+    async def _extract(self, response):
+        """Feed the body to the extractor chunk by chunk as it arrives"""
+        extractor = ParagraphExtractor()
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+            self.stats["bytes"] += len(chunk)
+            # Keep reading after the line limit so the connection can be reused
+            if not extractor.done:
+                extractor.feed(decoder.decode(chunk))
+        if not extractor.done:
+            extractor.feed(decoder.decode(b'', final=True))
+        extractor.close()
+        return extractor.content()
+
+    async def _fetch_or_error(self, topic):
+        try:
+            return await self.fetch_async(topic)
+        except WikipediaFetchError as e:
+            return e
+
+    async def fetch_results_async(self, topics):
+        topics = list(dict.fromkeys(topics))
+        contents = await asyncio.gather(*[self._fetch_or_error(topic) for topic in topics])
+        return dict(zip(topics, contents))
+
+    def fetch_results(self, topics):
+        """{topic: content, None when missing, or the WikipediaFetchError}, fetched concurrently"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(self.fetch_results_async(topics), loop).result()
+
+    def fetch_many(self, topics):
+        """{topic: content or None}; fetch failures are printed and mapped to None"""
+        contents = self.fetch_results(topics)
+        for topic, content in contents.items():
+            if isinstance(content, WikipediaFetchError):
+                print(f"Error fetching data for {topic}: {content}")
+                contents[topic] = None
+        return contents
+
+    def fetch(self, topic):
+        """Content of one article, or None when it is missing; raises WikipediaFetchError on failure"""
+        content = self.fetch_results([topic])[topic]
+        if isinstance(content, WikipediaFetchError):
+            raise content
+        return content
+
+    def ingest(self, topics, user="system", weight=0.6):
+        """Fetch topics and save one Q&A row per article with database.save_many"""
+        contents = self.fetch_results(topics)
+        rows = []
+        results = []
+        for topic, content in contents.items():
+            if isinstance(content, WikipediaFetchError):
+                results.append({"status": "error", "topic": topic, "reason": str(content)})
+                continue
+            if not content:
+                results.append({"status": "error", "topic": topic, "reason": "No content found"})
+                continue
+            question = generate_question(topic)
+            rows.append((question, wikipedia_answer(content), weight, "wikipedia"))
+            results.append({"status": "success", "topic": topic, "question": question})
+
+        if rows:
+            saved = database.save_many(rows, user)
+            # save_many commits chunks in order and stops at the first failing one
+            saved_questions = set(list(dict.fromkeys(row[0] for row in rows))[:saved])
+            for result in results:
+                if result["status"] == "success" and result["question"] not in saved_questions:
+                    result.update(status="error", reason="Failed to save data")
+        return results
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            if self._session is not None:
+                asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+                self._session = None
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+            self.cache.close()
+            self.cache = None
+
+# Create singleton instance
+wikipedia_ingestor = WikipediaIngestor()
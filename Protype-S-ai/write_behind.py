@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from collections import Counter
+
+# Journal of queued side effects; entries left by a crash are replayed on start
+WRITE_BEHIND_PATH = os.environ.get('WRITE_BEHIND_PATH', 'write_behind.db')
+
+# Set to 0 to run side effects on the request thread, as before the queue
+WRITE_BEHIND_ENABLED = os.environ.get('WRITE_BEHIND', '1') != '0'
+
+# Queued effects beyond which a request waits for the writer (backpressure)
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 1000))
+
+# Longest a request waits for room before it queues anyway (seconds)
+WRITE_BEHIND_BLOCK_SECONDS = float(os.environ.get('WRITE_BEHIND_BLOCK_SECONDS', 5))
+
+# Effects handed to a handler at once, and tries before one is parked as failed
+WRITE_BEHIND_BATCH_SIZE = 100
+WRITE_BEHIND_MAX_ATTEMPTS = 5
+
+class WriteBehindQueue:
+    """Durable queue of side effects run after the response, off the request thread.
+
+    An effect is a (kind, key, payload) journaled in SQLite before enqueue
+    returns, then run by a background thread with the other queued effects
+    of its kind: handler(payloads) gets them in enqueue order, so effects
+    with the same key (a question) apply in order. A batch is removed from
+    the journal once its handler returns; when it raises, the batch is
+    retried with backoff, so handlers must be idempotent. Effects still in
+    the journal at start, e.g. after a crash, run again once replay() is
+    called; effects of a kind with no handler registered wait in the journal.
+    """
+
+    def __init__(self, path=WRITE_BEHIND_PATH, max_pending=WRITE_BEHIND_MAX_PENDING,
+                 block_seconds=WRITE_BEHIND_BLOCK_SECONDS, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 max_attempts=WRITE_BEHIND_MAX_ATTEMPTS):
+        self.path = path
+        self.max_pending = max_pending
+        self.block_seconds = block_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.handlers = {}
+        self.stats = {"enqueued": 0, "processed": 0, "batches": 0, "retries": 0,
+                      "failed": 0, "replayed": 0, "waited": 0, "overflowed": 0}
+        self._conn = None
+        self._lock = threading.RLock()
+        self._changed = threading.Condition(self._lock)
+        # (kind, key) -> (journal id, payload) of the newest queued effect, for read-your-writes
+        self._latest = {}
+        # Queued effects by kind
+        self._queued = Counter()
+        self._worker = None
+        self._replaying = False
+        self._closed = False
+
+    @property
+    def _backlog(self):
+        return sum(self._queued.values())
+
+    def _runnable(self):
+        return sum(count for kind, count in self._queued.items() if kind in self.handlers)
+
+    def register(self, kind, handler):
+        """Run handler(payloads) for queued effects of kind; it raises to have them retried"""
+        with self._lock:
+            self.handlers[kind] = handler
+            if self._replaying and self._queued[kind]:
+                self._start_worker()
+            self._changed.notify_all()
+
+    def connection(self):
+        """Open the journal on first use and load the effects left in it; replay() runs them"""
+        with self._lock:
+            if self._conn is None:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+                # WAL with synchronous=NORMAL: a commit survives a crash of this process
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS side_effects (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        kind TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        payload TEXT NOT NULL,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        failed INTEGER NOT NULL DEFAULT 0
+                    )
+                ''')
+                self._conn.commit()
+                rows = self._conn.execute(
+                    "SELECT id, kind, key, payload FROM side_effects WHERE failed = 0 ORDER BY id").fetchall()
+                for row_id, kind, key, payload in rows:
+                    self._latest[kind, key] = (row_id, json.loads(payload))
+                    self._queued[kind] += 1
+                self.stats["replayed"] += len(rows)
+            return self._conn
+
+    def replay(self):
+        """Start running effects journaled before a crash; returns how many there are.
+        
+        Call it once the handlers are registered; kinds registered later run
+        as they are registered.
+        """
+        with self._lock:
+            self.connection()
+            self._replaying = True
+            if self._runnable():
+                self._start_worker()
+            return self._backlog
+
+    def _start_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._worker.start()
+
+    def enqueue(self, kind, key, payload):
+        """Journal an effect and return; waits first while the backlog is over max_pending"""
+        self.enqueue_many([(kind, key, payload)])
+
+    def enqueue_many(self, effects):
+        """Journal (kind, key, payload) effects in one transaction, in order"""
+        for kind, _, _ in effects:
+            if kind not in self.handlers:
+                raise ValueError(f"No handler for side effect: {kind}")
+        with self._lock:
+            conn = self.connection()
+            if self._backlog >= self.max_pending:
+                self.stats["waited"] += 1
+                self._start_worker()
+                deadline = time.monotonic() + self.block_seconds
+                while self._backlog >= self.max_pending and time.monotonic() < deadline:
+                    self._changed.wait(deadline - time.monotonic())
+                if self._backlog >= self.max_pending:
+                    # The journal is the bound now; nothing is dropped
+                    self.stats["overflowed"] += 1
+            for kind, key, payload in effects:
+                cursor = conn.execute("INSERT INTO side_effects (kind, key, payload) VALUES (?, ?, ?)",
+                                      (kind, key, json.dumps(payload)))
+                self._latest[kind, key] = (cursor.lastrowid, payload)
+                self._queued[kind] += 1
+            conn.commit()
+            self.stats["enqueued"] += len(effects)
+            self._start_worker()
+            self._changed.notify_all()
+
+    def pending(self, kind, key):
+        """Payload of the newest effect of kind still queued for key, or None"""
+        with self._lock:
+            # Journaled effects count from the start, before replay() runs them
+            self.connection()
+            latest = self._latest.get((kind, key))
+            return latest[1] if latest else None
+
+    def _next_batch(self):
+        with self._lock:
+            # Effects of kinds without a handler stay queued
+            while not self._runnable():
+                if self._closed:
+                    return None
+                self._changed.wait()
+            kinds = [kind for kind in self._queued if self._queued[kind] and kind in self.handlers]
+            rows = self.connection().execute(
+                f"SELECT id, kind, key, payload, attempts FROM side_effects WHERE failed = 0 "
+                f"AND kind IN ({','.join('?' * len(kinds))}) ORDER BY id LIMIT ?",
+                kinds + [self.batch_size]
+            ).fetchall()
+        # One kind per batch, up to the first effect of another kind, so order is kept
+        batch = [rows[0]]
+        for row in rows[1:]:
+            if row[1] != batch[0][1]:
+                break
+            batch.append(row)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            kind = batch[0][1]
+            ids = [row[0] for row in batch]
+            try:
+                self.handlers[kind]([json.loads(row[3]) for row in batch])
+            except Exception as e:
+                print(f"Error running {kind} side effects: {e}")
+                self._retry(kind, ids)
+                time.sleep(min(0.1 * 2 ** batch[0][4], 5))
+                continue
+            self._done(kind, ids, ids)
+
+    def _retry(self, kind, ids):
+        """Count a failed attempt; effects out of attempts are parked with failed = 1"""
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            conn = self.connection()
+            conn.execute(f"UPDATE side_effects SET attempts = attempts + 1, failed = attempts + 1 >= ? "
+                         f"WHERE id IN ({marks})", [self.max_attempts] + ids)
+            parked = [row_id for (row_id,) in conn.execute(
+                f"SELECT id FROM side_effects WHERE failed = 1 AND id IN ({marks})", ids)]
+            conn.commit()
+            self.stats["retries"] += 1
+            self.stats["failed"] += len(parked)
+            self._done(kind, parked)
+
+    def _done(self, kind, ids, delete=()):
+        """Take effects off the backlog, deleting the ones that ran from the journal"""
+        with self._lock:
+            if delete:
+                conn = self.connection()
+                conn.execute(f"DELETE FROM side_effects WHERE id IN ({','.join('?' * len(delete))})", list(delete))
+                conn.commit()
+                self.stats["processed"] += len(delete)
+                self.stats["batches"] += 1
+            done = set(ids)
+            self._queued[kind] -= len(done)
+            for entry in [entry for entry, (row_id, _) in self._latest.items() if row_id in done]:
+                del self._latest[entry]
+            self._changed.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every queued effect with a handler has run or failed; returns False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            if self._runnable():
+                self._start_worker()
+            while self._runnable():
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._changed.wait(remaining)
+            return True
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, queued=self._backlog, unhandled=self._backlog - self._runnable())
+
+    def close(self, timeout=None):
+        """Run what is queued (up to timeout) and stop the writer; the rest stays journaled"""
+        self.flush(timeout)
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+            worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+        with self._lock:
+            if self._conn is not None and not (worker and worker.is_alive()):
+                self._conn.close()
+                self._conn = None
+
+# Create singleton instance
+write_behind = WriteBehindQueue()
+
+# Give queued effects a few seconds at exit; what is left is replayed on the next start
+atexit.register(write_behind.close, timeout=WRITE_BEHIND_BLOCK_SECONDS)